@@ -0,0 +1,210 @@
+# backend/activity.py
+# Bitmaps diários de usuários ativos (DAU/WAU/MAU e janelas de N dias sem COUNT(DISTINCT)).
+#
+# Para cada dia existe um bitmap "empacotado" (np.packbits, bitorder little): o bit N é 1 se
+# o usuário de id N teve atividade (consumers.user_time) naquele dia. ~125 KB por dia para
+# 1 milhão de usuários.
+#   - Usuários ativos em uma janela = popcount do OR dos bitmaps dos dias da janela.
+#   - Stickiness (DAU/MAU) dia a dia = janela deslizante com um contador por usuário.
+#
+# Os bitmaps ficam em memória e são persistidos em bi.daily_active_bitmap (ver rollups.sql).
+# O refresh é incremental como o dos rollups: reprocessa só a partir do watermark
+# (o dia do watermark é refeito, pois estava incompleto). No startup, os dias já
+# persistidos são carregados do banco em vez de recalculados.
+#
+# Uso manual:
+#   python backend/activity.py          -> incremental
+#   python backend/activity.py --full   -> recalcula tudo
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+import database
+
+WATERMARK_NAME = "activity_bitmap"
+FULL_REFRESH_START = date(1900, 1, 1)
+
+# Endpoints que leem dos bitmaps (o cache deles é invalidado após cada refresh).
+# O cache compara por caminho inteiro (cache.matches), então cada rota é listada.
+ENDPOINTS_ACTIVITY = ["/bi/active_users", "/bi/stickiness", "/bi/retention_d1_d7_d30", "/bi/retention/cohorts"]
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_LOAD = "SELECT day, bitmap FROM bi.daily_active_bitmap WHERE day < :start_day"
+
+SQL_ACTIVE_BY_DAY = """
+    SELECT DATE(created_at) as day, array_agg(DISTINCT user_id) as user_ids
+    FROM consumers.user_time
+    WHERE created_at >= :start_ts
+      AND user_id IS NOT NULL
+    GROUP BY day
+"""
+
+SQL_DELETE = "DELETE FROM bi.daily_active_bitmap WHERE day >= :start_day"
+
+SQL_INSERT = """
+    INSERT INTO bi.daily_active_bitmap (day, bitmap, active_users, refreshed_at)
+    VALUES (:day, :bitmap, :active_users, CURRENT_TIMESTAMP)
+    ON CONFLICT (day) DO UPDATE
+    SET bitmap = EXCLUDED.bitmap, active_users = EXCLUDED.active_users, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+
+def to_bitmap(user_ids):
+    """ Lista de ids -> bitmap empacotado (uint8). """
+    ids = np.asarray(user_ids, dtype=np.int64)
+    if ids.size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    bits = np.zeros(int(ids.max()) + 1, dtype=bool)
+    bits[ids] = True
+    return np.packbits(bits, bitorder="little")
+
+
+def popcount(bitmap):
+    return int(np.bitwise_count(bitmap).sum())
+
+
+def union(bitmaps):
+    """ OR de bitmaps de tamanhos diferentes (o tamanho cresce com o maior id). """
+    bitmaps = list(bitmaps)
+    result = np.zeros(max((len(b) for b in bitmaps), default=0), dtype=np.uint8)
+    for bitmap in bitmaps:
+        result[:len(bitmap)] |= bitmap
+    return result
+
+
+class ActivityBitmaps:
+    def __init__(self):
+        self.days = {}          # dia -> bitmap
+        self.watermark = None   # último dia processado (None = ainda não carregado)
+        self._lock = asyncio.Lock()
+
+    def _range(self, start, end):
+        return [self.days[d] for d in days_between(start, end) if d in self.days]
+
+    def active_users(self, start, end):
+        """ Usuários distintos com atividade entre 'start' e 'end' (inclusive). """
+        return popcount(union(self._range(start, end)))
+
+    def daily(self, start, end):
+        """ [(dia, DAU)] entre 'start' e 'end'. """
+        return [(d, popcount(self.days[d]) if d in self.days else 0) for d in days_between(start, end)]
+
+    def stickiness(self, start, end, window):
+        """
+        [(dia, DAU, usuários ativos nos 'window' dias terminando no dia)] entre 'start' e 'end'.
+        Janela deslizante: um contador por usuário soma o dia que entra e subtrai o que sai.
+        Só sai da janela o que entrou nela (dias >= 'first'), então todo bitmap usado está
+        em 'bitmaps' e 'width' cobre todos.
+        """
+        first = start - timedelta(days=window - 1)
+        bitmaps = self._range(first, end)
+        width = max((len(b) for b in bitmaps), default=0) * 8
+        counts = np.zeros(width, dtype=np.int32)
+
+        def unpacked(day):
+            bitmap = self.days.get(day)
+            if bitmap is None:
+                return None
+            return np.unpackbits(bitmap, bitorder="little")
+
+        result = []
+        for day in days_between(first, end):
+            entering = unpacked(day)
+            if entering is not None:
+                counts[:len(entering)] += entering
+            leaving_day = day - timedelta(days=window)
+            leaving = unpacked(leaving_day) if leaving_day >= first else None
+            if leaving is not None:
+                counts[:len(leaving)] -= leaving
+            if day >= start:
+                dau = int(entering.sum()) if entering is not None else 0
+                result.append((day, dau, int(np.count_nonzero(counts))))
+        return result
+
+    async def ready(self):
+        """ Garante que os bitmaps foram carregados (o primeiro endpoint a chegar dispara o refresh). """
+        if self.watermark is None:
+            await self.refresh()
+
+    async def refresh(self, full=False):
+        """
+        Carrega os dias já persistidos (primeira vez) e recalcula a partir do watermark.
+        Tudo em uma transação; a troca em memória acontece só no final.
+        Retorna o dia inicial reprocessado.
+        """
+        async with self._lock:
+            async with database.engine.begin() as conn:
+                start_day = None
+                if not full:
+                    start_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": WATERMARK_NAME})).scalar()
+                if start_day is None:
+                    start_day = FULL_REFRESH_START
+                if self.watermark is not None:
+                    # Outro worker pode ter avançado o watermark: refaz também os dias desde o nosso
+                    start_day = min(start_day, self.watermark)
+
+                previous = self.days
+                if self.watermark is None:
+                    previous = {}
+                    for day, bitmap in (await conn.execute(text(SQL_LOAD), {"start_day": start_day})).fetchall():
+                        previous[day] = np.frombuffer(bytes(bitmap), dtype=np.uint8)
+
+                start_ts = datetime.combine(start_day, time.min)
+                fresh = {}
+                for day, user_ids in (await conn.execute(text(SQL_ACTIVE_BY_DAY), {"start_ts": start_ts})).fetchall():
+                    fresh[day] = to_bitmap(user_ids)
+
+                await conn.execute(text(SQL_DELETE), {"start_day": start_day})
+                if fresh:
+                    await conn.execute(text(SQL_INSERT), [
+                        {"day": day, "bitmap": bitmap.tobytes(), "active_users": popcount(bitmap)}
+                        for day, bitmap in fresh.items()
+                    ])
+                today = date.today()
+                await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": today})
+
+            days = {d: b for d, b in previous.items() if d < start_day}
+            days.update(fresh)
+            self.days = days
+            self.watermark = today
+            return start_day
+
+
+def days_between(start, end):
+    """ Todos os dias de 'start' a 'end' (inclusive). """
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+activity_bitmaps = ActivityBitmaps()
+
+
+async def _main(full):
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        start_day = await activity_bitmaps.refresh(full=full)
+        print(f"Bitmaps de atividade atualizados a partir de {start_day} ({len(activity_bitmaps.days)} dias).")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atualiza os bitmaps diários de usuários ativos (bi.daily_active_bitmap).")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
@@ -0,0 +1,271 @@
+# backend/b2b_store.py
+# KPIs de todos os clientes B2B em memória, por client_id (engajamento, custo por ativo,
+# variação do MEV Score e participação em campanhas).
+#
+# Em vez de cada endpoint refazer "colaboradores do cliente JOIN tabela fato", o store
+# guarda os fatos POR USUÁRIO (arrays NumPy indexados pelo user_id) e agrega por cliente
+# de uma vez, com np.bincount sobre os pares (cliente, colaborador):
+#   - Receita PAID por usuário: o store guarda cada pagamento (usuário e valor se PAID, indexados
+#     pelo id do pagamento) e relê só os com updated_at >= (maior já lido - B2B_STORE_OVERLAP_SECONDS).
+#     Pagamento que vira PAID depois (ou deixa de ser PAID: estorno, cancelamento) entra pela
+#     mudança dele. A cada B2B_STORE_FULL_RELOAD_SECONDS tudo é relido (pega pagamentos apagados).
+#     REQUER a migração V010 (trigger que atualiza payment.updated_at em todo UPDATE): sem ela
+#     uma mudança de status só aparece na releitura completa.
+#   - Ativos em 30 dias: OR dos bitmaps diários do activity.py (nada de user_time aqui).
+#   - MEV Scores: só as linhas novas (id > último id lido); ficam as dos últimos 35 dias.
+#   - Participações em campanhas: só as linhas novas (id > último id lido), contadas por campanha.
+# Os pares (cliente, colaborador), os clientes e as campanhas são relidos a cada refresh (tabelas pequenas).
+#
+# Variáveis de ambiente:
+#   B2B_STORE_REFRESH_SECONDS       -> intervalo do refresh (padrão 60, lido no main.py)
+#   B2B_STORE_OVERLAP_SECONDS       -> margem do updated_at no incremental da receita (padrão 300)
+#   B2B_STORE_FULL_RELOAD_SECONDS   -> intervalo da releitura completa da receita (padrão 3600)
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from activity import activity_bitmaps, days_between, union
+from database import fetch_all
+
+B2B_STORE_OVERLAP_SECONDS = int(os.getenv("B2B_STORE_OVERLAP_SECONDS", "300"))
+B2B_STORE_FULL_RELOAD_SECONDS = int(os.getenv("B2B_STORE_FULL_RELOAD_SECONDS", "3600"))
+
+ACTIVE_WINDOW_DAYS = 30
+MEV_WINDOW_DAYS = 35
+EPOCH = date(1970, 1, 1)
+
+# Endpoints que leem do store (o cache deles é invalidado após cada refresh)
+ENDPOINTS_B2B = [
+    "/bi/b2b/engagement_stats", "/bi/b2b/cost_per_collaborator", "/bi/b2b/campaign_participation",
+    "/bi/b2b/mev_score_variation", "/bi/b2b/clients_kpis",
+]
+
+# KPIs de um cliente sem colaboradores/dados (ou inexistente)
+EMPTY_CLIENT = {
+    "total_colaboradores": 0, "total_ativos_30d": 0, "taxa_adesao_pct": 0,
+    "total_revenue_cliente": 0.0, "custo_por_colaborador_ativo": 0.0,
+    "old_score": 0, "new_score": 0, "campanhas": {"labels": [], "values": []},
+}
+
+SQL_CLIENTS = "SELECT id, name, active FROM companies.companies_client"
+
+SQL_COLLABORATORS = """
+    SELECT client_id, user_id
+    FROM companies.companies_client_collaborator
+    WHERE client_id IS NOT NULL AND user_id IS NOT NULL
+"""
+
+SQL_CAMPAIGNS = "SELECT id, client_id, name FROM companies.campaigns WHERE client_id IS NOT NULL"
+
+# Estado atual de cada pagamento ("{where}" = filtro do incremental); valor 0 se não está PAID
+SQL_PAYMENTS = """
+    SELECT p.id, s.user_id, CASE WHEN p.status = 'PAID' THEN p.amount_due ELSE 0 END, p.updated_at
+    FROM consumers.payment p
+    LEFT JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
+    {where}
+"""
+
+WHERE_SINCE = "WHERE p.updated_at >= :since"
+
+SQL_MEV = """
+    SELECT id, user_id, calculated_at, score
+    FROM consumers.user_mev_score
+    WHERE id > :last_id
+      AND calculated_at >= :start
+    ORDER BY id
+"""
+
+SQL_PARTICIPATION = """
+    SELECT id, campaign_id
+    FROM companies.user_campaign_participation
+    WHERE id > :last_id
+    ORDER BY id
+"""
+
+
+def _grow(array, size, fill=0):
+    """ Aumenta o array (indexado por id) até 'size' posições. """
+    if size <= len(array):
+        return array
+    grown = np.full(size, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _per_user_sum(users, values, size):
+    """ Soma de 'values' por usuário, num array de 'size' posições. """
+    return np.bincount(users, weights=values, minlength=size)[:size] if len(users) else np.zeros(size)
+
+
+class ClientStore:
+    def __init__(self, activity):
+        self.activity = activity
+        self.payment_user = np.zeros(0, np.int64)  # payment_id -> user_id (-1 = sem usuário)
+        self.payment_paid = np.zeros(0)            # payment_id -> valor, se PAID (senão 0)
+        self.payments_since = None                 # maior updated_at lido (None = nada carregado)
+        self.payments_reloaded_at = None           # última releitura completa
+        self.mev = {"id": 0, "user": np.zeros(0, np.int64), "day": np.zeros(0, np.int64), "score": np.zeros(0)}
+        self.participants = {}              # campaign_id -> participantes
+        self.last_participation_id = 0
+        self.clients = {}                   # client_id -> KPIs
+        self.refreshed_at = None
+        self._lock = asyncio.Lock()
+
+    # --- Entradas incrementais ---
+
+    async def _load_payments(self, now):
+        """ Pagamentos novos/alterados desde o último refresh (todos, na releitura completa). """
+        reload_every = timedelta(seconds=B2B_STORE_FULL_RELOAD_SECONDS)
+        if self.payments_reloaded_at is None or now - self.payments_reloaded_at >= reload_every:
+            self.payment_user, self.payment_paid = np.zeros(0, np.int64), np.zeros(0)
+            self.payments_since, self.payments_reloaded_at = None, now
+        if self.payments_since is None:
+            rows = await fetch_all(SQL_PAYMENTS.format(where=""))
+        else:
+            since = self.payments_since - timedelta(seconds=B2B_STORE_OVERLAP_SECONDS)
+            rows = await fetch_all(SQL_PAYMENTS.format(where=WHERE_SINCE), {"since": since})
+        if not rows:
+            return
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        size = int(ids.max()) + 1
+        self.payment_user = _grow(self.payment_user, size, fill=-1)
+        self.payment_paid = _grow(self.payment_paid, size)
+        self.payment_user[ids] = [-1 if r[1] is None else r[1] for r in rows]
+        self.payment_paid[ids] = [float(r[2]) for r in rows]
+        latest = max((r[3] for r in rows if r[3] is not None), default=None)
+        if latest is not None and (self.payments_since is None or latest > self.payments_since):
+            self.payments_since = latest
+
+    def _revenue(self):
+        """ user_id -> receita PAID atual (soma dos pagamentos do usuário). """
+        has_user = self.payment_user >= 0
+        users = self.payment_user[has_user]
+        size = int(users.max()) + 1 if len(users) else 0
+        return _per_user_sum(users, self.payment_paid[has_user], size)
+
+    async def _load_mev(self, today):
+        """ MEV Scores novos; descarta os que saíram da janela de 35 dias. """
+        start = today - timedelta(days=MEV_WINDOW_DAYS)
+        rows = await fetch_all(SQL_MEV, {"last_id": self.mev["id"], "start": start})
+        mev = self.mev
+        if rows:
+            mev = {
+                "id": rows[-1][0],
+                "user": np.concatenate([mev["user"], np.array([r[1] for r in rows], dtype=np.int64)]),
+                "day": np.concatenate([mev["day"], np.array([(r[2] - EPOCH).days for r in rows], dtype=np.int64)]),
+                "score": np.concatenate([mev["score"], np.array([float(r[3]) for r in rows])]),
+            }
+        keep = mev["day"] >= (start - EPOCH).days
+        self.mev = {"id": mev["id"], "user": mev["user"][keep], "day": mev["day"][keep], "score": mev["score"][keep]}
+
+    async def _load_participations(self):
+        rows = await fetch_all(SQL_PARTICIPATION, {"last_id": self.last_participation_id})
+        for _, campaign_id in rows:
+            self.participants[campaign_id] = self.participants.get(campaign_id, 0) + 1
+        if rows:
+            self.last_participation_id = rows[-1][0]
+
+    # --- Agregação por cliente ---
+
+    def _active(self, today, size):
+        """ user_id -> ativo nos últimos 30 dias (mesma janela de "CURRENT_DATE - 30 dias"). """
+        first = today - timedelta(days=ACTIVE_WINDOW_DAYS)
+        bitmaps = [self.activity.days[d] for d in days_between(first, today) if d in self.activity.days]
+        bits = np.unpackbits(union(bitmaps), bitorder="little")[:size]
+        return _grow(bits, size).astype(bool)
+
+    def _mev_first_last(self, size):
+        """ (score mais antigo, score mais recente) de cada usuário na janela; NaN = sem score. """
+        oldest, newest = np.full(size, np.nan), np.full(size, np.nan)
+        mev = self.mev
+        if len(mev["user"]):
+            order = np.lexsort((mev["day"], mev["user"]))
+            users, scores = mev["user"][order], mev["score"][order]
+            starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+            ends = np.r_[starts[1:], len(users)] - 1
+            ok = users[starts] < size
+            oldest[users[starts][ok]] = scores[starts][ok]
+            newest[users[ends][ok]] = scores[ends][ok]
+        return oldest, newest
+
+    def _aggregate(self, today, clients, pairs, campaigns):
+        pair_clients = np.array([p[0] for p in pairs], dtype=np.int64)
+        pair_users = np.array([p[1] for p in pairs], dtype=np.int64)
+        revenue = self._revenue()
+        size = max(len(revenue), int(pair_users.max()) + 1 if len(pair_users) else 0)
+        n_clients = max([int(pair_clients.max()) + 1 if len(pair_clients) else 0] + [c + 1 for c in clients])
+
+        revenue = _grow(revenue, size)
+        active = self._active(today, size)
+        oldest, newest = self._mev_first_last(size)
+
+        def per_client(values):
+            return np.bincount(pair_clients, weights=values[pair_users], minlength=n_clients)
+
+        collaborators = np.bincount(pair_clients, minlength=n_clients)
+        actives = per_client(active.astype(np.float64))
+        revenues = per_client(revenue)
+        has_old, has_new = ~np.isnan(oldest), ~np.isnan(newest)
+        old_sum, old_n = per_client(np.where(has_old, oldest, 0)), per_client(has_old.astype(np.float64))
+        new_sum, new_n = per_client(np.where(has_new, newest, 0)), per_client(has_new.astype(np.float64))
+
+        by_campaign = {}
+        for campaign_id, client_id, name in campaigns:
+            totals = by_campaign.setdefault(client_id, {})
+            totals[name] = totals.get(name, 0) + self.participants.get(campaign_id, 0)
+
+        result = {}
+        for client_id, (name, active_flag) in clients.items():
+            total, ativos = int(collaborators[client_id]), int(actives[client_id])
+            campanhas = sorted(by_campaign.get(client_id, {}).items(), key=lambda item: -item[1])
+            result[client_id] = {
+                "client_id": client_id,
+                "name": name,
+                "active": active_flag,
+                "total_colaboradores": total,
+                "total_ativos_30d": ativos,
+                "taxa_adesao_pct": (ativos / total * 100) if total > 0 else 0,
+                "total_revenue_cliente": float(revenues[client_id]),
+                "custo_por_colaborador_ativo": float(revenues[client_id] / ativos) if ativos > 0 else 0.0,
+                "old_score": round(float(old_sum[client_id] / old_n[client_id]), 1) if old_n[client_id] else 0,
+                "new_score": round(float(new_sum[client_id] / new_n[client_id]), 1) if new_n[client_id] else 0,
+                "campanhas": {"labels": [c[0] for c in campanhas], "values": [c[1] for c in campanhas]},
+            }
+        return result
+
+    # --- Refresh / consulta ---
+
+    async def ready(self):
+        """ Garante que o store foi carregado (o primeiro endpoint a chegar dispara o refresh). """
+        if self.refreshed_at is None:
+            await self.refresh()
+
+    async def refresh(self):
+        """ Lê só o que chegou desde o último refresh e recalcula os KPIs de todos os clientes. """
+        async with self._lock:
+            await self.activity.ready()
+            now = datetime.now()
+            today = now.date()
+            await self._load_payments(now)
+            await self._load_mev(today)
+            await self._load_participations()
+            clients = {r[0]: (r[1], r[2]) for r in await fetch_all(SQL_CLIENTS)}
+            pairs = await fetch_all(SQL_COLLABORATORS)
+            campaigns = await fetch_all(SQL_CAMPAIGNS)
+            self.clients = await asyncio.to_thread(self._aggregate, today, clients, pairs, campaigns)
+            self.refreshed_at = now
+            return len(self.clients)
+
+    async def client(self, client_id):
+        """ KPIs de um cliente (EMPTY_CLIENT se o cliente não existe). """
+        await self.ready()
+        return self.clients.get(client_id, EMPTY_CLIENT)
+
+    async def all_clients(self):
+        await self.ready()
+        return list(self.clients.values())
+
+
+client_store = ClientStore(activity_bitmaps)
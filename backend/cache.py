@@ -0,0 +1,180 @@
+# backend/cache.py
+# Cache de respostas dos KPIs, dentro do processo do backend.
+#
+# - Chave: caminho do endpoint + parâmetros da query (partner_id, client_id, days, group_by...)
+# - TTL por endpoint (TTL_POR_ENDPOINT), com padrão configurável no .env
+# - Despejo LRU quando passa de CACHE_MAX_ENTRIES
+# - "Single-flight": N requisições idênticas simultâneas disparam UMA query
+# - Invalidação por prefixo de caminho (ex: "/bi/partner" limpa todos os KPIs de parceiro,
+#   "/bi/user/profile" não pega "/bi/user/profiles")
+#
+# Variáveis do .env:
+#   CACHE_ENABLED      -> true/false (padrão true)
+#   CACHE_MAX_ENTRIES  -> máximo de respostas guardadas (padrão 2048)
+#   CACHE_TTL_DEFAULT  -> TTL em segundos para endpoints sem TTL próprio (padrão 60)
+import asyncio
+import functools
+import os
+import time
+from collections import OrderedDict
+from enum import Enum
+from urllib.parse import urlencode
+
+
+# TTL (segundos) de cada endpoint. Listas de filtros mudam pouco; KPIs, a cada minuto.
+TTL_POR_ENDPOINT = {
+    "/bi/partners_list": 600,
+    "/bi/b2b/clients_list": 600,
+    "/bi/user/list": 600,
+    "/bi/user/search": 60,
+    "/bi/kpi_overview": 120,
+    "/bi/ltv_cac": 300,
+    "/bi/conversion_funnel": 120,
+    "/bi/funnel": 300,
+    "/bi/revenue_by_region": 300,
+    "/bi/new_users_over_time": 300,
+    "/bi/retention_d1_d7_d30": 300,
+    "/bi/retention/cohorts": 300,
+    "/bi/stickiness": 300,
+    "/bi/gamification/missions": 120,
+    "/bi/gamification/streaks": 120,
+    "/bi/user/streak": 120,
+}
+
+
+class KPICache:
+    def __init__(self, max_entries=2048, default_ttl=60, enabled=True):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()  # chave -> (expira_em, valor)
+        self._inflight = {}            # chave -> asyncio.Future da query em andamento
+        self._stale = set()            # chaves invalidadas com a query em andamento
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.on_event = None           # callback(chave, resultado) para métricas (ver metrics.py)
+
+    def _notify(self, key, result):
+        if self.on_event is not None:
+            self.on_event(key, result)
+
+    def ttl_for(self, path):
+        return TTL_POR_ENDPOINT.get(path, self.default_ttl)
+
+    async def get_or_compute(self, key, ttl, compute):
+        """
+        Retorna o valor em cache para 'key' ou executa 'compute()' (corrotina).
+        Se já existe uma execução em andamento para a mesma chave, aguarda o
+        resultado dela em vez de disparar outra query.
+        """
+        if not self.enabled:
+            self._notify(key, "bypass")
+            return await compute()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._notify(key, "hit")
+                return entry[1]
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            self._notify(key, "coalesced")
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        self._notify(key, "miss")
+        self._stale.discard(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # marca como lida (evita warning se ninguém estava esperando)
+            raise
+        else:
+            # Se houve invalidação durante a query, o resultado pode estar velho: não guarda.
+            if key not in self._stale:
+                self._store(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+            self._stale.discard(key)
+
+    def _store(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, prefix=""):
+        """
+        Remove as entradas de 'prefix': a própria chave, ela com parâmetros ("prefix?...") e os
+        endpoints abaixo dela ("prefix/..."). Queries em andamento dessas chaves não são guardadas.
+        Retorna quantas entradas saíram.
+        """
+        self._stale.update(k for k in self._inflight if matches(k, prefix))
+        keys = [k for k in self._entries if matches(k, prefix)]
+        for k in keys:
+            del self._entries[k]
+        return len(keys)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+def matches(key, prefix):
+    """ A chave pertence a 'prefix'? Compara por caminho inteiro ("/bi/user/profile" != "/bi/user/profiles"). """
+    prefix = prefix.rstrip("/")
+    return not prefix or key == prefix or key.startswith(prefix + "?") or key.startswith(prefix + "/")
+
+
+def make_key(path, params):
+    """ Monta a chave "caminho?param=valor&..." com os parâmetros ordenados (None é ignorado). """
+    items = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        if isinstance(value, Enum):
+            value = value.value
+        items.append((name, value))
+    return f"{path}?{urlencode(items)}" if items else path
+
+
+kpi_cache = KPICache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "2048")),
+    default_ttl=int(os.getenv("CACHE_TTL_DEFAULT", "60")),
+    enabled=os.getenv("CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+)
+
+
+def cached(path):
+    """
+    Decorator para endpoints async: guarda a resposta em kpi_cache
+    usando o caminho + os parâmetros recebidos como chave.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(path, kwargs)
+            return await kpi_cache.get_or_compute(key, kpi_cache.ttl_for(path), lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,352 @@
+# backend/cdc.py
+# Feed de mudanças (CDC) das tabelas fato para os agregados incrementais.
+#
+# A migração V007 grava cada INSERT/UPDATE/DELETE de user_time, payment, user_scheduling e
+# web_events em bi.change_log e faz pg_notify('bi_changes', tabela). Aqui, cada agregado se
+# registra com as tabelas que lê e duas funções:
+#   - apply(conn, changes): aplica um lote de mudanças (delta) na transação 'conn'.
+#   - bootstrap(conn): recalcula o agregado do zero (primeira vez ou --full).
+# O offset do consumidor (bi.cdc_offset) é gravado na MESMA transação do apply: se algo
+# falha, nem o delta nem o offset são gravados, e o lote é reaplicado depois (exatamente uma vez).
+#
+# Snapshots vão e voltam do Python como texto ("xmin:xmax:xip,..."): os parâmetros são
+# ligados como text e convertidos no SQL (o codec pg_snapshot do asyncpg não aceita str).
+#
+# Offsets por snapshot: o consumidor guarda o pg_snapshot até onde já aplicou (done_snapshot).
+# Cada rodada fixa um snapshot novo (target_snapshot) e lê, em lotes por id, as mudanças
+# visíveis no novo e não no antigo. O id (last_id) é a marca d'água dentro da janela,
+# e last_changed_at mostra o atraso. O bootstrap roda em REPEATABLE READ e grava o snapshot
+# da própria leitura, então nenhuma mudança é contada no recálculo e de novo no delta.
+#
+# Variáveis de ambiente:
+#   CDC_ENABLED          -> liga o feed (padrão true; sem a migração V007 ele fica desligado)
+#   CDC_BATCH_ROWS       -> mudanças por lote (padrão 5000)
+#   CDC_POLL_SECONDS     -> leitura periódica, mesmo sem notificação (padrão 30)
+#   CDC_DEBOUNCE_SECONDS -> espera para agrupar notificações (padrão 1)
+#   CDC_RETENTION_HOURS  -> mudanças mais velhas que isso são apagadas mesmo sem consumo (padrão 72)
+#
+# Uso manual:
+#   python backend/cdc.py             -> aplica o que estiver pendente e sai
+#   python backend/cdc.py --status    -> posição e pendências de cada consumidor
+import asyncio
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+import database
+
+CHANNEL = "bi_changes"
+SOURCES = ["user_time", "payment", "user_scheduling", "web_events"]
+
+CDC_ENABLED = os.getenv("CDC_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+CDC_BATCH_ROWS = int(os.getenv("CDC_BATCH_ROWS", "5000"))
+CDC_POLL_SECONDS = float(os.getenv("CDC_POLL_SECONDS", "30"))
+CDC_DEBOUNCE_SECONDS = float(os.getenv("CDC_DEBOUNCE_SECONDS", "1"))
+CDC_RETENTION_HOURS = int(os.getenv("CDC_RETENTION_HOURS", "72"))
+
+SQL_INSTALLED = "SELECT to_regclass('bi.change_log') IS NOT NULL AND to_regclass('bi.cdc_offset') IS NOT NULL"
+
+SQL_OFFSET_LOCK = """
+    SELECT done_snapshot::text, target_snapshot::text, last_id
+    FROM bi.cdc_offset
+    WHERE consumer = :consumer
+    FOR UPDATE
+"""
+
+SQL_OFFSET_EXISTS = "SELECT 1 FROM bi.cdc_offset WHERE consumer = :consumer"
+
+SQL_OFFSET_DELETE = "DELETE FROM bi.cdc_offset WHERE consumer = :consumer"
+
+SQL_SNAPSHOT = "SELECT pg_current_snapshot()::text"
+
+SQL_OFFSET_RESET = """
+    INSERT INTO bi.cdc_offset (consumer, sources, done_snapshot, target_snapshot, last_id, updated_at)
+    VALUES (:consumer, :sources, CAST(CAST(:snapshot AS text) AS pg_snapshot), NULL, 0, CURRENT_TIMESTAMP)
+    ON CONFLICT (consumer) DO UPDATE
+    SET sources = EXCLUDED.sources, done_snapshot = EXCLUDED.done_snapshot,
+        target_snapshot = NULL, last_id = 0, updated_at = EXCLUDED.updated_at;
+"""
+
+SQL_OFFSET_SAVE = """
+    UPDATE bi.cdc_offset
+    SET done_snapshot = CAST(CAST(:done AS text) AS pg_snapshot),
+        target_snapshot = CAST(CAST(:target AS text) AS pg_snapshot),
+        last_id = :last_id,
+        last_changed_at = COALESCE(:last_changed_at, last_changed_at),
+        applied_rows = applied_rows + :applied,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE consumer = :consumer
+"""
+
+# Mudanças confirmadas entre os dois snapshots (txid >= xmin do antigo: as anteriores já eram visíveis)
+SQL_CHANGES = """
+    SELECT id, source, op, row_id, old_row, new_row, changed_at
+    FROM bi.change_log
+    WHERE source = ANY(:sources)
+      AND id > :last_id
+      AND txid >= pg_snapshot_xmin(CAST(CAST(:done AS text) AS pg_snapshot))
+      AND NOT pg_visible_in_snapshot(txid, CAST(CAST(:done AS text) AS pg_snapshot))
+      AND pg_visible_in_snapshot(txid, CAST(CAST(:target AS text) AS pg_snapshot))
+    ORDER BY id
+    LIMIT :limit
+"""
+
+# Apaga o que todos os consumidores da tabela já aplicaram (ou tudo, se ninguém lê a tabela)
+SQL_PRUNE = """
+    DELETE FROM bi.change_log
+    WHERE source = :source
+      AND txid < COALESCE(
+          (SELECT MIN(pg_snapshot_xmin(done_snapshot)) FROM bi.cdc_offset WHERE :source = ANY(sources)),
+          pg_snapshot_xmin(pg_current_snapshot())
+      )
+"""
+
+SQL_PRUNE_RETENTION = "DELETE FROM bi.change_log WHERE changed_at < CURRENT_TIMESTAMP - make_interval(hours => :hours)"
+
+SQL_STATUS = """
+    SELECT
+        o.consumer, o.sources, o.last_changed_at, o.applied_rows, o.updated_at,
+        (SELECT COUNT(*) FROM bi.change_log c
+         WHERE c.source = ANY(o.sources)
+           AND c.txid >= pg_snapshot_xmin(o.done_snapshot)
+           AND NOT pg_visible_in_snapshot(c.txid, o.done_snapshot)) as pending
+    FROM bi.cdc_offset o
+    ORDER BY o.consumer
+"""
+
+
+def _json(value):
+    """ JSONB -> dict (o driver pode devolver o texto). """
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class ChangeFeed:
+    def __init__(self):
+        self.updaters = {}      # nome -> {"sources", "apply", "bootstrap", "endpoints"}
+        self._installed = None
+
+    def register(self, name, sources, apply, bootstrap, endpoints=()):
+        """
+        Registra um agregado no feed.
+        sources: tabelas lidas (ver SOURCES); endpoints: caminhos cujo cache depende do agregado.
+        """
+        unknown = set(sources) - set(SOURCES)
+        if unknown:
+            raise ValueError(f"Tabelas sem captura de mudanças: {sorted(unknown)}")
+        self.updaters[name] = {"sources": list(sources), "apply": apply, "bootstrap": bootstrap,
+                               "endpoints": list(endpoints)}
+
+    async def installed(self):
+        """ A migração V007 foi aplicada? (consultado uma vez por processo) """
+        if self._installed is None:
+            async with database.engine.connect() as conn:
+                self._installed = bool((await conn.execute(text(SQL_INSTALLED))).scalar())
+        return self._installed
+
+    async def tracking(self, name):
+        """
+        O agregado 'name' está sendo mantido pelo feed (CDC ligado e já inicializado)?
+        Com o CDC desligado, o offset é descartado: ao religar, o agregado é recalculado do zero.
+        """
+        if not await self.installed():
+            return False
+        async with database.engine.begin() as conn:
+            if not CDC_ENABLED:
+                await conn.execute(text(SQL_OFFSET_DELETE), {"consumer": name})
+                return False
+            return (await conn.execute(text(SQL_OFFSET_EXISTS), {"consumer": name})).first() is not None
+
+    async def rebuild(self, name):
+        """ Recalcula o agregado do zero e reposiciona o offset no snapshot do recálculo. """
+        updater = self.updaters[name]
+        async with database.engine.connect() as conn:
+            await conn.execution_options(isolation_level="REPEATABLE READ")
+            async with conn.begin():
+                # 1º comando: fixa o snapshot da transação (o mesmo que o bootstrap vai ler)
+                snapshot = (await conn.execute(text(SQL_SNAPSHOT))).scalar()
+                await updater["bootstrap"](conn)
+                await conn.execute(text(SQL_OFFSET_RESET),
+                                   {"consumer": name, "sources": updater["sources"], "snapshot": snapshot})
+        print(f"[cdc] '{name}' recalculado do zero.")
+
+    async def _apply_batch(self, name):
+        """ Aplica um lote de mudanças. Retorna (aplicadas, terminou_a_janela). """
+        updater = self.updaters[name]
+        async with database.engine.begin() as conn:
+            offset = (await conn.execute(text(SQL_OFFSET_LOCK), {"consumer": name})).first()
+            if offset is None:
+                return None, True
+            done, target, last_id = offset
+            if target is None:
+                target, last_id = (await conn.execute(text(SQL_SNAPSHOT))).scalar(), 0
+
+            rows = (await conn.execute(text(SQL_CHANGES), {
+                "sources": updater["sources"], "last_id": last_id,
+                "done": done, "target": target, "limit": CDC_BATCH_ROWS,
+            })).fetchall()
+            changes = [
+                {"id": r[0], "source": r[1], "op": r[2], "row_id": r[3],
+                 "old": _json(r[4]), "new": _json(r[5]), "changed_at": r[6]}
+                for r in rows
+            ]
+            if changes:
+                await updater["apply"](conn, changes)
+
+            finished = len(changes) < CDC_BATCH_ROWS
+            await conn.execute(text(SQL_OFFSET_SAVE), {
+                "consumer": name,
+                "done": target if finished else done,
+                "target": None if finished else target,
+                "last_id": 0 if finished else changes[-1]["id"],
+                "last_changed_at": changes[-1]["changed_at"] if changes else None,
+                "applied": len(changes),
+            })
+            return len(changes), finished
+
+    async def drain(self, names=None):
+        """
+        Aplica tudo o que está pendente para os agregados (todos, ou só 'names').
+        Agregados ainda sem offset são recalculados do zero.
+        Retorna {nome: mudanças aplicadas} (None = recalculado do zero).
+        """
+        applied = {}
+        for name in names or list(self.updaters):
+            total, finished = await self._apply_batch(name)
+            if total is None:
+                await self.rebuild(name)
+                applied[name] = None
+                continue
+            while not finished:
+                count, finished = await self._apply_batch(name)
+                total += count
+            applied[name] = total
+        return applied
+
+    async def prune(self):
+        """ Apaga do change_log o que já foi aplicado por todos (e o que passou da retenção). """
+        async with database.engine.begin() as conn:
+            deleted = 0
+            for source in SOURCES:
+                deleted += (await conn.execute(text(SQL_PRUNE), {"source": source})).rowcount
+            deleted += (await conn.execute(text(SQL_PRUNE_RETENTION), {"hours": CDC_RETENTION_HOURS})).rowcount
+            return deleted
+
+    async def check(self):
+        """
+        Ida e volta dos snapshots com o driver real (reset -> leitura do offset -> mudanças -> save),
+        para um consumidor de teste, numa transação desfeita no fim. Retorna as mudanças lidas.
+        """
+        async with database.engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                params = {"consumer": "__check__", "sources": list(SOURCES)}
+                snapshot = (await conn.execute(text(SQL_SNAPSHOT))).scalar()
+                await conn.execute(text(SQL_OFFSET_RESET), {**params, "snapshot": snapshot})
+                done, _, last_id = (await conn.execute(text(SQL_OFFSET_LOCK), params)).first()
+                target = (await conn.execute(text(SQL_SNAPSHOT))).scalar()
+                rows = (await conn.execute(text(SQL_CHANGES), {
+                    **params, "last_id": last_id, "done": done, "target": target, "limit": 1,
+                })).fetchall()
+                await conn.execute(text(SQL_OFFSET_SAVE), {
+                    **params, "done": done, "target": target, "last_id": 0,
+                    "last_changed_at": None, "applied": 0,
+                })
+                return len(rows)
+            finally:
+                await transaction.rollback()
+
+    async def status(self):
+        async with database.engine.connect() as conn:
+            return (await conn.execute(text(SQL_STATUS))).fetchall()
+
+    async def run(self, on_applied):
+        """
+        Loop do feed: acorda a cada notificação do canal CHANNEL (com debounce) ou a cada
+        CDC_POLL_SECONDS, aplica as mudanças pendentes e limpa o change_log.
+        'on_applied(applied)' recebe o retorno do drain() das rodadas que mudaram algum agregado.
+        Roda até ser cancelada; se a conexão cair, espera e reconecta.
+        """
+        if not CDC_ENABLED or not await self.installed():
+            print("[cdc] desligado (CDC_ENABLED=false ou migração V007 não aplicada).")
+            return
+        wake = asyncio.Event()
+
+        def on_notify(connection, pid, channel, payload):
+            wake.set()
+
+        while True:
+            try:
+                # Conexão dedicada (fica fora do pool enquanto o feed estiver ativo)
+                async with database.engine.connect() as conn:
+                    driver = (await conn.get_raw_connection()).driver_connection
+                    await driver.add_listener(CHANNEL, on_notify)
+                    print(f"[cdc] escutando '{CHANNEL}' ({len(self.updaters)} agregados).")
+                    try:
+                        while True:
+                            applied = await self.drain()
+                            await self.prune()
+                            if any(count != 0 for count in applied.values()):
+                                on_applied(applied)
+                            try:
+                                await asyncio.wait_for(wake.wait(), timeout=CDC_POLL_SECONDS)
+                                await asyncio.sleep(CDC_DEBOUNCE_SECONDS)
+                            except asyncio.TimeoutError:
+                                pass
+                            wake.clear()
+                    finally:
+                        await driver.remove_listener(CHANNEL, on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERRO no feed de mudanças: {e}")
+                await asyncio.sleep(10)
+
+
+cdc_feed = ChangeFeed()
+
+
+def register_all():
+    """ Importa os módulos dos agregados (cada um se registra no cdc_feed ao ser importado). """
+    import rollups  # noqa: F401
+    import streaks  # noqa: F401
+
+
+async def _main(status, check=False):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        if check:
+            await cdc_feed.check()
+            print("Snapshots ok: reset -> offset -> mudanças -> save com o driver atual.")
+            return
+        if status:
+            for consumer, sources, last_changed_at, applied_rows, updated_at, pending in await cdc_feed.status():
+                print(f"{consumer:<24} {','.join(sources):<32} pendentes={pending:<8} aplicadas={applied_rows:<10} "
+                      f"última mudança={last_changed_at} atualizado={updated_at}")
+            return
+        if not CDC_ENABLED or not await cdc_feed.installed():
+            print("CDC desligado (CDC_ENABLED=false ou migração V007 não aplicada).")
+            return
+        register_all()
+        applied = await cdc_feed.drain()
+        pruned = await cdc_feed.prune()
+        print(f"Mudanças aplicadas: {applied} ({pruned} linhas removidas do change_log) em {datetime.now():%H:%M:%S}.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aplica as mudanças pendentes (bi.change_log) nos agregados incrementais.")
+    parser.add_argument("--status", action="store_true", help="Mostra a posição e as pendências de cada consumidor.")
+    parser.add_argument("--check", action="store_true", help="Confere a ida e volta dos snapshots (nada é gravado).")
+    args = parser.parse_args()
+    # Os agregados se registram no módulo "cdc" (import rollups -> from cdc import cdc_feed), não
+    # neste __main__: roda o _main de lá para usar o mesmo cdc_feed
+    import cdc
+    asyncio.run(cdc._main(args.status, args.check))
@@ -0,0 +1,123 @@
+# backend/columnar.py
+# Séries temporais tipadas e negociação de formato (JSON, Arrow IPC ou Parquet).
+#
+# Os endpoints de série (ex: /bi/dau) retornam um TimeSeries, que é o que fica no cache.
+# O decorator @negotiated converte a série no formato pedido pelo cliente:
+#   - ?format=arrow   ou  Accept: application/vnd.apache.arrow.stream  -> Arrow IPC (stream)
+#   - ?format=parquet ou  Accept: application/vnd.apache.parquet       -> Parquet
+#   - qualquer outro caso -> o JSON de sempre {"labels": [...], "values": [...]}
+# No Arrow/Parquet as colunas "labels" e "values" saem tipadas (date32, timestamp, int64,
+# float64), sem passar datas por string.
+import functools
+import inspect
+import io
+import json
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional: sem ele, só JSON
+    pa = None
+    pq = None
+
+MEDIA_ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_PARQUET = "application/vnd.apache.parquet"
+
+FORMATOS = {
+    "arrow": MEDIA_ARROW,
+    "parquet": MEDIA_PARQUET,
+}
+
+# Tipos lógicos das colunas -> tipos do Arrow (também usado pelo export.py)
+def arrow_type(kind):
+    return {
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "decimal": pa.decimal128(18, 2),
+        "str": pa.string(),
+        "bool": pa.bool_(),
+    }[kind]
+
+
+class TimeSeries:
+    """ Série "labels/values" com os valores originais (date, datetime, int...) e o tipo de cada coluna. """
+
+    def __init__(self, labels, values, label_type="date", value_type="int", meta=None):
+        self.labels = labels
+        self.values = values
+        self.label_type = label_type
+        self.value_type = value_type
+        self.meta = meta    # informações extras (ex: erro do modo approx); no Arrow vão no metadata do schema
+        self._encoded = {}  # formato -> bytes (a série fica no cache; serializa uma vez por formato)
+
+    def to_json(self):
+        result = {"labels": [str(label) for label in self.labels], "values": self.values}
+        if self.meta:
+            result.update(self.meta)
+        return result
+
+    def to_arrow(self):
+        table = pa.table({
+            "labels": pa.array(self.labels, type=arrow_type(self.label_type)),
+            "values": pa.array(self.values, type=arrow_type(self.value_type)),
+        })
+        if self.meta:
+            table = table.replace_schema_metadata({key: json.dumps(value) for key, value in self.meta.items()})
+        return table
+
+    def encode(self, fmt):
+        if fmt not in self._encoded:
+            table = self.to_arrow()
+            sink = io.BytesIO()
+            if fmt == "arrow":
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+            else:
+                pq.write_table(table, sink)
+            self._encoded[fmt] = sink.getvalue()
+        return self._encoded[fmt]
+
+
+def requested_format(request):
+    """ Formato pedido: ?format=... tem prioridade sobre o header Accept. """
+    fmt = (request.query_params.get("format") or "").lower()
+    if fmt:
+        return fmt if fmt in FORMATOS else "json"
+    accept = request.headers.get("accept", "")
+    for fmt, media_type in FORMATOS.items():
+        if media_type in accept:
+            return fmt
+    return "json"
+
+
+def render(result, request):
+    """ Converte o resultado do endpoint para o formato pedido (sem request, sempre JSON). """
+    if not isinstance(result, TimeSeries):
+        return result
+    fmt = requested_format(request) if request is not None else "json"
+    if fmt == "json":
+        return result.to_json()
+    if pa is None:
+        raise HTTPException(status_code=406, detail="Formato indisponível: pyarrow não está instalado.")
+    return Response(content=result.encode(fmt), media_type=FORMATOS[fmt])
+
+
+def negotiated(func):
+    """
+    Decorator (abaixo do @app.get e acima do @cached): o endpoint retorna um TimeSeries e a
+    resposta sai em JSON, Arrow ou Parquet. O Request é recebido aqui e não entra na chave do cache.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, request: Request = None, **kwargs):
+        return render(await func(*args, **kwargs), request)
+
+    request_param = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Request)
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), request_param])
+    return wrapper
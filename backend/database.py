@@ -0,0 +1,127 @@
+# backend/database.py
+# Camada de acesso ao banco (assíncrona) usada pelos endpoints do main.py.
+#
+# Todos os endpoints compartilham UMA engine assíncrona (asyncpg) com um
+# pool de conexões configurável via .env:
+#
+#   DB_POOL_SIZE             -> conexões mantidas abertas no pool (padrão 20)
+#   DB_MAX_OVERFLOW          -> conexões extras permitidas em pico (padrão 30)
+#   DB_POOL_TIMEOUT          -> segundos esperando uma conexão livre (padrão 10)
+#   DB_POOL_RECYCLE          -> recicla conexões mais velhas que N segundos (padrão 1800)
+#   DB_POOL_PRE_PING         -> testa a conexão antes de usar (padrão true)
+#   DB_STATEMENT_TIMEOUT_MS  -> statement_timeout do Postgres em ms (padrão 15000, 0 = sem limite)
+import os
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import metrics
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_settings():
+    """ Lê os parâmetros do pool do ambiente (chamado depois do load_dotenv). """
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", 20),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 30),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "statement_timeout_ms": _env_int("DB_STATEMENT_TIMEOUT_MS", 15000),
+    }
+
+
+def to_async_url(database_url):
+    """
+    Converte a DATABASE_URL do .env (postgresql://...) para o driver asyncpg
+    (postgresql+asyncpg://...). O resto da URL é mantido.
+    """
+    url = make_url(database_url)
+    return url.set(drivername="postgresql+asyncpg")
+
+
+def create_engine_from_env(database_url):
+    """
+    Cria a engine assíncrona compartilhada com os parâmetros de pool do .env.
+    O statement_timeout é aplicado por conexão (server_settings do asyncpg),
+    então uma query lenta é cancelada pelo próprio Postgres.
+    """
+    settings = pool_settings()
+    statement_timeout_ms = settings.pop("statement_timeout_ms")
+
+    server_settings = {"application_name": "bi_backend"}
+    if statement_timeout_ms > 0:
+        server_settings["statement_timeout"] = str(statement_timeout_ms)
+
+    return create_async_engine(
+        to_async_url(database_url),
+        connect_args={"server_settings": server_settings},
+        **settings,
+    )
+
+
+# A engine é criada pelo main.py (init_engine) depois de validar a DATABASE_URL.
+engine = None
+
+
+def init_engine(database_url):
+    global engine
+    engine = create_engine_from_env(database_url)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+async def dispose_engine():
+    """ Fecha todas as conexões do pool (chamado no shutdown da aplicação). """
+    if engine is not None:
+        await engine.dispose()
+
+
+@asynccontextmanager
+async def connection():
+    """ Conexão do pool; o tempo até obtê-la vai para as métricas (bi_db_pool_wait_seconds). """
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        metrics.observe_pool_wait(time.perf_counter() - started)
+        yield conn
+
+
+async def fetch_all(sql, params=None):
+    """ Executa um SELECT e retorna todas as linhas. """
+    async with connection() as conn:
+        result = await conn.execute(text(sql), params or {})
+        return result.fetchall()
+
+
+async def fetch_one(sql, params=None):
+    """ Executa um SELECT e retorna apenas a primeira linha (ou None). """
+    async with connection() as conn:
+        result = await conn.execute(text(sql), params or {})
+        return result.fetchone()
+
+
+def pool_status():
+    """ Retorna um resumo do estado atual do pool (para diagnóstico). """
+    if engine is None:
+        return {}
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
@@ -0,0 +1,244 @@
+# backend/export.py
+# Exportação em streaming dos dados brutos das tabelas fato (GET /export/{dataset}).
+#
+# A memória do backend fica constante, qualquer que seja o volume exportado:
+#   - Keyset pagination pelo id: cada página é "WHERE id > :after_id ORDER BY id LIMIT N"
+#     (nada de OFFSET), com a sua própria conexão do pool.
+#   - Cada página é lida por um cursor do lado do servidor (conn.stream), em blocos de
+#     EXPORT_CHUNK_ROWS linhas; cada bloco é convertido e enviado antes de ler o próximo.
+#   - Formatos: NDJSON (padrão), CSV ou Parquet (um row group por bloco; precisa do pyarrow).
+#
+# Para retomar uma exportação interrompida, use after_id = último id recebido.
+#
+# Variáveis de ambiente:
+#   EXPORT_CHUNK_ROWS  -> linhas por bloco enviado (padrão 5000)
+#   EXPORT_PAGE_ROWS   -> linhas por página/query do keyset (padrão 100000)
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+import database
+from columnar import arrow_type, pa, pq
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_PAGE_ROWS = int(os.getenv("EXPORT_PAGE_ROWS", "100000"))
+
+
+class Dataset(str, Enum):
+    user_time = "user_time"
+    payment = "payment"
+    user_scheduling = "user_scheduling"
+    web_events = "web_events"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    parquet = "parquet"
+
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Subqueries reaproveitadas nos filtros
+_COLABORADORES = "SELECT user_id FROM companies.companies_client_collaborator WHERE client_id = :client_id"
+_HORARIOS_PARCEIRO = "SELECT id FROM providers.partner_schedule WHERE partner_id = :partner_id"
+
+# Tabelas exportáveis. 'columns' = (coluna, tipo); o id vem sempre primeiro (é a chave do keyset).
+# O filtro de tempo é sempre em created_at. Sem 'partner_filter', o filtro por parceiro não se aplica.
+DATASETS = {
+    "user_time": {
+        "table": "consumers.user_time",
+        "columns": [
+            ("id", "int"), ("user_id", "int"), ("partner_id", "int"), ("partner_schedule_id", "int"),
+            ("card_id", "int"), ("type", "str"), ("status", "str"), ("active", "bool"),
+            ("created_at", "timestamp"), ("finished_at", "timestamp"), ("canceled_at", "timestamp"),
+        ],
+        "partner_filter": "partner_id = :partner_id",
+        "client_filter": f"user_id IN ({_COLABORADORES})",
+    },
+    "payment": {
+        "table": "consumers.payment",
+        "columns": [
+            ("id", "int"), ("user_scheduling_id", "int"), ("user_time_id", "int"), ("status", "str"),
+            ("amount_due", "decimal"), ("transferred_value", "decimal"), ("value_obtained", "decimal"),
+            ("payment_type", "str"), ("billing_type", "str"), ("created_at", "timestamp"),
+        ],
+        # Pagamento -> Agendamento -> Horário do parceiro (mesmo caminho dos rollups)
+        "partner_filter": f"""user_scheduling_id IN (
+            SELECT id FROM consumers.user_scheduling WHERE partner_schedule_id IN ({_HORARIOS_PARCEIRO}))""",
+        "client_filter": f"""user_scheduling_id IN (
+            SELECT id FROM consumers.user_scheduling WHERE user_id IN ({_COLABORADORES}))""",
+    },
+    "user_scheduling": {
+        "table": "consumers.user_scheduling",
+        "columns": [
+            ("id", "int"), ("user_id", "int"), ("partner_schedule_id", "int"), ("scheduled_at", "date"),
+            ("hour", "str"), ("minute", "str"), ("status", "str"), ("active", "bool"),
+            ("created_at", "timestamp"), ("canceled_at", "timestamp"),
+        ],
+        "partner_filter": f"partner_schedule_id IN ({_HORARIOS_PARCEIRO})",
+        "client_filter": f"user_id IN ({_COLABORADORES})",
+    },
+    "web_events": {
+        "table": "analytics.web_events",
+        "columns": [
+            ("id", "int"), ("session_id", "str"), ("event_name", "str"), ("user_id", "int"),
+            ("created_at", "timestamp"),
+        ],
+        "partner_filter": None,
+        "client_filter": f"user_id IN ({_COLABORADORES})",
+    },
+}
+
+
+def build_query(spec, filters, after_id, page_rows):
+    """ SQL de UMA página do keyset (id > after_id) com os filtros informados. """
+    params = {"after_id": after_id, "page_rows": page_rows}
+    conditions = ["id > :after_id"]
+    if filters.get("start") is not None:
+        conditions.append("created_at >= :start")
+        params["start"] = filters["start"]
+    if filters.get("end") is not None:
+        conditions.append("created_at < :end")
+        params["end"] = filters["end"]
+    if filters.get("partner_id") is not None:
+        conditions.append(spec["partner_filter"])
+        params["partner_id"] = filters["partner_id"]
+    if filters.get("client_id") is not None:
+        conditions.append(spec["client_filter"])
+        params["client_id"] = filters["client_id"]
+
+    columns = ", ".join(name for name, _ in spec["columns"])
+    sql = f"""
+        SELECT {columns}
+        FROM {spec['table']}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+        LIMIT :page_rows
+    """
+    return sql, params
+
+
+async def stream_rows(spec, filters, after_id=0, limit=None):
+    """ Gera blocos de linhas (listas), página a página pelo id, até 'limit' linhas (None = todas). """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_rows = EXPORT_PAGE_ROWS if remaining is None else min(EXPORT_PAGE_ROWS, remaining)
+        sql, params = build_query(spec, filters, after_id, page_rows)
+        count = 0
+        async with database.connection() as conn:
+            result = await conn.stream(text(sql), params, execution_options={"yield_per": EXPORT_CHUNK_ROWS})
+            async for rows in result.partitions():
+                count += len(rows)
+                after_id = rows[-1][0]
+                yield rows
+        if remaining is not None:
+            remaining -= count
+        if count < page_rows:
+            break
+
+
+# --- Formatos ---
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+async def encode_ndjson(spec, chunks):
+    names = [name for name, _ in spec["columns"]]
+    async for rows in chunks:
+        yield "".join(json.dumps(dict(zip(names, row)), default=_json_default) + "\n" for row in rows).encode()
+
+
+async def encode_csv(spec, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in spec["columns"]])
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """ Destino do ParquetWriter que é esvaziado a cada bloco (tell() conta o total já escrito). """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+async def encode_parquet(spec, chunks):
+    schema = pa.schema([(name, arrow_type(kind)) for name, kind in spec["columns"]])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    async for rows in chunks:
+        arrays = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+
+
+async def _logged(dataset, chunks):
+    """ Depois do início do streaming não dá mais para mudar o status: loga o erro e interrompe a resposta. """
+    try:
+        async for data in chunks:
+            yield data
+    except Exception as e:
+        print(f"ERRO na exportação {dataset}: {e}")
+        raise
+
+
+def export_response(dataset, fmt, filters, after_id=0, limit=None):
+    """ Valida os filtros e monta a StreamingResponse (as queries só rodam durante o envio). """
+    spec = DATASETS[dataset]
+    if filters.get("partner_id") is not None and spec["partner_filter"] is None:
+        raise HTTPException(status_code=400, detail=f"O filtro partner_id não se aplica a {dataset}.")
+    if fmt == "parquet" and pa is None:
+        raise HTTPException(status_code=406, detail="Formato indisponível: pyarrow não está instalado.")
+
+    chunks = ENCODERS[fmt](spec, stream_rows(spec, filters, after_id, limit))
+    return StreamingResponse(
+        _logged(dataset, chunks),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{fmt}"'},
+    )
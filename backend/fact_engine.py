@@ -0,0 +1,301 @@
+# backend/fact_engine.py
+# Motor de KPIs em memória (opcional: FACT_ENGINE_ENABLED=true).
+#
+# Os group-bys simples (/bi/new_users_over_time, /bi/revenue_by_region, /bi/partner/reservation_status
+# e /bi/partner/occupation_by_hour) deixam de ir ao Postgres: o motor guarda um snapshot colunar das
+# tabelas fato (arrays NumPy indexados pelo id da linha, como o b2b_store.py faz por user_id) e
+# agrega com np.bincount / np.unique. Colunas categóricas (status, CEP) são codificadas por
+# dicionário (valor -> código int32; -1 = NULL), então os group-bys são contagens de inteiros.
+#
+# Refresh:
+#   - Incremental: só as linhas com updated_at >= (maior updated_at já lido - FACT_ENGINE_OVERLAP_SECONDS).
+#     A margem cobre transações que gravaram um updated_at antigo e confirmaram depois; reaplicar
+#     uma linha só sobrescreve a posição dela. providers.partner_schedule é pequena e é relida inteira.
+#   - Completo a cada FACT_ENGINE_FULL_RELOAD_SECONDS: pega linhas apagadas e alterações que não
+#     mexeram no updated_at.
+# Depois de cada refresh os KPIs de todos os parceiros, regiões e agrupamentos são recalculados
+# de uma vez; os endpoints só leem o resultado (um acesso a dicionário).
+#
+# Variáveis de ambiente:
+#   FACT_ENGINE_ENABLED              -> liga o motor (padrão false: os endpoints consultam o Postgres)
+#   FACT_ENGINE_REFRESH_SECONDS      -> intervalo do refresh incremental (padrão 30, lido no main.py)
+#   FACT_ENGINE_OVERLAP_SECONDS      -> margem do updated_at no incremental (padrão 300)
+#   FACT_ENGINE_FULL_RELOAD_SECONDS  -> intervalo da recarga completa (padrão 3600)
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from columnar import TimeSeries
+from database import fetch_all
+
+FACT_ENGINE_ENABLED = os.getenv("FACT_ENGINE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
+FACT_ENGINE_OVERLAP_SECONDS = int(os.getenv("FACT_ENGINE_OVERLAP_SECONDS", "300"))
+FACT_ENGINE_FULL_RELOAD_SECONDS = int(os.getenv("FACT_ENGINE_FULL_RELOAD_SECONDS", "3600"))
+
+TOP_REGIONS = 10
+
+# Endpoints calculados pelo motor (o cache deles é invalidado após cada refresh)
+ENDPOINTS_ENGINE = [
+    "/bi/new_users_over_time", "/bi/revenue_by_region",
+    "/bi/partner/reservation_status", "/bi/partner/occupation_by_hour",
+]
+
+# Cada tabela: SQL com a coluna updated_at por último ("{where}" = filtro do incremental)
+SQL_USERS = "SELECT id, created_at, zip_code, updated_at FROM consumers.user {where}"
+
+SQL_SCHEDULINGS = """
+    SELECT id, user_id, partner_schedule_id, status, updated_at
+    FROM consumers.user_scheduling {where}
+"""
+
+SQL_PAYMENTS = """
+    SELECT id, user_scheduling_id, status, amount_due, updated_at
+    FROM consumers.payment {where}
+"""
+
+SQL_SCHEDULES = "SELECT id, partner_id, hour FROM providers.partner_schedule"
+
+WHERE_SINCE = "WHERE updated_at >= :since"
+
+
+class Dictionary:
+    """ Codificação por dicionário de uma coluna categórica: valor -> código int32 (-1 = NULL). """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, values):
+        for value in set(values):
+            if value is not None and value not in self._codes:
+                self._codes[value] = len(self.values)
+                self.values.append(value)
+        codes = self._codes
+        return np.fromiter((codes.get(value, -1) for value in values), dtype=np.int32, count=len(values))
+
+    def code(self, value):
+        return self._codes.get(value, -1)
+
+
+class FactTable:
+    """ Colunas de uma tabela indexadas pelo id da linha (ids SERIAL: quase densos). """
+
+    def __init__(self, columns):
+        self.fills = {name: fill for name, (_, fill) in columns.items()}
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, (dtype, _) in columns.items()}
+        self.present = np.zeros(0, dtype=bool)
+        self.since = None   # maior updated_at lido (None = nada carregado)
+
+    def _grow(self, size):
+        if size <= len(self.present):
+            return
+        size = max(size, len(self.present) * 5 // 4)   # folga para as próximas linhas novas
+        grown = np.zeros(size, dtype=bool)
+        grown[:len(self.present)] = self.present
+        self.present = grown
+        for name, array in self.columns.items():
+            column = np.full(size, self.fills[name], dtype=array.dtype)
+            column[:len(array)] = array
+            self.columns[name] = column
+
+    def upsert(self, ids, values, updated):
+        """ Grava as linhas nas posições dos ids (linha repetida = sobrescrita). """
+        if not len(ids):
+            return
+        self._grow(int(ids.max()) + 1)
+        self.present[ids] = True
+        for name, column in values.items():
+            self.columns[name][ids] = column
+        latest = max((u for u in updated if u is not None), default=None)
+        if latest is not None and (self.since is None or latest > self.since):
+            self.since = latest
+
+    def lookup(self, name, ids, fill):
+        """ Valor da coluna nas linhas 'ids' ('fill' para ids negativos, fora do array ou apagados). """
+        column = self.columns[name]
+        ok = (ids >= 0) & (ids < len(column))
+        ok[ok] = self.present[ids[ok]]
+        result = np.full(len(ids), fill, dtype=column.dtype)
+        result[ok] = column[ids[ok]]
+        return result
+
+
+def _ids(rows, index):
+    return np.array([-1 if r[index] is None else r[index] for r in rows], dtype=np.int64)
+
+
+class FactEngine:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.kpis = None            # resultado da última agregação
+        self.refreshed_at = None
+        self.reloaded_at = None     # última recarga completa
+        self._lock = asyncio.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.zip_codes = Dictionary()
+        self.scheduling_status = Dictionary()
+        self.payment_status = Dictionary()
+        self.users = FactTable({"created_at": ("datetime64[s]", np.datetime64("NaT")), "zip_code": (np.int32, -1)})
+        self.schedulings = FactTable({"user": (np.int64, -1), "schedule": (np.int64, -1), "status": (np.int32, -1)})
+        self.payments = FactTable({"scheduling": (np.int64, -1), "status": (np.int32, -1), "amount": (np.float64, 0.0)})
+
+    # --- Carga ---
+
+    async def _rows(self, sql, table):
+        if table.since is None:
+            return await fetch_all(sql.format(where=""))
+        since = table.since - timedelta(seconds=FACT_ENGINE_OVERLAP_SECONDS)
+        return await fetch_all(sql.format(where=WHERE_SINCE), {"since": since})
+
+    async def _load(self):
+        """ Lê as linhas novas/alteradas de cada tabela e grava nas colunas. Retorna quantas linhas leu. """
+        users = await self._rows(SQL_USERS, self.users)
+        self.users.upsert(_ids(users, 0), {
+            "created_at": np.array([r[1] for r in users], dtype="datetime64[s]"),
+            "zip_code": self.zip_codes.encode([r[2] for r in users]),
+        }, [r[3] for r in users])
+
+        schedulings = await self._rows(SQL_SCHEDULINGS, self.schedulings)
+        self.schedulings.upsert(_ids(schedulings, 0), {
+            "user": _ids(schedulings, 1),
+            "schedule": _ids(schedulings, 2),
+            "status": self.scheduling_status.encode([r[3] for r in schedulings]),
+        }, [r[4] for r in schedulings])
+
+        payments = await self._rows(SQL_PAYMENTS, self.payments)
+        self.payments.upsert(_ids(payments, 0), {
+            "scheduling": _ids(payments, 1),
+            "status": self.payment_status.encode([r[2] for r in payments]),
+            "amount": np.array([float(r[3]) for r in payments], dtype=np.float64),
+        }, [r[4] for r in payments])
+
+        return len(users) + len(schedulings) + len(payments)
+
+    # --- Kernels (NumPy) ---
+
+    def _new_users(self):
+        """ Novos usuários por dia, mês e hora do dia (as 3 opções do group_by). """
+        created = self.users.columns["created_at"][self.users.present]
+        nulls = int(np.isnat(created).sum())
+        created = created[~np.isnat(created)]
+        days = created.astype("datetime64[D]")
+        groups = {
+            "day": (days, "date"),
+            "month": (created.astype("datetime64[M]"), "timestamp"),
+            "hour": ((created - days) // np.timedelta64(1, "h"), "int"),
+        }
+        result = {}
+        for group_by, (keys, label_type) in groups.items():
+            labels, counts = np.unique(keys, return_counts=True)
+            if label_type == "timestamp":
+                labels = labels.astype("datetime64[s]")
+            labels, values = labels.tolist(), counts.tolist()
+            if nulls:
+                # Como no GROUP BY do Postgres: NULL vira um grupo, no fim
+                labels, values = labels + [None], values + [nulls]
+            result[group_by] = TimeSeries(labels, values, label_type=label_type)
+        return result
+
+    def _revenue_by_region(self):
+        """ Receita PAID por CEP (pagamento -> agendamento -> usuário), as TOP_REGIONS maiores. """
+        payments = self.payments
+        paid = payments.present & (payments.columns["status"] == self.payment_status.code("PAID"))
+        users = self.schedulings.lookup("user", payments.columns["scheduling"][paid], -1)
+        zips = self.users.lookup("zip_code", users, -1)
+        ok = zips >= 0
+        zips, amounts = zips[ok], payments.columns["amount"][paid][ok]
+        size = len(self.zip_codes.values)
+        totals = np.bincount(zips, weights=amounts, minlength=size)
+        regions = np.flatnonzero(np.bincount(zips, minlength=size))
+        top = regions[np.argsort(-totals[regions], kind="stable")][:TOP_REGIONS]
+        return {
+            "labels": [str(self.zip_codes.values[z]) for z in top],
+            "values": [round(float(totals[z]), 2) for z in top],
+        }
+
+    def _partners(self, schedules):
+        """ partner_id -> {"status": [(status, total)], "occupation": [(hora, total)]}. """
+        schedule_ids = np.array([r[0] for r in schedules], dtype=np.int64)
+        size = int(schedule_ids.max()) + 1 if len(schedule_ids) else 0
+        schedule_partner = np.full(size, -1, dtype=np.int64)
+        schedule_hour = np.full(size, -1, dtype=np.int64)
+        schedule_partner[schedule_ids] = _ids(schedules, 1)
+        schedule_hour[schedule_ids] = _ids(schedules, 2)
+
+        table = self.schedulings
+        slots = table.columns["schedule"][table.present]
+        status = table.columns["status"][table.present]
+        ok = (slots >= 0) & (slots < size)
+        slots, status = slots[ok], status[ok]
+        partners, hours = schedule_partner[slots], schedule_hour[slots]
+        ok = partners >= 0
+        partners, hours, status = partners[ok], hours[ok], status[ok]
+
+        result = {}
+        # Status: código -1 (NULL) vai para a última coluna, como o NULL no ORDER BY status
+        labels = self.scheduling_status.values
+        n_status = len(labels) + 1
+        status_index = np.where(status >= 0, status, len(labels))
+        order = sorted(range(len(labels)), key=lambda i: labels[i]) + [len(labels)]
+        by_status = np.bincount(partners * n_status + status_index).reshape(-1, n_status) if len(partners) else None
+        for partner_id in (np.flatnonzero(by_status.any(axis=1)) if by_status is not None else []):
+            row = by_status[partner_id]
+            result[int(partner_id)] = {
+                "status": [(labels[i] if i < len(labels) else None, int(row[i])) for i in order if row[i]],
+                "occupation": [],
+            }
+
+        valid = hours >= 0
+        if valid.any():
+            keys, counts = np.unique(np.stack([partners[valid], hours[valid]]), axis=1, return_counts=True)
+            for (partner_id, hour), total in zip(keys.T.tolist(), counts.tolist()):
+                result[partner_id]["occupation"].append((hour, total))
+        return result
+
+    def _aggregate(self, schedules):
+        return {
+            "new_users": self._new_users(),
+            "revenue_by_region": self._revenue_by_region(),
+            "partners": self._partners(schedules),
+        }
+
+    # --- Refresh / consulta ---
+
+    async def ready(self):
+        """ Garante que o motor foi carregado (o primeiro endpoint a chegar dispara o refresh). """
+        if self.kpis is None:
+            await self.refresh()
+
+    async def refresh(self, full=False):
+        """ Lê o que mudou desde o último refresh (tudo, na recarga completa) e recalcula os KPIs. """
+        async with self._lock:
+            now = datetime.now()
+            if full or self.reloaded_at is None or now - self.reloaded_at >= timedelta(seconds=FACT_ENGINE_FULL_RELOAD_SECONDS):
+                self._reset()
+                self.reloaded_at = now
+            rows = await self._load()
+            schedules = await fetch_all(SQL_SCHEDULES)
+            self.kpis = await asyncio.to_thread(self._aggregate, schedules)
+            self.refreshed_at = now
+            return rows
+
+    async def new_users(self, group_by):
+        """ TimeSeries de novos usuários por "day", "month" ou "hour". """
+        await self.ready()
+        return self.kpis["new_users"][group_by]
+
+    async def revenue_by_region(self):
+        await self.ready()
+        return self.kpis["revenue_by_region"]
+
+    async def partner(self, partner_id):
+        """ Status das reservas e ocupação por hora do parceiro (mesmo formato do partner_snapshot). """
+        await self.ready()
+        return self.kpis["partners"].get(partner_id, {"status": [], "occupation": []})
+
+
+fact_engine = FactEngine(enabled=FACT_ENGINE_ENABLED)
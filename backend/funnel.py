@@ -0,0 +1,289 @@
+# backend/funnel.py
+# Funis materializados a partir de analytics.web_events.
+#
+# Um funil é uma sequência de eventos (FUNNELS). Cada sessão é processada em ordem de created_at:
+# a sessão entra no funil no primeiro evento da etapa 1 e avança uma etapa a cada evento da
+# etapa seguinte, desde que dentro de FUNNEL_WINDOW_HOURS desde a entrada.
+# A sessão conta no dia em que entrou no funil.
+#
+# O refresh lê os eventos UMA vez, em streaming (cursor do lado do servidor, ordenado por
+# sessão e created_at), e grava em bi.funnel_daily, por funil, dia e etapa:
+#   sessions            -> sessões que chegaram à etapa
+#   seconds_sum         -> soma do tempo desde a etapa anterior (conversão etapa a etapa)
+#   seconds_histogram   -> contagens por faixa de tempo (TIME_BUCKETS), para mediana/p90 em qualquer período
+# As consultas (/bi/funnel, /bi/conversion_funnel) só leem essa tabela.
+# Na mesma passada, as sessões de cada etapa dos funis de HLL_METRICS entram nos sketches
+# HyperLogLog diários (bi.daily_hll, ver hll.py) do modo approx do /bi/conversion_funnel.
+#
+# Incremental: reprocessa a partir do watermark menos uma janela (uma sessão que entrou antes
+# disso já não pode avançar). Mudar FUNNELS força um refresh completo (o watermark é por definição).
+#
+# Variáveis de ambiente:
+#   FUNNELS_JSON         -> funis extras/substitutos, ex: {"reserva": ["visitou_site", "iniciou_cadastro"]}
+#                           (cada etapa pode ser "evento" ou ["evento", "rótulo"])
+#   FUNNEL_WINDOW_HOURS  -> tempo máximo entre a entrada e as etapas seguintes (padrão 168 = 7 dias)
+#   FUNNEL_CHUNK_ROWS    -> eventos lidos por bloco do cursor (padrão 10000)
+#
+# Uso manual:
+#   python backend/funnel.py          -> incremental
+#   python backend/funnel.py --full   -> recalcula tudo
+import asyncio
+import hashlib
+import json
+import math
+import os
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+
+import database
+import hll
+from database import fetch_all
+
+FUNNELS = {
+    "cadastro": [
+        ("visitou_site", "Visitou o Site"),
+        ("iniciou_cadastro", "Iniciou Cadastro"),
+        ("completou_cadastro", "Completou Cadastro"),
+    ],
+}
+
+
+def _load_funnels():
+    funnels = dict(FUNNELS)
+    for name, steps in json.loads(os.getenv("FUNNELS_JSON") or "{}").items():
+        funnels[name] = [tuple(step) if isinstance(step, list) else (step, step) for step in steps]
+    return funnels
+
+
+FUNNELS = _load_funnels()
+FUNNEL_WINDOW = timedelta(hours=int(os.getenv("FUNNEL_WINDOW_HOURS", "168")))
+FUNNEL_CHUNK_ROWS = int(os.getenv("FUNNEL_CHUNK_ROWS", "10000"))
+
+# Faixas (segundos) do histograma de tempo entre etapas; a última faixa é "acima de 7 dias"
+TIME_BUCKETS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400)
+
+# O watermark muda junto com a definição dos funis (definição nova = refresh completo)
+_DEFINITION = json.dumps([FUNNELS, FUNNEL_WINDOW.total_seconds()], sort_keys=True)
+WATERMARK_NAME = "funnel:" + hashlib.sha1(_DEFINITION.encode()).hexdigest()[:12]
+FULL_REFRESH_START = date(1900, 1, 1)
+
+# Funil -> métrica HLL de cada etapa (sketches por dia de entrada; ver hll.py)
+HLL_METRICS = {"cadastro": ["funnel_visited", "funnel_started", "funnel_completed"]}
+
+# Endpoints que leem de bi.funnel_daily (o cache deles é invalidado após cada refresh)
+ENDPOINTS_FUNNEL = ["/bi/funnel", "/bi/conversion_funnel"]
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_EVENTS = """
+    SELECT session_id, event_name, created_at
+    FROM analytics.web_events
+    WHERE created_at >= :from_ts
+      AND event_name = ANY(:event_names)
+    ORDER BY session_id, created_at, id
+"""
+
+SQL_DELETE = "DELETE FROM bi.funnel_daily WHERE day >= :start_day"
+
+SQL_HLL_DELETE = "DELETE FROM bi.daily_hll WHERE day >= :start_day AND metric = ANY(:metrics)"
+
+SQL_INSERT = """
+    INSERT INTO bi.funnel_daily (funnel, day, step, event_name, sessions, seconds_sum, seconds_histogram)
+    VALUES (:funnel, :day, :step, :event_name, :sessions, :seconds_sum, :seconds_histogram)
+"""
+
+SQL_QUERY = """
+    SELECT step, SUM(sessions), SUM(seconds_sum), array_agg(seconds_histogram)
+    FROM bi.funnel_daily
+    WHERE funnel = :funnel
+      AND (CAST(:start AS DATE) IS NULL OR day >= :start)
+      AND (CAST(:end AS DATE) IS NULL OR day <= :end)
+    GROUP BY step
+"""
+
+
+# --- Processamento (uma passada) ---
+
+def walk_session(steps, events):
+    """
+    Percorre os eventos (ordenados) de uma sessão. Retorna (entrada, [tempo desde a etapa anterior
+    para cada etapa alcançada]) ou None se a sessão não entrou no funil.
+    """
+    reached, started, last = [], None, None
+    for event_name, created_at in events:
+        step = len(reached)
+        if step == len(steps):
+            break
+        if event_name != steps[step]:
+            continue
+        if started is None:
+            started = created_at
+            reached.append(0.0)
+        elif created_at - started <= FUNNEL_WINDOW:
+            reached.append((created_at - last).total_seconds())
+        else:
+            break
+        last = created_at
+    return (started, reached) if started is not None else None
+
+
+def _bucket(seconds):
+    return bisect_left(TIME_BUCKETS, seconds)
+
+
+def add_session(totals, events, start_day, sessions=None, session_id=None):
+    """
+    Soma uma sessão (eventos (event_name, created_at) em ordem) em
+    totals = {(funil, dia, etapa): [sessões, soma dos segundos, histograma]}
+    e, nos funis de HLL_METRICS, o hash da sessão em sessions = {(métrica, dia): [hashes]}.
+    Sessões que entraram no funil antes de start_day são ignoradas (já estão materializadas).
+    """
+    for funnel, steps in FUNNELS.items():
+        walked = walk_session([event for event, _ in steps], events)
+        if walked is None or walked[0].date() < start_day:
+            continue
+        day = walked[0].date()
+        for step, seconds in enumerate(walked[1]):
+            item = totals.get((funnel, day, step))
+            if item is None:
+                item = totals[(funnel, day, step)] = [0, 0.0, [0] * (len(TIME_BUCKETS) + 1)]
+            item[0] += 1
+            if step > 0:
+                item[1] += seconds
+                item[2][_bucket(seconds)] += 1
+        if sessions is not None and funnel in HLL_METRICS:
+            hashed = hll.hash_text(session_id)
+            for metric in HLL_METRICS[funnel][:len(walked[1])]:
+                sessions.setdefault((metric, day), []).append(hashed)
+
+
+async def aggregate(from_ts, start_day):
+    """
+    Uma passada pelos eventos das etapas de todos os funis (cursor do lado do servidor, em blocos).
+    Como vêm ordenados por sessão, só a sessão atual fica em memória (mais os hashes das sessões
+    dos funis de HLL_METRICS). Retorna (totals, sessions), ver add_session.
+    """
+    event_names = sorted({event for steps in FUNNELS.values() for event, _ in steps})
+    totals, sessions, session_id, events = {}, {}, None, []
+    async with database.connection() as conn:
+        result = await conn.stream(text(SQL_EVENTS), {"from_ts": from_ts, "event_names": event_names},
+                                   execution_options={"yield_per": FUNNEL_CHUNK_ROWS})
+        async for rows in result.partitions():
+            for row_session, event_name, created_at in rows:
+                if row_session != session_id:
+                    add_session(totals, events, start_day, sessions, session_id)
+                    session_id, events = row_session, []
+                events.append((event_name, created_at))
+    add_session(totals, events, start_day, sessions, session_id)
+    return totals, sessions
+
+
+async def refresh_funnels(full=False):
+    """
+    Recalcula bi.funnel_daily a partir do watermark menos uma janela (ou tudo, se full=True).
+    Retorna o dia inicial reprocessado.
+    """
+    async with database.engine.connect() as conn:
+        start_day = None if full else (await conn.execute(text(SQL_WATERMARK_GET), {"name": WATERMARK_NAME})).scalar()
+    if start_day is None:
+        start_day = FULL_REFRESH_START
+    else:
+        start_day -= timedelta(days=math.ceil(FUNNEL_WINDOW / timedelta(days=1)))
+
+    # Uma janela a mais de contexto: sessões que entraram antes de start_day não podem ser
+    # confundidas com entradas novas (elas são descartadas em add_session)
+    from_ts = datetime.combine(start_day, time.min)
+    if start_day > FULL_REFRESH_START:
+        from_ts -= FUNNEL_WINDOW
+    totals, sessions = await aggregate(from_ts, start_day)
+
+    async with database.engine.begin() as conn:
+        await conn.execute(text(SQL_DELETE), {"start_day": start_day})
+        if totals:
+            await conn.execute(text(SQL_INSERT), [
+                {"funnel": funnel, "day": day, "step": step, "event_name": FUNNELS[funnel][step][0],
+                 "sessions": item[0], "seconds_sum": item[1], "seconds_histogram": item[2]}
+                for (funnel, day, step), item in totals.items()
+            ])
+        metrics = [metric for names in HLL_METRICS.values() for metric in names]
+        await conn.execute(text(SQL_HLL_DELETE), {"start_day": start_day, "metrics": metrics})
+        if sessions:
+            await conn.execute(text(hll.SQL_INSERT), [
+                {"metric": metric, "dimension_id": 0, "day": day, "sketch": hll.to_bytes(hll.sketch(hashes))}
+                for (metric, day), hashes in sessions.items()
+            ])
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+    return start_day
+
+
+# --- Consulta ---
+
+def _histogram_percentile(histogram, p):
+    """ Limite superior da faixa que contém o percentil p (None se vazio ou acima da última faixa). """
+    total = sum(histogram)
+    if total == 0:
+        return None
+    target = p / 100.0 * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= target:
+            return TIME_BUCKETS[index] if index < len(TIME_BUCKETS) else None
+    return None
+
+
+async def query_funnel(name, start=None, end=None):
+    """ Etapas do funil entre 'start' e 'end' (dias de entrada), lidas de bi.funnel_daily. """
+    rows = await fetch_all(SQL_QUERY, {"funnel": name, "start": start, "end": end})
+    by_step = {r[0]: r for r in rows}
+    steps, first, previous = [], None, None
+    for index, (event_name, label) in enumerate(FUNNELS[name]):
+        row = by_step.get(index)
+        sessions = int(row[1]) if row else 0
+        histogram = [sum(col) for col in zip(*row[3])] if row else [0] * (len(TIME_BUCKETS) + 1)
+        first = sessions if first is None else first
+        step = {
+            "step": index + 1,
+            "event_name": event_name,
+            "label": label,
+            "sessions": sessions,
+            "conversion_from_previous_pct": round(sessions / previous * 100, 2) if previous else None,
+            "conversion_from_first_pct": round(sessions / first * 100, 2) if first else None,
+        }
+        if index > 0:
+            step["avg_seconds_from_previous"] = round(float(row[2]) / sessions, 1) if row and sessions else None
+            step["p50_seconds_from_previous_max"] = _histogram_percentile(histogram, 50)
+            step["p90_seconds_from_previous_max"] = _histogram_percentile(histogram, 90)
+        steps.append(step)
+        previous = sessions
+    return steps
+
+
+async def _main(full):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        start_day = await refresh_funnels(full=full)
+        print(f"Funis materializados a partir de {start_day}: {', '.join(FUNNELS)}.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Materializa os funis de analytics.web_events (bi.funnel_daily).")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
@@ -0,0 +1,250 @@
+# backend/hll.py
+# Contagem distinta aproximada (HyperLogLog) para os KPIs com COUNT(DISTINCT ...): modo approx=true.
+#
+# Um sketch HLL por dia e por dimensão fica em bi.daily_hll (ver rollups.sql):
+#   metric "users"             -> usuários com atividade (consumers.user_time), plataforma (dimension_id 0)
+#   metric "partner_users"     -> idem, por parceiro (dimension_id = partner_id)
+#   metric "client_users"      -> idem, por cliente B2B (dimension_id = client_id)
+#   metric "funnel_visited"    -> sessões que entraram no funil "cadastro" (etapa 1)
+#   metric "funnel_started"    -> sessões que chegaram à etapa 2, em ordem
+#   metric "funnel_completed"  -> sessões que chegaram à etapa 3, em ordem
+# Os sketches do funil são gravados pelo refresh do funnel.py (mesma caminhada em ordem por
+# sessão do modo exato); o refresh daqui só cuida das métricas de SQL_VALUES.
+# Sketches são "mergeáveis" (máximo registrador a registrador): uma janela de N dias é o merge
+# dos N sketches diários, sem voltar às tabelas fato.
+#
+# Precisão 14 (16384 registradores): erro padrão relativo de 1.04/sqrt(m) ~= 0.81%.
+# Sketches com poucos registradores preenchidos são gravados no formato esparso.
+# O refresh é incremental pelo watermark, como o dos rollups.
+#
+# Uso manual:
+#   python backend/hll.py          -> incremental
+#   python backend/hll.py --full   -> recalcula tudo
+import asyncio
+import hashlib
+import math
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+import database
+from database import fetch_all
+
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+STD_ERROR = 1.04 / math.sqrt(REGISTERS)
+Z_95 = 1.96
+
+WATERMARK_NAME = "hll_sketches"
+FULL_REFRESH_START = date(1900, 1, 1)
+
+# Endpoints com modo approx (o cache deles é invalidado após cada refresh)
+ENDPOINTS_HLL = ["/bi/dau", "/bi/active_users", "/bi/conversion_funnel", "/bi/b2b/engagement_stats"]
+
+# metric -> SQL que retorna (dia, dimension_id, valores distintos)
+SQL_VALUES = {
+    "users": """
+        SELECT DATE(created_at) as day, 0, array_agg(DISTINCT user_id)
+        FROM consumers.user_time
+        WHERE created_at >= :start_ts AND user_id IS NOT NULL
+        GROUP BY day
+    """,
+    "partner_users": """
+        SELECT DATE(created_at) as day, partner_id, array_agg(DISTINCT user_id)
+        FROM consumers.user_time
+        WHERE created_at >= :start_ts AND user_id IS NOT NULL AND partner_id IS NOT NULL
+        GROUP BY day, partner_id
+    """,
+    "client_users": """
+        SELECT DATE(ut.created_at) as day, c.client_id, array_agg(DISTINCT ut.user_id)
+        FROM consumers.user_time ut
+        JOIN companies.companies_client_collaborator c ON c.user_id = ut.user_id
+        WHERE ut.created_at >= :start_ts
+        GROUP BY day, c.client_id
+    """,
+}
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_DELETE = "DELETE FROM bi.daily_hll WHERE day >= :start_day AND metric = ANY(:metrics)"
+
+SQL_INSERT = """
+    INSERT INTO bi.daily_hll (metric, dimension_id, day, sketch)
+    VALUES (:metric, :dimension_id, :day, :sketch)
+"""
+
+SQL_SKETCHES = """
+    SELECT day, sketch
+    FROM bi.daily_hll
+    WHERE metric = :metric AND dimension_id = :dimension_id
+      AND day BETWEEN :start AND :end
+"""
+
+
+# --- HyperLogLog ---
+
+def hash64(values):
+    """ splitmix64: espalha inteiros (ids, hashtext) em 64 bits uniformes. """
+    with np.errstate(over="ignore"):
+        z = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def hash_text(value):
+    """ Inteiro de 64 bits estável de um texto (ex: session_id), para entrar num sketch. """
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def _bit_length(values):
+    """ Número de bits de cada uint64 (exato: cada metade de 32 bits cabe num float64). """
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def sketch(values):
+    """ Sketch (registradores uint8) de um conjunto de inteiros. """
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    if len(values) == 0:
+        return registers
+    hashed = hash64(values)
+    index = (hashed >> np.uint64(64 - PRECISION)).astype(np.int64)
+    rest = hashed & np.uint64((1 << (64 - PRECISION)) - 1)
+    rank = (64 - PRECISION) - _bit_length(rest) + 1  # posição do primeiro bit 1
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+    return registers
+
+
+def merge(sketches):
+    sketches = list(sketches)
+    if not sketches:
+        return np.zeros(REGISTERS, dtype=np.uint8)
+    return np.maximum.reduce(sketches)
+
+
+def estimate(registers):
+    """ Estimativa da cardinalidade (com a correção de "linear counting" para valores pequenos). """
+    alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+    raw = alpha * REGISTERS * REGISTERS / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * REGISTERS and zeros > 0:
+        return REGISTERS * math.log(REGISTERS / zeros)
+    return raw
+
+
+def to_bytes(registers):
+    """ Formato esparso (b"S" + índices uint16 + valores) se ocupar menos que o denso (b"D" + registradores). """
+    filled = np.flatnonzero(registers)
+    if len(filled) * 3 < REGISTERS:
+        return b"S" + filled.astype("<u2").tobytes() + registers[filled].tobytes()
+    return b"D" + registers.tobytes()
+
+
+def from_bytes(data):
+    data = bytes(data)
+    if data[:1] == b"D":
+        return np.frombuffer(data, dtype=np.uint8, offset=1).copy()
+    filled = (len(data) - 1) // 3
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    index = np.frombuffer(data, dtype="<u2", count=filled, offset=1)
+    registers[index] = np.frombuffer(data, dtype=np.uint8, offset=1 + 2 * filled)
+    return registers
+
+
+# --- Erro ---
+
+def bounds(value):
+    """ Intervalo de 95% de confiança [mín, máx] de uma estimativa. """
+    margin = Z_95 * STD_ERROR * value
+    return [max(0, round(value - margin)), round(value + margin)]
+
+
+def error_info(estimates):
+    """ Bloco "approx" das respostas: erro padrão relativo e intervalo de 95% de cada valor. """
+    return {
+        "method": f"hyperloglog (p={PRECISION})",
+        "std_error_pct": round(STD_ERROR * 100, 2),
+        "ci95": {name: bounds(value) for name, value in estimates.items()},
+    }
+
+
+# --- Consulta ---
+
+async def count_distinct(metric, start, end, dimension_id=0):
+    """ Estimativa de distintos entre 'start' e 'end' (inclusive): merge dos sketches diários. """
+    rows = await fetch_all(SQL_SKETCHES, {"metric": metric, "dimension_id": dimension_id, "start": start, "end": end})
+    return round(estimate(merge(from_bytes(r[1]) for r in rows)))
+
+
+async def daily_counts(metric, start, end, dimension_id=0):
+    """ [(dia, estimativa)] dos dias com sketch entre 'start' e 'end'. """
+    rows = await fetch_all(SQL_SKETCHES, {"metric": metric, "dimension_id": dimension_id, "start": start, "end": end})
+    return sorted((r[0], round(estimate(from_bytes(r[1])))) for r in rows)
+
+
+# --- Refresh ---
+
+async def refresh_sketches(full=False):
+    """
+    Recalcula os sketches diários a partir do watermark (ou tudo, se full=True), em uma transação.
+    Retorna o dia inicial reprocessado.
+    """
+    async with database.engine.begin() as conn:
+        start_day = None
+        if not full:
+            start_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": WATERMARK_NAME})).scalar()
+        if start_day is None:
+            start_day = FULL_REFRESH_START
+
+        params = {"start_day": start_day, "start_ts": datetime.combine(start_day, time.min)}
+        await conn.execute(text(SQL_DELETE), {**params, "metrics": list(SQL_VALUES)})
+        for metric, sql in SQL_VALUES.items():
+            rows = (await conn.execute(text(sql), params)).fetchall()
+            if rows:
+                await conn.execute(text(SQL_INSERT), [
+                    {"metric": metric, "dimension_id": dimension_id, "day": day, "sketch": to_bytes(sketch(values))}
+                    for day, dimension_id, values in rows
+                ])
+
+        # O próximo refresh recomeça em "hoje" (que ainda está em andamento)
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+
+    return start_day
+
+
+def window(days, today=None):
+    """ Janela (início, fim) de "hoje - N dias" até hoje, como nas queries exatas. """
+    today = today or date.today()
+    return today - timedelta(days=days), today
+
+
+async def _main(full):
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        start_day = await refresh_sketches(full=full)
+        print(f"Sketches HLL atualizados a partir de {start_day}.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atualiza os sketches HyperLogLog diários (bi.daily_hll).")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
@@ -0,0 +1,43 @@
+# backend/jobs.py
+# Utilitário para jobs de background do backend (refresh de rollups, snapshots...).
+# Os jobs são iniciados no lifespan do main.py e cancelados no shutdown.
+import asyncio
+import time
+
+
+async def run_periodically(name, interval_seconds, job):
+    """
+    Executa 'job()' (corrotina) a cada 'interval_seconds'.
+    Erros são logados e não derrubam o loop.
+    """
+    print(f"[job:{name}] iniciado (a cada {interval_seconds}s).")
+    while True:
+        started = time.perf_counter()
+        try:
+            await job()
+            print(f"[job:{name}] ok em {time.perf_counter() - started:.2f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"ERRO no job {name}: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_background_jobs(jobs):
+    """
+    Recebe uma lista de (nome, intervalo_segundos, job) e cria uma task para cada.
+    Jobs com intervalo <= 0 ficam desligados.
+    """
+    tasks = []
+    for name, interval_seconds, job in jobs:
+        if interval_seconds and interval_seconds > 0:
+            tasks.append(asyncio.create_task(run_periodically(name, interval_seconds, job), name=name))
+        else:
+            print(f"[job:{name}] desligado.")
+    return tasks
+
+
+async def stop_background_jobs(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,179 +1,310 @@
 # backend/main.py
 import os
-from fastapi import FastAPI, HTTPException, Query
-from sqlalchemy import create_engine, text
+import asyncio
+import hmac
+import inspect
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
 from enum import Enum
+from datetime import date, datetime, timedelta
 
 # Carrega as variáveis de ambiente (DATABASE_URL) do arquivo .env
+# (antes dos módulos locais, que leem suas configurações do ambiente)
 print("Carregando .env...")
 load_dotenv()
 
+import database
+import metrics
+from database import fetch_all, fetch_one
+from cache import cached, kpi_cache, make_key, matches
+from columnar import TimeSeries, negotiated
+import export
+from jobs import start_background_jobs, stop_background_jobs
+import rollups
+from activity import activity_bitmaps, ENDPOINTS_ACTIVITY
+from retention import retention_engine
+import hll
+import funnel
+import partner_snapshot
+from b2b_store import client_store, ENDPOINTS_B2B
+from platform_totals import platform_totals, ENDPOINTS_TOTALS
+from fact_engine import fact_engine, ENDPOINTS_ENGINE
+from user_search import search_users
+import user_profile
+from cdc import cdc_feed
+import streaks
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     print("ERRO: DATABASE_URL não encontrada no .env")
     raise SystemExit("ERRO: DATABASE_URL não encontrada no .env")
 
 try:
-    # Cria a "engine" de conexão com o banco
-    engine = create_engine(DATABASE_URL)
-    print("Conexão com o banco de dados (engine) criada com sucesso.")
+    # Cria a "engine" assíncrona (asyncpg) com o pool compartilhado
+    # (tamanho, overflow, pre-ping e statement_timeout vêm do .env, ver database.py)
+    engine = database.init_engine(DATABASE_URL)
+    print(f"Conexão com o banco de dados (engine async) criada com sucesso. Pool: {database.pool_settings()}")
 except Exception as e:
     print(f"ERRO ao criar a engine: {e}")
     raise SystemExit
 
-app = FastAPI(title="BI Backend MVP")
+
+ROLLUP_REFRESH_SECONDS = int(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))
+ACTIVITY_REFRESH_SECONDS = int(os.getenv("ACTIVITY_REFRESH_SECONDS", "60"))
+HLL_REFRESH_SECONDS = int(os.getenv("HLL_REFRESH_SECONDS", "300"))
+FUNNEL_REFRESH_SECONDS = int(os.getenv("FUNNEL_REFRESH_SECONDS", "300"))
+PARTNER_SNAPSHOT_REFRESH_SECONDS = int(os.getenv("PARTNER_SNAPSHOT_REFRESH_SECONDS", "300"))
+B2B_STORE_REFRESH_SECONDS = int(os.getenv("B2B_STORE_REFRESH_SECONDS", "60"))
+USER_PROFILE_REFRESH_SECONDS = int(os.getenv("USER_PROFILE_REFRESH_SECONDS", "60"))
+USER_PROFILES_MAX_IDS = int(os.getenv("USER_PROFILES_MAX_IDS", "1000"))
+STREAKS_REFRESH_SECONDS = int(os.getenv("STREAKS_REFRESH_SECONDS", "300"))
+FACT_ENGINE_REFRESH_SECONDS = int(os.getenv("FACT_ENGINE_REFRESH_SECONDS", "30"))
+PARTNER_SNAPSHOT_LISTEN = os.getenv("PARTNER_SNAPSHOT_LISTEN", "true").strip().lower() in ("1", "true", "yes", "on")
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+async def refresh_rollups_job(full=False):
+    """ Atualiza os rollups diários e invalida o cache dos endpoints que leem deles. """
+    await rollups.refresh_rollups(full=full)
+    for path in rollups.ENDPOINTS_ROLLUP:
+        kpi_cache.invalidate(path)
+
+async def refresh_activity_job(full=False):
+    """ Atualiza os bitmaps diários de usuários ativos e invalida o cache dos endpoints que leem deles. """
+    start_day = await activity_bitmaps.refresh(full=full)
+    retention_engine.invalidate(start_day)
+    for path in ENDPOINTS_ACTIVITY:
+        kpi_cache.invalidate(path)
+
+async def refresh_hll_job(full=False):
+    """ Atualiza os sketches HyperLogLog diários e invalida o cache dos endpoints com modo approx. """
+    await hll.refresh_sketches(full=full)
+    for path in hll.ENDPOINTS_HLL:
+        kpi_cache.invalidate(path)
+
+async def refresh_funnel_job(full=False):
+    """ Materializa os funis (bi.funnel_daily) e invalida o cache dos endpoints de funil. """
+    await funnel.refresh_funnels(full=full)
+    for path in funnel.ENDPOINTS_FUNNEL:
+        kpi_cache.invalidate(path)
+
+async def refresh_partner_snapshot_job():
+    """ Recalcula o snapshot de todos os parceiros e invalida o cache dos endpoints do parceiro. """
+    await partner_snapshot.refresh_snapshots()
+    for path in partner_snapshot.ENDPOINTS_PARTNER:
+        kpi_cache.invalidate(path)
+
+async def refresh_b2b_store_job():
+    """ Atualiza o store de KPIs por cliente B2B e invalida o cache dos endpoints que leem dele. """
+    await client_store.refresh()
+    for path in ENDPOINTS_B2B:
+        kpi_cache.invalidate(path)
+
+async def refresh_user_profile_job(full=False):
+    """ Atualiza o perfil de atividade por usuário e invalida o cache dos endpoints do usuário final. """
+    await user_profile.refresh_profiles(full=full)
+    for path in user_profile.ENDPOINTS_PROFILE:
+        kpi_cache.invalidate(path)
+
+async def refresh_streaks_job(full=False):
+    """ Atualiza os streaks de check-in (sem o feed de mudanças) e invalida o cache dos endpoints de streak. """
+    if await streaks.refresh_streaks(full=full) is not None:
+        for path in streaks.ENDPOINTS_STREAKS:
+            kpi_cache.invalidate(path)
+
+async def refresh_fact_engine_job():
+    """ Atualiza o snapshot colunar do motor em memória e invalida o cache dos endpoints calculados por ele. """
+    await fact_engine.refresh()
+    for path in ENDPOINTS_ENGINE:
+        kpi_cache.invalidate(path)
+
+def invalidate_cdc_aggregates(applied):
+    """ Invalida o cache dos endpoints dos agregados que receberam mudanças do feed (cdc.py). """
+    for name in applied:
+        for path in cdc_feed.updaters[name]["endpoints"]:
+            kpi_cache.invalidate(path)
+
+def invalidate_partners(partner_ids):
+    """ Invalida só as respostas em cache dos parceiros notificados. """
+    for path in partner_snapshot.ENDPOINTS_PARTNER:
+        for partner_id in partner_ids:
+            kpi_cache.invalidate(make_key(path, {"partner_id": partner_id}))
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup: jobs de background (intervalo 0 no .env desliga o job)
+    tasks = start_background_jobs([
+        ("rollups", ROLLUP_REFRESH_SECONDS, refresh_rollups_job),
+        ("activity_bitmaps", ACTIVITY_REFRESH_SECONDS, refresh_activity_job),
+        ("hll_sketches", HLL_REFRESH_SECONDS, refresh_hll_job),
+        ("funnels", FUNNEL_REFRESH_SECONDS, refresh_funnel_job),
+        ("partner_snapshot", PARTNER_SNAPSHOT_REFRESH_SECONDS, refresh_partner_snapshot_job),
+        ("b2b_store", B2B_STORE_REFRESH_SECONDS, refresh_b2b_store_job),
+        ("user_profile", USER_PROFILE_REFRESH_SECONDS, refresh_user_profile_job),
+        ("streaks", STREAKS_REFRESH_SECONDS, refresh_streaks_job),
+        ("fact_engine", FACT_ENGINE_REFRESH_SECONDS if fact_engine.enabled else 0, refresh_fact_engine_job),
+    ])
+    if PARTNER_SNAPSHOT_LISTEN:
+        # Refresh por parceiro a cada notificação dos triggers (migração V004)
+        tasks.append(asyncio.create_task(
+            partner_snapshot.listen_for_changes(invalidate_partners), name="partner_snapshot_listener"
+        ))
+    # Feed de mudanças (migração V007): atualiza os agregados registrados pelo delta
+    tasks.append(asyncio.create_task(cdc_feed.run(invalidate_cdc_aggregates), name="cdc_feed"))
+    yield
+    # Shutdown: para os jobs e devolve as conexões do pool
+    await stop_background_jobs(tasks)
+    await database.dispose_engine()
+    print("Pool de conexões encerrado.")
+
+
+app = FastAPI(title="BI Backend MVP", lifespan=lifespan)
 print("Aplicação FastAPI iniciada.")
 
+# Métricas por rota e por query (ver metrics.py); o cache informa hits/misses
+kpi_cache.on_event = metrics.observe_cache
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    return await metrics.track_request(request, call_next)
+
 # --- Modelos de Enum para filtros ---
 class TimeGroup(str, Enum):
     day = "day"
     month = "month"
     hour = "hour"
 
+class CohortGroup(str, Enum):
+    week = "week"
+    month = "month"
+
+class B2BRanking(str, Enum):
+    taxa_adesao_pct = "taxa_adesao_pct"
+    total_ativos_30d = "total_ativos_30d"
+    total_colaboradores = "total_colaboradores"
+    total_revenue_cliente = "total_revenue_cliente"
+    custo_por_colaborador_ativo = "custo_por_colaborador_ativo"
+    new_score = "new_score"
+
 # --- ENDPOINTS EXISTENTES (Corrigidos e Mantidos) ---
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "API de BI está no ar. Acesse /docs para ver os endpoints."}
 
 @app.get("/bi/dau")
-def get_dau(days: int = 30):
+@negotiated
+@cached("/bi/dau")
+async def get_dau(days: int = 30, approx: bool = False):
     """
     Retorna o DAU (Usuários Ativos por Dia) dos últimos N dias.
-    Consulta 'consumers.user_time' (check-ins) para definir atividade.
+    Lê o rollup diário 'bi.daily_platform_activity' (calculado de 'consumers.user_time').
+    approx=true: estimativas dos sketches HLL diários (ver hll.py), com o erro padrão na resposta.
     """
+    if approx:
+        try:
+            rows = await hll.daily_counts("users", *hll.window(days))
+            rows = [r for r in reversed(rows) if r[1] > 0]
+            meta = {"approx": {"method": f"hyperloglog (p={hll.PRECISION})", "std_error_pct": round(hll.STD_ERROR * 100, 2)}}
+            return TimeSeries([r[0] for r in rows], [r[1] for r in rows], meta=meta)
+        except Exception as e:
+            print(f"ERRO no endpoint /bi/dau (approx): {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
     params = {"days": days}
     sql = """
         SELECT 
-            DATE(created_at) as day, 
-            COUNT(DISTINCT user_id) as dau
-        FROM consumers.user_time
-        WHERE created_at >= (CURRENT_DATE - INTERVAL '1 day' * :days)
-        GROUP BY day 
+            day, 
+            active_users as dau
+        FROM bi.daily_platform_activity
+        WHERE day >= (CURRENT_DATE - INTERVAL '1 day' * :days)
+          AND active_users > 0
         ORDER BY day DESC
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql, params)
+        return TimeSeries([r[0] for r in rows], [int(r[1]) for r in rows])
     except Exception as e:
         print(f"ERRO no endpoint /bi/dau: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def rollup_source(partner_id, params):
+    """
+    Escolhe o rollup diário: por parceiro (bi.daily_partner_activity)
+    ou da plataforma inteira (bi.daily_platform_activity).
+    """
+    if partner_id:
+        params["partner_id"] = partner_id
+        return "bi.daily_partner_activity", ["partner_id = :partner_id"]
+    return "bi.daily_platform_activity", []
+
 @app.get("/bi/checkins")
-def get_checkins(partner_id: int = None, days: int = 30):
+@negotiated
+@cached("/bi/checkins")
+async def get_checkins(partner_id: int = None, days: int = 30):
     """
     Retorna o número de checkins por dia dos últimos N dias.
-    Consulta 'consumers.user_time' e filtra por partner_id (se fornecido).
+    Lê os rollups diários e filtra por partner_id (se fornecido).
     """
     params = {"days": days}
-    
-    # [CORREÇÃO]: A FK de partner_id em user_time foi corrigida,
-    # então este filtro agora funciona perfeitamente.
-    sql = """
-        SELECT 
-            DATE(created_at) as day, 
-            COUNT(id) as total_checkins 
-        FROM consumers.user_time
-    """
-    
-    where_clauses = ["type = 'CHECKIN'"]
-    
-    if partner_id:
-        where_clauses.append("partner_id = :partner_id")
-        params["partner_id"] = partner_id
-    
+    table, where_clauses = rollup_source(partner_id, params)
+    where_clauses.append("checkins > 0")
+
+    sql = f"SELECT day, checkins FROM {table}"
     sql += " WHERE " + " AND ".join(where_clauses)
-    sql += " GROUP BY day ORDER BY day DESC LIMIT :days"
+    sql += " ORDER BY day DESC LIMIT :days"
     
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql, params)
+        return TimeSeries([r[0] for r in rows], [int(r[1]) for r in rows])
     except Exception as e:
         print(f"ERRO no endpoint /bi/checkins: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/revenue")
-def get_revenue(partner_id: int = None, days: int = 30):
+@negotiated
+@cached("/bi/revenue")
+async def get_revenue(partner_id: int = None, days: int = 30):
     """
     Retorna o faturamento (revenue) por dia dos últimos N dias.
-    Consulta 'consumers.payment' e faz JOIN para encontrar o partner_id.
+    Lê os rollups diários (pagamentos PAID), filtrando por partner_id (se fornecido).
     """
     params = {"days": days}
-    
-    sql = """
-        SELECT 
-            DATE(p.created_at) as day, 
-            SUM(p.amount_due) as total_revenue 
-        FROM consumers.payment p
-    """
-    
-    where_clauses = ["p.status = 'PAID'"]
-    
-    if partner_id:
-        sql += """
-            JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
-            JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
-        """
-        where_clauses.append("ps.partner_id = :partner_id")
-        params["partner_id"] = partner_id
-    
+    table, where_clauses = rollup_source(partner_id, params)
+    where_clauses.append("payments_paid > 0")
+
+    sql = f"SELECT day, revenue_paid FROM {table}"
     sql += " WHERE " + " AND ".join(where_clauses)
-    sql += " GROUP BY day ORDER BY day DESC LIMIT :days"
+    sql += " ORDER BY day DESC LIMIT :days"
     
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [float(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql, params)
+        return TimeSeries([r[0] for r in rows], [float(r[1]) for r in rows], value_type="float")
     except Exception as e:
         print(f"ERRO no endpoint /bi/revenue: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/reservations")
-def get_reservations(partner_id: int = None, days: int = 30):
+@negotiated
+@cached("/bi/reservations")
+async def get_reservations(partner_id: int = None, days: int = 30):
     """
     Retorna o número de reservas por dia dos últimos N dias.
-    Consulta 'consumers.user_scheduling' e faz JOIN com 'providers.partner_schedule'.
+    Lê os rollups diários, filtrando por partner_id (se fornecido).
     """
     params = {"days": days}
-    
-    sql = """
-        SELECT 
-            DATE(s.created_at) as day, 
-            COUNT(s.id) as total_reservations
-        FROM consumers.user_scheduling s
-    """
-    
-    where_clauses = []
-    
-    if partner_id:
-        sql += " JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id"
-        where_clauses.append("ps.partner_id = :partner_id")
-        params["partner_id"] = partner_id
-    
-    if where_clauses:
-        sql += " WHERE " + " AND ".join(where_clauses)
-        
-    sql += " GROUP BY day ORDER BY day DESC LIMIT :days"
+    table, where_clauses = rollup_source(partner_id, params)
+    where_clauses.append("reservations > 0")
+
+    sql = f"SELECT day, reservations FROM {table}"
+    sql += " WHERE " + " AND ".join(where_clauses)
+    sql += " ORDER BY day DESC LIMIT :days"
     
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql, params)
+        return TimeSeries([r[0] for r in rows], [int(r[1]) for r in rows])
     except Exception as e:
         print(f"ERRO no endpoint /bi/reservations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -186,46 +317,51 @@ def get_reservations(partner_id: int = None, days: int = 30):
 # --- KPIs GERAIS (Admin) ---
 
 @app.get("/bi/kpi_overview")
-def get_kpi_overview():
+@cached("/bi/kpi_overview")
+async def get_kpi_overview():
     """
     Retorna os KPIs principais da plataforma (Total de Usuários, Receita, Parceiros).
-    """
-    sql = """
-        SELECT 
-            (SELECT COUNT(id) FROM consumers.user) as total_users,
-            (SELECT SUM(amount_due) FROM consumers.payment WHERE status = 'PAID') as total_revenue,
-            (SELECT COUNT(id) FROM providers.partner) as total_partners;
+    Os totais são compartilhados com o /bi/ltv_cac (ver platform_totals.py).
     """
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(sql)).fetchone()
-            if result:
-                return {
-                    "total_users": int(result[0]),
-                    "total_revenue": float(result[1]),
-                    "total_partners": int(result[2])
-                }
-            return {"total_users": 0, "total_revenue": 0, "total_partners": 0}
+        totals = await platform_totals.get()
+        return {
+            "total_users": totals["total_users"],
+            "total_revenue": totals["total_revenue"],
+            "total_partners": totals["total_partners"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/new_users_over_time")
-def get_new_users_over_time(group_by: TimeGroup = TimeGroup.day):
+@negotiated
+@cached("/bi/new_users_over_time")
+async def get_new_users_over_time(group_by: TimeGroup = TimeGroup.day):
     """
     Retorna a contagem de novos usuários (Cadastros) agrupados por dia, mês ou hora.
+    Com FACT_ENGINE_ENABLED=true, vem do motor em memória (ver fact_engine.py).
     """
+    if fact_engine.enabled:
+        try:
+            return await fact_engine.new_users(group_by.value)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
     if group_by == TimeGroup.hour:
         # Agrupamento por hora do dia (0-23)
-        sql_fragment = "EXTRACT(HOUR FROM created_at)"
+        sql_fragment = "EXTRACT(HOUR FROM created_at)::int"
         order_fragment = "hour_of_day"
+        label_type = "int"
     elif group_by == TimeGroup.month:
         # Agrupamento por mês
         sql_fragment = "DATE_TRUNC('month', created_at)"
         order_fragment = "month"
+        label_type = "timestamp"
     else:
         # Agrupamento por dia (padrão)
         sql_fragment = "DATE(created_at)"
         order_fragment = "day"
+        label_type = "date"
 
     sql = f"""
         SELECT 
@@ -236,109 +372,170 @@ def get_new_users_over_time(group_by: TimeGroup = TimeGroup.day):
         ORDER BY time_group;
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql)
+        return TimeSeries([r[0] for r in rows], [int(r[1]) for r in rows], label_type=label_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/active_users")
-def get_active_users(days: int = 30):
+@cached("/bi/active_users")
+async def get_active_users(days: int = 30, partner_id: int = None, client_id: int = None, approx: bool = False):
     """
-    Retorna DAU, WAU (7 dias) e MAU (30 dias)
+    Retorna DAU, WAU (7 dias) e MAU (30 dias), mais os ativos em uma janela de N dias.
+    As janelas vão de (hoje - N dias) até hoje.
+    - Plataforma: bitmaps diários (ver activity.py), cada janela é um OR + popcount.
+    - partner_id / client_id: COUNT(DISTINCT) nas janelas (uma varredura com FILTER).
+    - approx=true: merge dos sketches HLL diários (ver hll.py), com o intervalo de 95% de cada valor.
     """
-    params = {"days": days}
-    sql = """
-        SELECT 
-            (SELECT COUNT(DISTINCT user_id) 
-             FROM consumers.user_time 
-             WHERE created_at >= (CURRENT_DATE - INTERVAL '1 day')) as dau,
-             
-            (SELECT COUNT(DISTINCT user_id) 
-             FROM consumers.user_time 
-             WHERE created_at >= (CURRENT_DATE - INTERVAL '7 day')) as wau,
-             
-            (SELECT COUNT(DISTINCT user_id) 
-             FROM consumers.user_time 
-             WHERE created_at >= (CURRENT_DATE - INTERVAL '30 day')) as mau;
+    if partner_id and client_id:
+        raise HTTPException(status_code=400, detail="Use partner_id ou client_id, não os dois.")
+    windows = {"dau": 1, "wau": 7, "mau": 30, "window": days}
+    try:
+        if approx:
+            metric, dimension_id = "users", 0
+            if partner_id:
+                metric, dimension_id = "partner_users", partner_id
+            elif client_id:
+                metric, dimension_id = "client_users", client_id
+            counts = {}
+            for name, n in windows.items():
+                counts[name] = await hll.count_distinct(metric, *hll.window(n), dimension_id)
+        elif partner_id or client_id:
+            counts = await count_active_users_sql(windows, partner_id, client_id)
+        else:
+            await activity_bitmaps.ready()
+            counts = {name: activity_bitmaps.active_users(*hll.window(n)) for name, n in windows.items()}
+
+        result = {
+            "dau": counts["dau"],
+            "wau": counts["wau"],
+            "mau": counts["mau"],
+            "window": {"days": days, "active_users": counts["window"]},
+        }
+        if approx:
+            result["approx"] = hll.error_info(counts)
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def count_active_users_sql(windows, partner_id, client_id):
+    """ Usuários distintos por janela para um parceiro ou cliente B2B (modo exato). """
+    params = {"max_days": max(windows.values())}
+    if partner_id:
+        params["partner_id"] = partner_id
+        segment = "ut.partner_id = :partner_id"
+    else:
+        params["client_id"] = client_id
+        segment = "ut.user_id IN (SELECT user_id FROM companies.companies_client_collaborator WHERE client_id = :client_id)"
+    columns = []
+    for name, n in windows.items():
+        params[f"days_{name}"] = n
+        columns.append(
+            f"COUNT(DISTINCT ut.user_id) FILTER (WHERE ut.created_at >= CURRENT_DATE - INTERVAL '1 day' * :days_{name})"
+        )
+    sql = f"""
+        SELECT {', '.join(columns)}
+        FROM consumers.user_time ut
+        WHERE ut.created_at >= (CURRENT_DATE - INTERVAL '1 day' * :max_days)
+          AND {segment}
     """
+    r = await fetch_one(sql, params)
+    return {name: int(value or 0) for name, value in zip(windows, r)}
+
+@app.get("/bi/stickiness")
+@negotiated
+@cached("/bi/stickiness")
+async def get_stickiness(days: int = 90, window: int = 30):
+    """
+    Stickiness (DAU / ativos nos últimos 'window' dias) de cada um dos últimos N dias.
+    Janela deslizante sobre os bitmaps diários (ver activity.py).
+    """
+    if not (1 <= days <= 730 and 1 <= window <= 365):
+        raise HTTPException(status_code=400, detail="Use 1 <= days <= 730 e 1 <= window <= 365.")
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(sql)).fetchone()
-            if result:
-                return {"dau": result[0], "wau": result[1], "mau": result[2]}
-            return {"dau": 0, "wau": 0, "mau": 0}
+        await activity_bitmaps.ready()
+        today = date.today()
+        rows = await asyncio.to_thread(activity_bitmaps.stickiness, today - timedelta(days=days - 1), today, window)
+        return TimeSeries(
+            [day for day, _, _ in rows],
+            [round(dau / active, 4) if active else 0.0 for _, dau, active in rows],
+            value_type="float",
+        )
     except Exception as e:
+        print(f"ERRO no endpoint /bi/stickiness: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/retention_d1_d7_d30")
-def get_retention():
+@cached("/bi/retention_d1_d7_d30")
+async def get_retention():
     """
     Calcula a retenção D1, D7 e D30 (simplificada).
     Verifica quantos usuários que se cadastraram há X dias,
     fizeram check-in (tiveram atividade) hoje.
+    Usa os cadastros e os bitmaps diários do motor de retenção (ver retention.py).
     """
-    sql = """
-        WITH 
-        D1_Cohort AS (
-            -- Usuários que se cadastraram ontem
-            SELECT id FROM consumers.user 
-            WHERE DATE(created_at) = (CURRENT_DATE - INTERVAL '1 day')
-        ),
-        D7_Cohort AS (
-            -- Usuários que se cadastraram 7 dias atrás
-            SELECT id FROM consumers.user 
-            WHERE DATE(created_at) = (CURRENT_DATE - INTERVAL '7 day')
-        ),
-        D30_Cohort AS (
-            -- Usuários que se cadastraram 30 dias atrás
-            SELECT id FROM consumers.user 
-            WHERE DATE(created_at) = (CURRENT_DATE - INTERVAL '30 day')
-        ),
-        Today_Activity AS (
-            -- Usuários ativos hoje
-            SELECT DISTINCT user_id FROM consumers.user_time 
-            WHERE DATE(created_at) = CURRENT_DATE
-        )
-        SELECT
-            (SELECT COUNT(*) FROM D1_Cohort) as d1_total,
-            (SELECT COUNT(t.user_id) FROM Today_Activity t JOIN D1_Cohort c ON t.user_id = c.id) as d1_retained,
-            
-            (SELECT COUNT(*) FROM D7_Cohort) as d7_total,
-            (SELECT COUNT(t.user_id) FROM Today_Activity t JOIN D7_Cohort c ON t.user_id = c.id) as d7_retained,
-
-            (SELECT COUNT(*) FROM D30_Cohort) as d30_total,
-            (SELECT COUNT(t.user_id) FROM Today_Activity t JOIN D30_Cohort c ON t.user_id = c.id) as d30_retained;
-    """
-    try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql)).fetchone()
-            if r:
-                # Calcula a % de retenção, evitando divisão por zero
-                d1_pct = (r[1] / r[0] * 100) if r[0] > 0 else 0
-                d7_pct = (r[3] / r[2] * 100) if r[2] > 0 else 0
-                d30_pct = (r[5] / r[4] * 100) if r[4] > 0 else 0
-                
-                return {
-                    "d1": {"total": r[0], "retained": r[1], "pct": d1_pct},
-                    "d7": {"total": r[2], "retained": r[3], "pct": d7_pct},
-                    "d30": {"total": r[4], "retained": r[5], "pct": d30_pct}
-                }
-            return {}
+    try:
+        await activity_bitmaps.ready()
+        await retention_engine.refresh_signups()
+        result = {}
+        for age in (1, 7, 30):
+            total, retained = retention_engine.day_retention(age)
+            # Calcula a % de retenção, evitando divisão por zero
+            pct = (retained / total * 100) if total > 0 else 0
+            result[f"d{age}"] = {"total": total, "retained": retained, "pct": pct}
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/bi/retention/cohorts")
+@cached("/bi/retention/cohorts")
+async def get_retention_cohorts(
+    granularity: CohortGroup = CohortGroup.week,
+    periods: int = 12,
+    partner_id: int = None,
+    client_id: int = None,
+    zip_code: str = None,
+):
+    """
+    Triângulo de retenção por coorte de cadastro (semanal ou mensal) das últimas N coortes.
+    retained[k] = usuários da coorte ativos k períodos depois do cadastro (k = 0 é o próprio período;
+    o último período ainda está em andamento). Segmentos: parceiro, cliente B2B e prefixo do CEP.
+    """
+    if not 1 <= periods <= 104:
+        raise HTTPException(status_code=400, detail="Use 1 <= periods <= 104.")
+    segment = {"partner_id": partner_id, "client_id": client_id, "zip_code": zip_code}
+    try:
+        matrix = await retention_engine.cohort_matrix(granularity.value, periods, segment)
+        cohorts = []
+        for cohort, size, retained in zip(matrix["cohorts"], matrix["sizes"], matrix["retained"]):
+            size = int(size)
+            cohorts.append({
+                "cohort": str(cohort),
+                "size": size,
+                "retained": [int(n) for n in retained],
+                "pct": [round(int(n) / size * 100, 2) if size > 0 else 0 for n in retained],
+            })
+        return {"granularity": granularity.value, "cohorts": cohorts}
+    except Exception as e:
+        print(f"ERRO no endpoint /bi/retention/cohorts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # [ADIÇÃO - Linha 293]
 
 @app.get("/bi/revenue_by_region")
-def get_revenue_by_region():
+@cached("/bi/revenue_by_region")
+async def get_revenue_by_region():
     """
     Retorna a receita total (LTV) agrupada por região (CEP).
     Este é um "Hard Win" (Receita por Região).
+    Com FACT_ENGINE_ENABLED=true, vem do motor em memória (ver fact_engine.py).
     """
+    if fact_engine.enabled:
+        try:
+            return await fact_engine.revenue_by_region()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
     # Este SQL junta Pagamento -> Agendamento -> Usuário (para pegar o zip_code)
     sql = """
         SELECT 
@@ -354,77 +551,83 @@ def get_revenue_by_region():
         LIMIT 10; -- Pega só as 10 top regiões
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [float(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql)
+        return {
+            "labels": [str(r[0]) for r in rows], 
+            "values": [float(r[1]) for r in rows]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # [ADIÇÃO - Linha 325]
 
 @app.get("/bi/conversion_funnel")
-def get_conversion_funnel():
-    """ Retorna dados para o Funil de Conversão (Hard Win) """
-    sql = """
-        SELECT 
-            (SELECT COUNT(DISTINCT session_id) 
-             FROM analytics.web_events 
-             WHERE event_name = 'visitou_site') as step_1_visited,
-             
-            (SELECT COUNT(DISTINCT session_id) 
-             FROM analytics.web_events 
-             WHERE event_name = 'iniciou_cadastro') as step_2_started_form,
-             
-            (SELECT COUNT(DISTINCT user_id) 
-             FROM analytics.web_events 
-             WHERE event_name = 'completou_cadastro') as step_3_completed_signup;
-    """
-    try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql)).fetchone()
-            if r:
-                return {
-                    "labels": ["Visitou o Site", "Iniciou Cadastro", "Completou Cadastro"],
-                    "values": [int(r[0]), int(r[1]), int(r[2])]
-                }
-            return {}
+@cached("/bi/conversion_funnel")
+async def get_conversion_funnel(approx: bool = False):
+    """
+    Retorna dados para o Funil de Conversão (Hard Win)
+    Sessões que passaram pelas etapas EM ORDEM, lidas do funil materializado "cadastro" (ver funnel.py).
+    approx=true: merge dos sketches HLL diários de cada etapa, com as mesmas sessões em ordem
+    (gravados pelo refresh do funnel.py, ver hll.py).
+    """
+    labels = ["Visitou o Site", "Iniciou Cadastro", "Completou Cadastro"]
+    if approx:
+        try:
+            start, end = hll.FULL_REFRESH_START, date.today()
+            values = [
+                await hll.count_distinct(metric, start, end)
+                for metric in ("funnel_visited", "funnel_started", "funnel_completed")
+            ]
+            return {"labels": labels, "values": values, "approx": hll.error_info(dict(zip(labels, values)))}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    try:
+        steps = await funnel.query_funnel("cadastro")
+        return {
+            "labels": labels,
+            "values": [step["sessions"] for step in steps]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/funnel")
+@cached("/bi/funnel")
+async def get_funnel(name: str = "cadastro", start: date = None, end: date = None):
+    """
+    Funil configurado (funnel.FUNNELS) por dia de entrada entre 'start' e 'end' (opcionais):
+    sessões por etapa, conversão etapa a etapa e tempo entre etapas. Lê só bi.funnel_daily.
+    """
+    if name not in funnel.FUNNELS:
+        raise HTTPException(status_code=404, detail=f"Funil desconhecido: {name}. Disponíveis: {', '.join(funnel.FUNNELS)}.")
+    try:
+        return {"funnel": name, "start": start, "end": end, "steps": await funnel.query_funnel(name, start, end)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/ltv_cac")
-def get_ltv_cac():
-    """ Retorna o LTV (Lifetime Value) e CAC (Custo Aquisição) (Hard Win) """
-    sql = """
-        SELECT
-            -- LTV: (Receita Total / Total de Clientes)
-            (SELECT SUM(amount_due) FROM consumers.payment WHERE status = 'PAID') / 
-            (SELECT COUNT(id) FROM consumers.user) as ltv,
-            
-            -- CAC (30d): (Custo Marketing 30d / Novos Clientes 30d)
-            (SELECT SUM(cost) FROM analytics.marketing_costs 
-             WHERE date >= (CURRENT_DATE - INTERVAL '30 day')) /
-            (SELECT COUNT(id) FROM consumers.user 
-             WHERE created_at >= (CURRENT_DATE - INTERVAL '30 day')) as cac_30d;
-    """
-    try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql)).fetchone()
-            if r:
-                return {
-                    "ltv": float(r[0]) if r[0] is not None else 0,
-                    "cac_30d": float(r[1]) if r[1] is not None else 0
-                }
-            return {}
+@cached("/bi/ltv_cac")
+async def get_ltv_cac():
+    """
+    Retorna o LTV (Lifetime Value) e CAC (Custo Aquisição) (Hard Win)
+    Calculados sobre os totais compartilhados com o /bi/kpi_overview (ver platform_totals.py).
+    """
+    try:
+        totals = await platform_totals.get()
+        # LTV: (Receita Total / Total de Clientes)
+        # CAC (30d): (Custo Marketing 30d / Novos Clientes 30d)
+        return {
+            "ltv": totals["total_revenue"] / totals["total_users"] if totals["total_users"] else 0,
+            "cac_30d": totals["marketing_cost_30d"] / totals["new_users_30d"] if totals["new_users_30d"] else 0
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 # [ADIÇÃO - Linha 372]
 
 @app.get("/bi/gamification/missions")
-def get_gamification_missions():
+@cached("/bi/gamification/missions")
+async def get_gamification_missions():
     """ Retorna o status das Missões (Hard Win) """
     sql = """
         SELECT 
@@ -436,444 +639,466 @@ def get_gamification_missions():
         ORDER BY total_completions DESC;
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        rows = await fetch_all(sql)
+        return {
+            "labels": [str(r[0]) for r in rows], 
+            "values": [int(r[1]) for r in rows]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/gamification/streaks")
-def get_gamification_streaks():
-    """ 
-    Retorna o 'Stickiness' (dias ativos nos últimos 7d)
-    Isso é um proxy para 'Streaks' (Hard Win)
+@cached("/bi/gamification/streaks")
+async def get_gamification_streaks():
     """
-    sql = """
-        WITH UserActivity AS (
-            SELECT 
-                user_id, 
-                COUNT(DISTINCT DATE(created_at)) as active_days_last_7d
-            FROM consumers.user_time
-            WHERE created_at >= (CURRENT_DATE - INTERVAL '7 day')
-            AND type = 'CHECKIN'
-            GROUP BY user_id
-        )
-        SELECT 
-            active_days_last_7d, 
-            COUNT(user_id) as total_users
-        FROM UserActivity
-        GROUP BY active_days_last_7d
-        ORDER BY active_days_last_7d DESC;
+    Distribuição das streaks de check-in (dias seguidos): "labels"/"values" = streaks atuais
+    (último check-in hoje ou ontem), "longest" = maior streak de cada usuário. Ver streaks.py.
     """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            # O resultado será (ex: "7 dias", 5 usuários)
-            return {
-                "labels": [f"{r[0]} dias" for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+        return await streaks.histograms()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))    
+        raise HTTPException(status_code=500, detail=str(e))
 
 # --- KPIs do PARCEIRO (Partner View) ---
 
 @app.get("/bi/partners_list")
-def get_partners_list():
+@cached("/bi/partners_list")
+async def get_partners_list():
     """ Retorna uma lista de todos os parceiros para filtros de dashboard. """
     sql = "SELECT id, name FROM providers.partner WHERE active = TRUE ORDER BY name;"
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return [{"id": r[0], "name": r[1]} for r in rows]
+        rows = await fetch_all(sql)
+        return [{"id": r[0], "name": r[1]} for r in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def partner_kpis(partner_id):
+    """ Status das reservas e ocupação por hora do parceiro: motor em memória (se ligado) ou snapshot. """
+    if fact_engine.enabled:
+        return await fact_engine.partner(partner_id)
+    return await partner_snapshot.get_snapshot(partner_id)
+
 @app.get("/bi/partner/reservation_status")
-def get_partner_reservation_status(partner_id: int):
+@cached("/bi/partner/reservation_status")
+async def get_partner_reservation_status(partner_id: int):
     """
     Retorna a contagem de reservas por status (Confirmadas vs No-Show)
-    para um parceiro específico.
+    para um parceiro específico (lida do snapshot, ver partner_snapshot.py,
+    ou do motor em memória com FACT_ENGINE_ENABLED=true, ver fact_engine.py).
     """
-    params = {"partner_id": partner_id}
-    sql = """
-        SELECT 
-            s.status, 
-            COUNT(s.id) as total
-        FROM consumers.user_scheduling s
-        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
-        WHERE ps.partner_id = :partner_id
-        GROUP BY s.status;
-    """
-    try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            # Nota: O generate_fake_data só cria status 'CONFIRMED'.
-            # Para 'NO-SHOW' aparecer, seria preciso mais dados.
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+    try:
+        snapshot = await partner_kpis(partner_id)
+        status = snapshot["status"] if snapshot else []
+        # Nota: O generate_fake_data só cria status 'CONFIRMED'.
+        # Para 'NO-SHOW' aparecer, seria preciso mais dados.
+        return {
+            "labels": [str(label) for label, _ in status], 
+            "values": [int(total) for _, total in status]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/partner/occupation_by_hour")
-def get_partner_occupation_by_hour(partner_id: int):
+@cached("/bi/partner/occupation_by_hour")
+async def get_partner_occupation_by_hour(partner_id: int):
     """
     Retorna a taxa de ocupação (total de reservas) por hora do dia
-    para um parceiro específico.
+    para um parceiro específico (lida do snapshot, ver partner_snapshot.py,
+    ou do motor em memória com FACT_ENGINE_ENABLED=true, ver fact_engine.py).
     """
-    params = {"partner_id": partner_id}
-    sql = """
-        SELECT 
-            ps.hour, 
-            COUNT(s.id) as total_reservas
-        FROM consumers.user_scheduling s
-        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
-        WHERE ps.partner_id = :partner_id
-        AND ps.hour IS NOT NULL
-        GROUP BY ps.hour
-        ORDER BY ps.hour;
-    """
-    try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [f"{r[0]}:00" for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+    try:
+        snapshot = await partner_kpis(partner_id)
+        occupation = snapshot["occupation"] if snapshot else []
+        return {
+            "labels": [f"{hour}:00" for hour, _ in occupation], 
+            "values": [int(total) for _, total in occupation]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # [ADIÇÃO - Linha 325]
 
 @app.get("/bi/partner/kpi_overview")
-def get_partner_kpi_overview(partner_id: int):
+@cached("/bi/partner/kpi_overview")
+async def get_partner_kpi_overview(partner_id: int):
     """
-    Retorna KPIs extras do Parceiro (NPS, Repasses) - (Easy Wins)
-    """
-    params = {"partner_id": partner_id}
-    sql = """
-        WITH
-        PartnerNPS AS (
-            -- Calcula a média de NPS para o parceiro
-            SELECT AVG(rating) as nps_avg
-            FROM consumers.user_health_feedback
-            WHERE related_entity_id = :partner_id
-              AND feedback_type = 'NPS_PARTNER'
-        ),
-        PartnerRepasse AS (
-            -- Soma o valor repassado (transferred_value) nos últimos 30 dias
-            SELECT SUM(p.transferred_value) as total_repassado
-            FROM consumers.payment p
-            JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
-            JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
-            WHERE ps.partner_id = :partner_id
-              AND p.status = 'PAID'
-              AND p.created_at >= (CURRENT_DATE - INTERVAL '30 day')
-        )
-        SELECT
-            (SELECT nps_avg FROM PartnerNPS) as nps,
-            (SELECT total_repassado FROM PartnerRepasse) as repasse_30d;
+    Retorna KPIs extras do Parceiro (NPS, Repasses, Receita) - (Easy Wins)
+    Leitura pela chave primária do snapshot (ver partner_snapshot.py).
     """
     try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql), params).fetchone()
-            if r:
-                return {
-                    "nps_avg": round(r[0] if r[0] is not None else 0, 1),
-                    "total_repassado_30d": round(r[1] if r[1] is not None else 0, 2)
-                }
-            return {"nps_avg": 0, "total_repassado_30d": 0}
+        snapshot = await partner_snapshot.get_snapshot(partner_id)
+        if snapshot:
+            return {
+                "nps_avg": round(snapshot["nps_avg"] if snapshot["nps_avg"] is not None else 0, 1),
+                "total_repassado_30d": round(snapshot["repasse_30d"], 2),
+                "receita_30d": round(snapshot["revenue_30d"], 2),
+                "snapshot_at": snapshot["refreshed_at"]
+            }
+        return {"nps_avg": 0, "total_repassado_30d": 0, "receita_30d": 0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- KPIs do CLIENTE B2B (B2B View) ---
 
 @app.get("/bi/b2b/clients_list")
-def get_b2b_clients_list():
+@cached("/bi/b2b/clients_list")
+async def get_b2b_clients_list():
     """ Retorna uma lista de todos os clientes B2B para filtros de dashboard. """
     # Corrigido para usar os nomes de tabela corretos
     sql = "SELECT id, name FROM companies.companies_client WHERE active = TRUE ORDER BY name;"
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return [{"id": r[0], "name": r[1]} for r in rows]
+        rows = await fetch_all(sql)
+        return [{"id": r[0], "name": r[1]} for r in rows]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/b2b/engagement_stats")
-def get_b2b_engagement_stats(client_id: int):
+@cached("/bi/b2b/engagement_stats")
+async def get_b2b_engagement_stats(client_id: int, approx: bool = False):
     """
     Retorna estatísticas de engajamento (Adesão, Engajamento)
-    para um cliente B2B específico.
+    para um cliente B2B específico (lidas do store por cliente, ver b2b_store.py).
+    approx=true: ativos em 30 dias pelo merge dos sketches HLL diários do cliente (ver hll.py).
     """
     params = {"client_id": client_id}
-    sql = """
-        WITH 
-        EligibleBase AS (
-            -- Base total de colaboradores elegíveis (cadastrados)
-            SELECT user_id 
-            FROM companies.companies_client_collaborator
-            WHERE client_id = :client_id
-        ),
-        ActiveBase AS (
-            -- Colaboradores da base que tiveram atividade (check-in) nos últimos 30 dias
-            SELECT DISTINCT eb.user_id
-            FROM EligibleBase eb
-            JOIN consumers.user_time ut ON eb.user_id = ut.user_id
-            WHERE ut.created_at >= (CURRENT_DATE - INTERVAL '30 day')
-        )
-        SELECT
-            (SELECT COUNT(*) FROM EligibleBase) as total_elegivel,
-            (SELECT COUNT(*) FROM ActiveBase) as total_ativo_30d;
-    """
+    if approx:
+        try:
+            total_elegivel = (await fetch_one(
+                "SELECT COUNT(*) FROM companies.companies_client_collaborator WHERE client_id = :client_id", params
+            ))[0]
+            total_ativo_30d = min(total_elegivel, await hll.count_distinct("client_users", *hll.window(30), client_id))
+            adesao_pct = (total_ativo_30d / total_elegivel * 100) if total_elegivel > 0 else 0
+            return {
+                "total_colaboradores": total_elegivel,
+                "total_ativos_30d": total_ativo_30d,
+                "taxa_adesao_pct": adesao_pct,
+                "approx": hll.error_info({"total_ativos_30d": total_ativo_30d}),
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
     try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql), params).fetchone()
-            if r:
-                total_elegivel = r[0]
-                total_ativo_30d = r[1]
-                # Adesão = % de usuários elegíveis que se ativaram
-                adesao_pct = (total_ativo_30d / total_elegivel * 100) if total_elegivel > 0 else 0
-                
-                return {
-                    "total_colaboradores": total_elegivel,
-                    "total_ativos_30d": total_ativo_30d,
-                    "taxa_adesao_pct": adesao_pct
-                }
-            return {}
+        kpis = await client_store.client(client_id)
+        return {
+            "total_colaboradores": kpis["total_colaboradores"],
+            "total_ativos_30d": kpis["total_ativos_30d"],
+            "taxa_adesao_pct": kpis["taxa_adesao_pct"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/b2b/cost_per_collaborator")
-def get_b2b_cost_per_collaborator(client_id: int):
+@cached("/bi/b2b/cost_per_collaborator")
+async def get_b2b_cost_per_collaborator(client_id: int):
     """
     Calcula o Custo por Colaborador Ativo (Receita total / Colaboradores ativos).
-    """
-    params = {"client_id": client_id}
-    sql = """
-        WITH 
-        ClientRevenue AS (
-            -- Receita total gerada pelos colaboradores deste cliente
-            SELECT SUM(p.amount_due) as total_revenue
-            FROM consumers.payment p
-            JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
-            JOIN consumers.user u ON s.user_id = u.id
-            JOIN companies.companies_client_collaborator c ON u.id = c.user_id
-            WHERE c.client_id = :client_id AND p.status = 'PAID'
-        ),
-        ActiveBase AS (
-            -- Colaboradores ativos (check-in) nos últimos 30 dias
-            SELECT COUNT(DISTINCT c.user_id) as total_ativos
-            FROM companies.companies_client_collaborator c
-            JOIN consumers.user_time ut ON c.user_id = ut.user_id
-            WHERE c.client_id = :client_id
-            AND ut.created_at >= (CURRENT_DATE - INTERVAL '30 day')
-        )
-        SELECT 
-            (SELECT total_revenue FROM ClientRevenue) as revenue,
-            (SELECT total_ativos FROM ActiveBase) as ativos;
+    Lido do store por cliente (ver b2b_store.py).
     """
     try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql), params).fetchone()
-            if r:
-                total_revenue = r[0] if r[0] is not None else 0
-                total_ativos = r[1] if r[1] > 0 else 0
-                
-                custo_por_ativo = (total_revenue / total_ativos) if total_ativos > 0 else 0
-                
-                return {
-                    "total_revenue_cliente": float(total_revenue),
-                    "total_colaboradores_ativos": int(total_ativos),
-                    "custo_por_colaborador_ativo": float(custo_por_ativo)
-                }
-            return {}
+        kpis = await client_store.client(client_id)
+        return {
+            "total_revenue_cliente": kpis["total_revenue_cliente"],
+            "total_colaboradores_ativos": kpis["total_ativos_30d"],
+            "custo_por_colaborador_ativo": kpis["custo_por_colaborador_ativo"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # [ADIÇÃO - Linha 477]
 
 @app.get("/bi/b2b/campaign_participation")
-def get_b2b_campaign_participation(client_id: int):
-    """ Retorna a participação em Campanhas B2B (Hard Win) """
-    params = {"client_id": client_id}
-    # [CÓDIGO CORRIGIDO - REMOVENDO O JOIN BUGADO]
-    sql = """
-    SELECT
-        c.name,
-        COUNT(up.user_id) as total_participantes
-    FROM companies.campaigns c -- Pega as campanhas do cliente
-    -- Traz os participantes DESSA campanha (se houver)
-    LEFT JOIN companies.user_campaign_participation up ON c.id = up.campaign_id
-    WHERE c.client_id = :client_id
-    -- (Removemos a junção 'ccc' que matava o LEFT JOIN.
-    --  Assumimos que o gerador de dados só insere participantes válidos)
-    GROUP BY c.name
-    ORDER BY total_participantes DESC;
-    """
-    try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+@cached("/bi/b2b/campaign_participation")
+async def get_b2b_campaign_participation(client_id: int):
+    """ Retorna a participação em Campanhas B2B (Hard Win), lida do store por cliente (ver b2b_store.py). """
+    try:
+        kpis = await client_store.client(client_id)
+        return kpis["campanhas"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/b2b/mev_score_variation")
-def get_b2b_mev_score_variation(client_id: int):
-    """ Retorna a variação média do MEV Score (Hard Win) """
-    params = {"client_id": client_id}
-    # [SUBSTITUA O SQL ANTIGO]
-    sql = """
-    WITH
-    Collaborators AS (
-        -- Pega todos os colaboradores do cliente
-        SELECT user_id FROM companies.companies_client_collaborator
-        WHERE client_id = :client_id
-    ),
-    RankedScores AS (
-        -- Pega todos os scores dos colaboradores e os ranqueia
-        SELECT
-            user_id,
-            score,
-            calculated_at,
-            -- Rank 1 = mais recente
-            ROW_NUMBER() OVER(PARTITION BY user_id ORDER BY calculated_at DESC) as rn_desc,
-            -- Rank 1 = mais antigo (nos últimos 35 dias)
-            ROW_NUMBER() OVER(PARTITION BY user_id ORDER BY calculated_at ASC) as rn_asc
-        FROM consumers.user_mev_score
-        WHERE user_id IN (SELECT user_id FROM Collaborators)
-          AND calculated_at >= (CURRENT_DATE - INTERVAL '35 day')
-    ),
-    OldScores AS (
-        -- Média dos scores mais antigos (rn_asc = 1)
-        SELECT AVG(score) as avg_score_old
-        FROM RankedScores
-        WHERE rn_asc = 1
-    ),
-    NewScores AS (
-        -- Média dos scores mais recentes (rn_desc = 1)
-        SELECT AVG(score) as avg_score_new
-        FROM RankedScores
-        WHERE rn_desc = 1
-    )
-    SELECT
-        (SELECT avg_score_old FROM OldScores) as old_score,
-        (SELECT avg_score_new FROM NewScores) as new_score;
+@cached("/bi/b2b/mev_score_variation")
+async def get_b2b_mev_score_variation(client_id: int):
+    """
+    Retorna a variação média do MEV Score (Hard Win): média do score mais antigo e do mais
+    recente de cada colaborador nos últimos 35 dias. Lida do store por cliente (ver b2b_store.py).
     """
     try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql), params).fetchone()
-            if r:
-                return {
-                    "old_score": round(r[0] if r[0] is not None else 0, 1),
-                    "new_score": round(r[1] if r[1] is not None else 0, 1)
-                }
-            return {"old_score": 0, "new_score": 0}
+        kpis = await client_store.client(client_id)
+        return {"old_score": kpis["old_score"], "new_score": kpis["new_score"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/b2b/clients_kpis")
+@cached("/bi/b2b/clients_kpis")
+async def get_b2b_clients_kpis(sort: B2BRanking = B2BRanking.taxa_adesao_pct, limit: int = None):
+    """
+    KPIs de TODOS os clientes B2B de uma vez (ranking interno), do maior para o menor em 'sort'.
+    Uma leitura do store por cliente (ver b2b_store.py), em vez de 4 queries por cliente.
+    """
+    try:
+        clients = sorted(await client_store.all_clients(), key=lambda c: c[sort.value], reverse=True)
+        return {"sort": sort, "refreshed_at": client_store.refreshed_at, "clients": clients[:limit]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- KPIs do USUÁRIO FINAL (User View) ---
 
 @app.get("/bi/user/list")
-def get_user_list():
+@cached("/bi/user/list")
+async def get_user_list():
     """ Retorna uma lista de usuários para filtros de dashboard. """
-    sql = "SELECT id, name FROM consumers.user WHERE active = TRUE ORDER BY name LIMIT 100;"
+    sql = "SELECT id, name FROM consumers.user WHERE active = TRUE ORDER BY name, id LIMIT 100;"
+    try:
+        rows = await fetch_all(sql)
+        return [{"id": r[0], "name": r[1]} for r in rows]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/user/search")
+@cached("/bi/user/search")
+async def get_user_search(q: str = "", limit: int = 20, after_name: str = None, after_id: int = None):
+    """
+    Busca de usuários ativos por nome ou email (typeahead), em páginas ordenadas por (name, id).
+    Próxima página: repasse o 'next' da resposta (after_name, after_id). Ver user_search.py.
+    """
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql)).fetchall()
-            return [{"id": r[0], "name": r[1]} for r in rows]
+        return await search_users(q, limit, after_name, after_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/bi/user/activity_history")
-def get_user_activity_history(user_id: int):
+@negotiated
+@cached("/bi/user/activity_history")
+async def get_user_activity_history(user_id: int):
     """
     Retorna o histórico de check-ins (Treinos/semana) do usuário.
+    Lido do perfil do usuário (bi.user_profile, ver user_profile.py).
     """
-    params = {"user_id": user_id}
-    sql = """
-        SELECT 
-            DATE(created_at) as day, 
-            COUNT(id) as checkins
-        FROM consumers.user_time
-        WHERE user_id = :user_id 
-          AND type = 'CHECKIN'
-          AND created_at >= (CURRENT_DATE - INTERVAL '30 day')
-        GROUP BY day
-        ORDER BY day DESC;
-    """
-    try:
-        with engine.connect() as conn:
-            rows = conn.execute(text(sql), params).fetchall()
-            return {
-                "labels": [str(r[0]) for r in rows], 
-                "values": [int(r[1]) for r in rows]
-            }
+    try:
+        profile = await user_profile.get_profile(user_id)
+        checkins = profile["checkins_por_dia"]
+        # Mais recente primeiro, como antes
+        return TimeSeries(checkins["labels"][::-1], checkins["values"][::-1])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# [SUBSTITUIÇÃO - Linhas 420-441]
-
 @app.get("/bi/user/gamification_stats")
-def get_user_gamification_stats(user_id: int):
+@cached("/bi/user/gamification_stats")
+async def get_user_gamification_stats(user_id: int):
     """
     Retorna as estatísticas de gamificação (Conquistas, Pontos)
     E TAMBÉM: Minutos Ativos e Calorias (Easy Wins)
-    para um usuário específico.
+    para um usuário específico. Lido do perfil do usuário (bi.user_profile).
     """
-    params = {"user_id": user_id}
-    sql = """
-        SELECT 
-            (SELECT COUNT(id) 
-             FROM consumers.user_health_stamp 
-             WHERE user_id = :user_id) as total_conquistas,
-             
-            (SELECT r.points 
-             FROM consumers.rank r
-             JOIN consumers.user u ON u.rank_id = r.id
-             WHERE u.id = :user_id) as total_pontos,
-
-            (SELECT SUM(EXTRACT(EPOCH FROM (finished_at - created_at)) / 60)
-             FROM consumers.user_time
-             WHERE user_id = :user_id
-               AND type = 'CHECKIN'
-               AND status = 'FINISHED'
-               AND created_at >= (CURRENT_DATE - INTERVAL '30 day')
-               AND finished_at IS NOT NULL) as total_minutos_ativos_30d,
-
-            (SELECT SUM(uhp.value)
-             FROM consumers.user_health_point uhp
-             JOIN consumers.health_point hp ON uhp.health_point_id = hp.id
-             WHERE uhp.user_id = :user_id
-               AND hp.name = 'Calorias Queimadas'
-               AND uhp.recorded_at >= (CURRENT_DATE - INTERVAL '30 day')
-            ) as total_calorias_30d;
-    """
-    try:
-        with engine.connect() as conn:
-            r = conn.execute(text(sql), params).fetchone()
-            if r:
-                return {
-                    "total_conquistas": r[0] if r[0] is not None else 0,
-                    "total_pontos": r[1] if r[1] is not None else 0,
-                    "total_minutos_ativos_30d": round(r[2] if r[2] is not None else 0),
-                    "total_calorias_30d": round(r[3] if r[3] is not None else 0)
-                }
-            return {
-                "total_conquistas": 0, 
-                "total_pontos": 0, 
-                "total_minutos_ativos_30d": 0, 
-                "total_calorias_30d": 0
-            }
+    try:
+        profile = await user_profile.get_profile(user_id)
+        return {
+            "total_conquistas": profile["total_conquistas"],
+            "total_pontos": profile["total_pontos"],
+            "total_minutos_ativos_30d": profile["total_minutos_ativos_30d"],
+            "total_calorias_30d": profile["total_calorias_30d"],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/user/streak")
+@cached("/bi/user/streak")
+async def get_user_streak(user_id: int):
+    """ Streak de check-in atual e maior streak do usuário. """
+    try:
+        return await streaks.user_streak(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/user/profile")
+@cached("/bi/user/profile")
+async def get_user_profile(user_id: int):
+    """ Perfil de atividade completo do usuário (30 dias, conquistas e pontos) pela chave primária. """
+    try:
+        return await user_profile.get_profile(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/bi/user/profiles")
+@cached("/bi/user/profiles")
+async def get_user_profiles(user_ids: str = ""):
+    """
+    Perfis de vários usuários em UMA leitura (ex: user_ids=1,2,3), no formato {user_id: perfil}.
+    Ids inexistentes ficam de fora. Máximo de USER_PROFILES_MAX_IDS ids por chamada.
+    """
+    try:
+        ids = [int(i) for i in user_ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="user_ids deve ser uma lista de ids separados por vírgula.")
+    if len(ids) > USER_PROFILES_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {USER_PROFILES_MAX_IDS} ids por chamada.")
+    try:
+        return await user_profile.get_profiles(ids) if ids else {}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- BATCH (vários KPIs em uma requisição) ---
+
+def batch_kpis():
+    """
+    KPIs disponíveis no /bi/batch: {nome: função do endpoint}.
+    O nome é o caminho sem o "/bi/" (ex: "revenue", "partner/kpi_overview").
+    """
+    return {
+        route.path[len("/bi/"):]: route.endpoint
+        for route in app.routes
+        if isinstance(route, APIRoute) and "GET" in route.methods
+        and route.path.startswith("/bi/") and route.path != "/bi/batch"
+    }
+
+async def run_batch_kpi(endpoint, shared, semaphore):
+    """
+    Chama o endpoint com os parâmetros compartilhados que ele aceita (os ausentes usam o padrão
+    do endpoint, então a chave de cache é a mesma de uma chamada direta).
+    """
+    kwargs = {}
+    for param in inspect.signature(endpoint).parameters.values():
+        value = shared.get(param.name)
+        if value is None:
+            if param.default is inspect.Parameter.empty:
+                raise HTTPException(status_code=422, detail=f"Parâmetro obrigatório ausente: {param.name}")
+            value = param.default
+        kwargs[param.name] = value
+    async with semaphore:
+        return await endpoint(**kwargs)
+
+@app.get("/bi/batch")
+async def get_batch(
+    kpis: str,
+    partner_id: int = None,
+    client_id: int = None,
+    user_id: int = None,
+    days: int = None,
+    group_by: TimeGroup = None,
+    approx: bool = None,
+):
+    """
+    Retorna vários KPIs em uma requisição (ex: ?kpis=revenue,checkins,partner/kpi_overview&partner_id=1).
+    Os KPIs rodam em paralelo, cada um com sua conexão do pool (até BATCH_MAX_CONCURRENCY ao mesmo
+    tempo), e passam pelo cache do próprio endpoint. O erro de um KPI não derruba os outros:
+    a resposta traz "results" e "errors", ambos por nome de KPI.
+    """
+    available = batch_kpis()
+    names = list(dict.fromkeys(name.strip() for name in kpis.split(",") if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"KPIs inválidos: {', '.join(unknown) or '(vazio)'}. Disponíveis: {', '.join(sorted(available))}",
+        )
+
+    shared = {"partner_id": partner_id, "client_id": client_id, "user_id": user_id, "days": days, "group_by": group_by,
+              "approx": approx}
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    outcomes = await asyncio.gather(
+        *[run_batch_kpi(available[name], shared, semaphore) for name in names],
+        return_exceptions=True,
+    )
+
+    results, errors = {}, {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, HTTPException):
+            errors[name] = outcome.detail
+        elif isinstance(outcome, Exception):
+            print(f"ERRO no KPI {name} do /bi/batch: {outcome}")
+            errors[name] = str(outcome)
+        else:
+            results[name] = outcome
+    return {"results": results, "errors": errors}
+
+# --- EXPORTAÇÃO (dados brutos em streaming, ver export.py) ---
+
+@app.get("/export/{dataset}")
+async def export_dataset(
+    dataset: export.Dataset,
+    format: export.ExportFormat = export.ExportFormat.ndjson,
+    start: datetime = None,
+    end: datetime = None,
+    partner_id: int = None,
+    client_id: int = None,
+    after_id: int = 0,
+    limit: int = Query(None, ge=1),
+    x_admin_token: str = Header(None),
+):
+    """
+    Exporta as linhas de user_time, payment, user_scheduling ou web_events em NDJSON, CSV ou Parquet,
+    em ordem de id. Filtros: created_at em [start, end), partner_id e client_id (colaboradores do cliente).
+    Para continuar de onde parou, passe after_id = último id recebido.
+    Dados brutos: sem ADMIN_TOKEN no .env o export fica desligado (403).
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Export desligado: defina ADMIN_TOKEN no .env.")
+    check_admin(x_admin_token)
+    filters = {"start": start, "end": end, "partner_id": partner_id, "client_id": client_id}
+    return export.export_response(dataset.value, format.value, filters, after_id, limit)
+
+# --- ADMIN ---
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def check_admin(token):
+    """ Exige o ADMIN_TOKEN do .env no header X-Admin-Token; sem ADMIN_TOKEN as rotas de admin ficam desligadas. """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin desligado: defina ADMIN_TOKEN no .env.")
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="X-Admin-Token inválido.")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """ Métricas no formato de exposição do Prometheus (histogramas por rota e por query). """
+    pool = database.pool_status()
+    cache = kpi_cache.stats()
+    gauges = {
+        "bi_db_pool_connections": (
+            "Conexões do pool por estado.",
+            {(("state", k),): v for k, v in pool.items()},
+        ),
+        "bi_cache_entries": ("Respostas guardadas no cache de KPIs.", {(): cache["entries"]}),
+    }
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/slow_queries")
+async def get_slow_queries(x_admin_token: str = Header(None)):
+    """ Últimas queries acima de SLOW_QUERY_MS (com parâmetros e, se ligado, o EXPLAIN ANALYZE). Exige ADMIN_TOKEN. """
+    check_admin(x_admin_token)
+    return {"threshold_ms": metrics.SLOW_QUERY_MS, "queries": list(metrics.slow_queries)}
+
+@app.get("/admin/cache/stats")
+async def get_cache_stats(x_admin_token: str = Header(None)):
+    """ Estatísticas do cache de KPIs (hits, misses, entradas...). """
+    check_admin(x_admin_token)
+    return kpi_cache.stats()
+
+@app.post("/admin/cache/invalidate")
+async def invalidate_cache(prefix: str = "", x_admin_token: str = Header(None)):
+    """
+    Remove do cache as respostas do endpoint 'prefix' e dos que estão abaixo dele
+    (ex: '/bi/partner' ou '/bi/kpi_overview'). Sem prefixo, limpa tudo.
+    """
+    check_admin(x_admin_token)
+    removed = kpi_cache.invalidate(prefix)
+    if any(matches(path, prefix) for path in ENDPOINTS_TOTALS):
+        platform_totals.invalidate()
+    return {"prefix": prefix, "removed": removed}
+
+@app.post("/admin/rollups/refresh")
+async def refresh_rollups_now(full: bool = False, x_admin_token: str = Header(None)):
+    """
+    Força o refresh dos rollups diários (schema 'bi').
+    full=true recalcula todo o histórico (útil depois de cargas com datas retroativas).
+    """
+    check_admin(x_admin_token)
+    try:
+        await refresh_rollups_job(full=full)
+        return {"status": "ok", "full": full}
     except Exception as e:
+        print(f"ERRO no endpoint /admin/rollups/refresh: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 print("Endpoints definidos. Servidor pronto para iniciar.")
\ No newline at end of file
@@ -0,0 +1,264 @@
+# backend/metrics.py
+# Instrumentação do backend, exposta no formato texto do Prometheus em GET /metrics.
+#
+# Por rota (template do FastAPI, ex: "/bi/partner/kpi_overview"):
+#   bi_http_request_duration_seconds   -> tempo total da requisição (histograma, por status)
+#   bi_http_request_db_seconds         -> tempo no banco somado na requisição (histograma)
+#   bi_http_request_queries            -> queries executadas na requisição (histograma)
+#   bi_db_pool_wait_seconds            -> espera por uma conexão do pool (inclui abrir conexão nova)
+#   bi_cache_requests_total            -> resultado do cache de KPIs (hit, miss, coalesced, bypass)
+# Por statement SQL (identificado por um hash curto; o texto sai em bi_db_query_info):
+#   bi_db_query_duration_seconds, bi_db_query_rows
+#
+# Slow-query log (desligado por padrão), variáveis do .env:
+#   SLOW_QUERY_MS       -> loga queries acima de N ms, com os parâmetros (0 = desligado)
+#   SLOW_QUERY_EXPLAIN  -> true/false: roda também EXPLAIN ANALYZE da query lenta (executa a query de novo!)
+# As últimas SLOW_QUERY_KEEP (padrão 50) ficam em memória (GET /admin/slow_queries, que exige
+# o X-Admin-Token e fica desligado sem ADMIN_TOKEN no .env: devolve SQL e parâmetros).
+import contextvars
+import hashlib
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+# Buckets (segundos) dos histogramas de tempo e de linhas retornadas
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20)
+
+# Rota usada para queries fora de uma requisição (jobs de background, scripts)
+ROUTE_BACKGROUND = "background"
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}  # (valores dos labels) -> [contagem por bucket, soma, total]
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le=_number(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{base} {_number(total)}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUEST_DURATION = Histogram("bi_http_request_duration_seconds", "Tempo total da requisição.",
+                             ("route", "method", "status"), TIME_BUCKETS)
+REQUEST_DB = Histogram("bi_http_request_db_seconds", "Tempo no banco somado por requisição.",
+                       ("route",), TIME_BUCKETS)
+REQUEST_QUERIES = Histogram("bi_http_request_queries", "Queries executadas por requisição.",
+                            ("route",), QUERIES_BUCKETS)
+POOL_WAIT = Histogram("bi_db_pool_wait_seconds", "Espera por uma conexão do pool.", ("route",), TIME_BUCKETS)
+QUERY_DURATION = Histogram("bi_db_query_duration_seconds", "Tempo de execução de cada statement SQL.",
+                           ("route", "query"), TIME_BUCKETS)
+QUERY_ROWS = Histogram("bi_db_query_rows", "Linhas retornadas/afetadas por statement SQL.",
+                       ("route", "query"), ROWS_BUCKETS)
+CACHE_REQUESTS = Counter("bi_cache_requests_total", "Resultado do cache de KPIs por endpoint.", ("route", "result"))
+SLOW_QUERIES = Counter("bi_db_slow_queries_total", "Queries acima de SLOW_QUERY_MS.", ("route", "query"))
+
+_query_text = {}  # hash -> SQL (resumido), para bi_db_query_info
+
+# Estado da requisição atual: {"scope", "db", "queries", "pool_wait"}
+_current = contextvars.ContextVar("metrics_request", default=None)
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_EXPLAIN = _env_bool("SLOW_QUERY_EXPLAIN", False)
+slow_queries = deque(maxlen=int(os.getenv("SLOW_QUERY_KEEP", "50")))
+
+
+def _route():
+    state = _current.get()
+    if state is None:
+        return ROUTE_BACKGROUND
+    route = state["scope"].get("route")
+    return route.path if route is not None else state["scope"].get("path", "")
+
+
+def query_id(statement):
+    """ Hash curto do SQL (com espaços normalizados), usado como label. """
+    normalized = re.sub(r"\s+", " ", statement).strip()
+    key = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+    if key not in _query_text:
+        _query_text[key] = normalized[:300]
+    return key
+
+
+# --- Requisições (middleware do main.py) ---
+
+async def track_request(request, call_next):
+    """ Middleware HTTP: mede a requisição e adiciona o header Server-Timing (app e db). """
+    state = {"scope": request.scope, "db": 0.0, "queries": 0, "pool_wait": 0.0}
+    token = _current.set(state)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        elapsed = time.perf_counter() - started
+        response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.2f}, db;dur={state['db'] * 1000:.2f}"
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        route = _route()
+        REQUEST_DURATION.observe((route, request.method, str(status)), elapsed)
+        REQUEST_DB.observe((route,), state["db"])
+        REQUEST_QUERIES.observe((route,), state["queries"])
+        _current.reset(token)
+
+
+def observe_pool_wait(seconds):
+    """ Chamado por database.connection() depois de obter a conexão do pool. """
+    POOL_WAIT.observe((_route(),), seconds)
+    state = _current.get()
+    if state is not None:
+        state["pool_wait"] += seconds
+
+
+def observe_cache(key, result):
+    """ Callback do KPICache (on_event): result = hit / miss / coalesced / bypass. """
+    CACHE_REQUESTS.inc((key.split("?", 1)[0], result))
+
+
+# --- Queries (eventos do SQLAlchemy) ---
+
+def instrument_engine(engine):
+    """ Registra os eventos de execução na engine (async ou sync). """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    route, query = _route(), query_id(statement)
+    QUERY_DURATION.observe((route, query), elapsed)
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        QUERY_ROWS.observe((route, query), cursor.rowcount)
+
+    state = _current.get()
+    if state is not None:
+        state["db"] += elapsed
+        state["queries"] += 1
+
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        _log_slow_query(conn, route, query, statement, parameters, elapsed)
+
+
+def _log_slow_query(conn, route, query, statement, parameters, elapsed):
+    SLOW_QUERIES.inc((route, query))
+    entry = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "route": route,
+        "query": query,
+        "duration_ms": round(elapsed * 1000, 2),
+        "sql": statement,
+        "params": [str(p) for p in parameters] if isinstance(parameters, (list, tuple)) else str(parameters),
+        "plan": None,
+    }
+    print(f"[SLOW QUERY] {entry['duration_ms']} ms em {route} ({query}) params={entry['params']}")
+    if SLOW_QUERY_EXPLAIN and statement.lstrip()[:6].upper() == "SELECT":
+        # Cursor novo na mesma conexão (o cursor original ainda guarda as linhas da query)
+        try:
+            explain = conn.connection.cursor()
+            explain.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            entry["plan"] = "\n".join(row[0] for row in explain.fetchall())
+            explain.close()
+            print(entry["plan"])
+        except Exception as e:
+            print(f"ERRO no EXPLAIN ANALYZE da query lenta {query}: {e}")
+    slow_queries.append(entry)
+
+
+# --- Exposição ---
+
+def render(extra_gauges=None):
+    """
+    Texto no formato de exposição do Prometheus.
+    extra_gauges: {nome: (ajuda, {(label, valor)...} -> valor)} lidos na hora (pool, cache).
+    """
+    lines = []
+    for metric in (REQUEST_DURATION, REQUEST_DB, REQUEST_QUERIES, POOL_WAIT, QUERY_DURATION, QUERY_ROWS,
+                   CACHE_REQUESTS, SLOW_QUERIES):
+        lines.extend(metric.render())
+
+    lines.append("# HELP bi_db_query_info Texto (resumido) de cada statement SQL monitorado.")
+    lines.append("# TYPE bi_db_query_info gauge")
+    for key, sql in sorted(_query_text.items()):
+        lines.append(f'bi_db_query_info{{query="{key}",sql="{_escape(sql)}"}} 1')
+
+    for name, (help_text, values) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for label_pairs, value in values.items():
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in label_pairs)
+            lines.append(f"{name}{{{labels}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
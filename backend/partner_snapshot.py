@@ -0,0 +1,205 @@
+# backend/partner_snapshot.py
+# Snapshot dos KPIs de cada parceiro (bi.partner_kpi_snapshot, ver rollups.sql).
+#
+# Uma linha por parceiro com tudo o que a visão do parceiro mostra:
+#   nps_avg, repasse_30d, revenue_30d, histograma de status das reservas e ocupação por hora.
+# Os endpoints /bi/partner/* passam a ser uma leitura pela chave primária (partner_id).
+#
+# O snapshot é mantido por dois caminhos:
+#   - Agendado: refresh de todos os parceiros a cada PARTNER_SNAPSHOT_REFRESH_SECONDS
+#     (necessário de qualquer forma, pois as janelas de 30 dias andam com o relógio).
+#   - Notificações: os triggers da migração V004 fazem pg_notify('bi_partner_kpi', partner_id)
+#     quando reservas, pagamentos, horários ou NPS mudam. O listener junta os ids recebidos
+#     durante PARTNER_SNAPSHOT_DEBOUNCE_SECONDS e recalcula só esses parceiros.
+#
+# Variáveis de ambiente:
+#   PARTNER_SNAPSHOT_REFRESH_SECONDS  -> intervalo do refresh completo (padrão 300, lido no main.py)
+#   PARTNER_SNAPSHOT_LISTEN           -> liga o listener de notificações (padrão true, lido no main.py)
+#   PARTNER_SNAPSHOT_DEBOUNCE_SECONDS -> espera para agrupar notificações (padrão 2)
+#
+# Uso manual:
+#   python backend/partner_snapshot.py                   -> recalcula todos os parceiros
+#   python backend/partner_snapshot.py --partner-id 3    -> só o parceiro 3
+import asyncio
+import os
+
+from sqlalchemy import text
+
+import database
+from database import fetch_one
+
+CHANNEL = "bi_partner_kpi"
+PARTNER_SNAPSHOT_DEBOUNCE_SECONDS = float(os.getenv("PARTNER_SNAPSHOT_DEBOUNCE_SECONDS", "2"))
+
+# Endpoints que leem do snapshot (o cache deles é invalidado após cada refresh)
+ENDPOINTS_PARTNER = ["/bi/partner/kpi_overview", "/bi/partner/reservation_status", "/bi/partner/occupation_by_hour"]
+
+
+def _snapshot_sql(only_some):
+    """ Upsert do snapshot: de todos os parceiros ou só dos ids em :partner_ids (filtro dentro de cada agregação). """
+    def only(column):
+        return f"AND {column} = ANY(:partner_ids)" if only_some else ""
+
+    return f"""
+        INSERT INTO bi.partner_kpi_snapshot
+            (partner_id, nps_avg, repasse_30d, revenue_30d,
+             status_labels, status_totals, hours, hour_totals, refreshed_at)
+        SELECT
+            p.id,
+            nps.nps_avg,
+            COALESCE(pay.repasse_30d, 0),
+            COALESCE(pay.revenue_30d, 0),
+            COALESCE(st.labels, '{{}}'), COALESCE(st.totals, '{{}}'),
+            COALESCE(oc.hours, '{{}}'), COALESCE(oc.totals, '{{}}'),
+            CURRENT_TIMESTAMP
+        FROM providers.partner p
+        LEFT JOIN (
+            SELECT related_entity_id as partner_id, AVG(rating) as nps_avg
+            FROM consumers.user_health_feedback
+            WHERE feedback_type = 'NPS_PARTNER' {only("related_entity_id")}
+            GROUP BY related_entity_id
+        ) nps ON nps.partner_id = p.id
+        LEFT JOIN (
+            -- Pagamento -> Agendamento -> Horário do parceiro (últimos 30 dias, somente PAID)
+            SELECT ps.partner_id, SUM(pm.transferred_value) as repasse_30d, SUM(pm.amount_due) as revenue_30d
+            FROM consumers.payment pm
+            JOIN consumers.user_scheduling s ON pm.user_scheduling_id = s.id
+            JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+            WHERE pm.status = 'PAID'
+              AND pm.created_at >= (CURRENT_DATE - INTERVAL '30 day') {only("ps.partner_id")}
+            GROUP BY ps.partner_id
+        ) pay ON pay.partner_id = p.id
+        LEFT JOIN (
+            SELECT partner_id, array_agg(status ORDER BY status) as labels, array_agg(total ORDER BY status) as totals
+            FROM (
+                SELECT ps.partner_id, s.status, COUNT(s.id) as total
+                FROM consumers.user_scheduling s
+                JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+                WHERE TRUE {only("ps.partner_id")}
+                GROUP BY ps.partner_id, s.status
+            ) x
+            GROUP BY partner_id
+        ) st ON st.partner_id = p.id
+        LEFT JOIN (
+            SELECT partner_id, array_agg(hour ORDER BY hour) as hours, array_agg(total ORDER BY hour) as totals
+            FROM (
+                SELECT ps.partner_id, ps.hour, COUNT(s.id) as total
+                FROM consumers.user_scheduling s
+                JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+                WHERE ps.hour IS NOT NULL {only("ps.partner_id")}
+                GROUP BY ps.partner_id, ps.hour
+            ) x
+            GROUP BY partner_id
+        ) oc ON oc.partner_id = p.id
+        WHERE TRUE {only("p.id")}
+        ON CONFLICT (partner_id) DO UPDATE
+        SET nps_avg = EXCLUDED.nps_avg, repasse_30d = EXCLUDED.repasse_30d, revenue_30d = EXCLUDED.revenue_30d,
+            status_labels = EXCLUDED.status_labels, status_totals = EXCLUDED.status_totals,
+            hours = EXCLUDED.hours, hour_totals = EXCLUDED.hour_totals, refreshed_at = EXCLUDED.refreshed_at;
+    """
+
+
+SQL_REFRESH_ALL = _snapshot_sql(only_some=False)
+SQL_REFRESH_SOME = _snapshot_sql(only_some=True)
+
+SQL_GET = """
+    SELECT nps_avg, repasse_30d, revenue_30d, status_labels, status_totals, hours, hour_totals, refreshed_at
+    FROM bi.partner_kpi_snapshot
+    WHERE partner_id = :partner_id
+"""
+
+
+async def refresh_snapshots(partner_ids=None):
+    """ Recalcula o snapshot de todos os parceiros (None) ou só dos ids informados. Retorna quantos foram gravados. """
+    async with database.engine.begin() as conn:
+        if partner_ids is None:
+            result = await conn.execute(text(SQL_REFRESH_ALL))
+        else:
+            result = await conn.execute(text(SQL_REFRESH_SOME), {"partner_ids": sorted(partner_ids)})
+        return result.rowcount
+
+
+async def get_snapshot(partner_id):
+    """
+    Snapshot de um parceiro (leitura pela chave primária). Parceiro ainda sem snapshot
+    (ex: cadastrado depois do último refresh) é calculado na hora. None se o parceiro não existe.
+    """
+    row = await fetch_one(SQL_GET, {"partner_id": partner_id})
+    if row is None:
+        await refresh_snapshots([partner_id])
+        row = await fetch_one(SQL_GET, {"partner_id": partner_id})
+    if row is None:
+        return None
+    return {
+        "nps_avg": row[0],
+        "repasse_30d": row[1],
+        "revenue_30d": row[2],
+        "status": list(zip(row[3], row[4])),
+        "occupation": list(zip(row[5], row[6])),
+        "refreshed_at": row[7],
+    }
+
+
+async def listen_for_changes(on_refreshed):
+    """
+    Escuta o canal CHANNEL e recalcula os parceiros notificados (em lotes, com debounce).
+    'on_refreshed(partner_ids)' é chamado depois de cada lote. Roda até ser cancelada;
+    se a conexão cair, espera e reconecta.
+    """
+    pending = set()
+    wake = asyncio.Event()
+
+    def on_notify(connection, pid, channel, payload):
+        if payload.isdigit():
+            pending.add(int(payload))
+            wake.set()
+
+    while True:
+        try:
+            # Conexão dedicada (fica fora do pool enquanto o listener estiver ativo)
+            async with database.engine.connect() as conn:
+                driver = (await conn.get_raw_connection()).driver_connection
+                await driver.add_listener(CHANNEL, on_notify)
+                print(f"[partner_snapshot] escutando '{CHANNEL}'.")
+                try:
+                    while True:
+                        await wake.wait()
+                        await asyncio.sleep(PARTNER_SNAPSHOT_DEBOUNCE_SECONDS)
+                        wake.clear()
+                        partner_ids = set(pending)
+                        pending.clear()
+                        try:
+                            await refresh_snapshots(partner_ids)
+                        except Exception:
+                            pending.update(partner_ids)  # tenta de novo depois de reconectar
+                            wake.set()
+                            raise
+                        on_refreshed(partner_ids)
+                finally:
+                    await driver.remove_listener(CHANNEL, on_notify)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"ERRO no listener de parceiros: {e}")
+            await asyncio.sleep(10)
+
+
+async def _main(partner_ids):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        total = await refresh_snapshots(partner_ids)
+        print(f"Snapshot de {total} parceiros atualizado.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recalcula o snapshot dos KPIs por parceiro (bi.partner_kpi_snapshot).")
+    parser.add_argument("--partner-id", type=int, action="append", help="Só este parceiro (pode repetir).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.partner_id))
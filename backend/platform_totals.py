@@ -0,0 +1,80 @@
+# backend/platform_totals.py
+# Totais da plataforma (escalares) compartilhados entre /bi/kpi_overview e /bi/ltv_cac.
+#
+# Antes, cada endpoint fazia as próprias subqueries: consumers.user era lida 3 vezes,
+# consumers.payment 2 vezes (7 leituras de tabela por renderização da visão interna).
+# Aqui, UMA query lê cada tabela uma única vez; os escalares de janelas diferentes da mesma
+# tabela saem do mesmo scan com agregações FILTER (ex: total de usuários e novos em 30 dias).
+#
+# O resultado vale por PLATFORM_TOTALS_TTL_SECONDS: as requisições dentro dessa janela
+# (inclusive as concorrentes do /bi/batch, que esperam a mesma query) reaproveitam os valores.
+#
+# Variáveis de ambiente:
+#   PLATFORM_TOTALS_TTL_SECONDS -> validade dos totais em segundos (padrão 60, 0 = sempre recalcula)
+import asyncio
+import os
+import time
+
+from database import fetch_one
+
+PLATFORM_TOTALS_TTL_SECONDS = float(os.getenv("PLATFORM_TOTALS_TTL_SECONDS", "60"))
+
+SQL_TOTALS = """
+    SELECT
+        u.total_users, u.new_users_30d,
+        p.total_revenue,
+        pa.total_partners,
+        m.marketing_cost_30d
+    FROM
+        (SELECT
+            COUNT(id) as total_users,
+            COUNT(id) FILTER (WHERE created_at >= (CURRENT_DATE - INTERVAL '30 day')) as new_users_30d
+         FROM consumers.user) u,
+        (SELECT SUM(amount_due) as total_revenue
+         FROM consumers.payment
+         WHERE status = 'PAID') p,
+        (SELECT COUNT(id) as total_partners
+         FROM providers.partner) pa,
+        (SELECT SUM(cost) as marketing_cost_30d
+         FROM analytics.marketing_costs
+         WHERE date >= (CURRENT_DATE - INTERVAL '30 day')) m;
+"""
+
+# Endpoints que leem destes totais
+ENDPOINTS_TOTALS = ["/bi/kpi_overview", "/bi/ltv_cac"]
+
+
+class PlatformTotals:
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.values = None
+        self.computed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self):
+        return self.values is not None and time.monotonic() - self.computed_at < self.ttl_seconds
+
+    async def get(self):
+        """ {"total_users", "new_users_30d", "total_revenue", "total_partners", "marketing_cost_30d"}. """
+        if self._fresh():
+            return self.values
+        async with self._lock:
+            # Quem esperou o lock usa o resultado de quem calculou
+            if self._fresh():
+                return self.values
+            r = await fetch_one(SQL_TOTALS)
+            self.values = {
+                "total_users": int(r[0] or 0),
+                "new_users_30d": int(r[1] or 0),
+                "total_revenue": float(r[2] or 0),
+                "total_partners": int(r[3] or 0),
+                "marketing_cost_30d": float(r[4] or 0),
+            }
+            self.computed_at = time.monotonic()
+            return self.values
+
+    def invalidate(self):
+        self.values = None
+
+
+platform_totals = PlatformTotals(PLATFORM_TOTALS_TTL_SECONDS)
@@ -0,0 +1,213 @@
+# backend/retention.py
+# Matriz de retenção por coorte (semanal ou mensal) calculada em memória com NumPy.
+#
+# Entradas (uma passada em cada):
+#   - Cadastros: dia do created_at de cada usuário, num array indexado pelo user_id
+#     (carregado de forma incremental por id > último id lido).
+#   - Atividade: os bitmaps diários do activity.py (bit N = usuário N ativo no dia).
+# Para cada período P (semana ou mês), o OR dos bitmaps dos dias de P dá os usuários ativos;
+# np.bincount(coorte[ativos]) dá, de uma vez, quantos usuários de CADA coorte voltaram em P,
+# ou seja, uma "diagonal" inteira do triângulo (coorte C, idade P - C).
+#
+# Incremental: a coluna de um período já fechado não muda mais, então fica guardada por
+# (granularidade, segmento). A cada requisição só o período em andamento é recalculado.
+# Colunas guardadas são descartadas quando:
+#   - o refresh dos bitmaps reprocessa dias antigos (invalidate(start_day));
+#   - a composição das coortes fechadas muda (cadastros retroativos ou segmento que mudou).
+#
+# Segmentos (combináveis): partner_id (usuários com atividade no parceiro), client_id
+# (colaboradores do cliente B2B) e zip_code (prefixo do CEP do usuário).
+#
+# Variáveis de ambiente:
+#   RETENTION_MAX_SEGMENTS -> quantos (granularidade, segmento) ficam guardados (padrão 64, LRU)
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+from activity import activity_bitmaps, days_between, union
+from database import fetch_all
+
+RETENTION_MAX_SEGMENTS = int(os.getenv("RETENTION_MAX_SEGMENTS", "64"))
+
+EPOCH = date(1970, 1, 1)
+SEM_CADASTRO = np.iinfo(np.int32).min
+
+SQL_SIGNUPS = """
+    SELECT id, DATE(created_at)
+    FROM consumers.user
+    WHERE id > :last_id
+      AND created_at IS NOT NULL
+    ORDER BY id
+"""
+
+SQL_SEGMENTOS = {
+    "partner_id": "SELECT DISTINCT user_id FROM consumers.user_time WHERE partner_id = :partner_id",
+    "client_id": "SELECT user_id FROM companies.companies_client_collaborator WHERE client_id = :client_id",
+    "zip_code": "SELECT id FROM consumers.user WHERE zip_code LIKE :zip_code",
+}
+
+
+def period_index(days, granularity):
+    """ Dias desde 1970-01-01 (int ou array) -> índice do período (semanas começam na segunda). """
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == "week":
+        return (days + 3) // 7  # 1970-01-01 foi uma quinta-feira
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def period_bounds(index, granularity):
+    """ (primeiro dia, último dia) do período. """
+    if granularity == "week":
+        first = EPOCH + timedelta(days=int(index) * 7 - 3)
+        return first, first + timedelta(days=6)
+    month = np.datetime64(int(index), "M")
+    first = month.astype("datetime64[D]").astype(date)
+    last = (month + 1).astype("datetime64[D]").astype(date) - timedelta(days=1)
+    return first, last
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+class RetentionEngine:
+    def __init__(self, activity):
+        self.activity = activity
+        self.signup_day = np.full(0, SEM_CADASTRO, dtype=np.int32)  # user_id -> dia do cadastro
+        self.last_user_id = 0
+        self._columns = OrderedDict()  # (granularidade, segmento) -> {"digest", "closed": {período: contagens}}
+        self._lock = threading.Lock()
+        self._signup_lock = asyncio.Lock()
+
+    # --- Entradas ---
+
+    async def refresh_signups(self):
+        """ Lê só os usuários novos (id > último id lido). """
+        async with self._signup_lock:
+            rows = await fetch_all(SQL_SIGNUPS, {"last_id": self.last_user_id})
+            if not rows:
+                return 0
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            days = np.fromiter((day_number(r[1]) for r in rows), dtype=np.int32, count=len(rows))
+            signup_day = self.signup_day
+            if ids.max() >= len(signup_day):
+                grown = np.full(int(ids.max()) + 1, SEM_CADASTRO, dtype=np.int32)
+                grown[:len(signup_day)] = signup_day
+                signup_day = grown
+            signup_day[ids] = days
+            self.signup_day = signup_day
+            self.last_user_id = int(ids.max())
+            return len(rows)
+
+    async def segment_members(self, segment):
+        """ ids dos usuários do segmento (interseção dos filtros) ou None (todos). """
+        members = None
+        for name, value in segment.items():
+            if value is None:
+                continue
+            params = {name: f"{value}%" if name == "zip_code" else value}
+            ids = np.array([r[0] for r in await fetch_all(SQL_SEGMENTOS[name], params)], dtype=np.int64)
+            members = ids if members is None else np.intersect1d(members, ids)
+        return members
+
+    def invalidate(self, start_day=None):
+        """ Descarta colunas guardadas a partir do período de 'start_day' (None = todas). """
+        with self._lock:
+            if start_day is None:
+                self._columns.clear()
+                return
+            for (granularity, _), entry in self._columns.items():
+                first = int(period_index(day_number(start_day), granularity))
+                entry["closed"] = {p: col for p, col in entry["closed"].items() if p < first}
+
+    # --- Cálculo ---
+
+    def _cohorts(self, granularity, members):
+        """ user_id -> índice da coorte (-1 = sem cadastro ou fora do segmento). """
+        signup_day = self.signup_day
+        valid = signup_day != SEM_CADASTRO
+        if members is not None:
+            in_segment = np.zeros(len(signup_day), dtype=bool)
+            in_segment[members[members < len(signup_day)]] = True
+            valid &= in_segment
+        cohort = np.full(len(signup_day), -1, dtype=np.int64)
+        cohort[valid] = period_index(signup_day[valid], granularity)
+        return cohort
+
+    def _column(self, period, cohort, granularity):
+        """ Quantos usuários de cada coorte (<= período) tiveram atividade no período. """
+        first, last = period_bounds(period, granularity)
+        bitmaps = [self.activity.days[d] for d in days_between(first, last) if d in self.activity.days]
+        bits = np.unpackbits(union(bitmaps), bitorder="little")[:len(cohort)]
+        active = cohort[np.flatnonzero(bits)]
+        active = active[(active >= 0) & (active <= period)]
+        return np.bincount(active, minlength=period + 1)
+
+    def matrix(self, granularity, periods, segment_key, members, today=None):
+        """
+        Triângulo das últimas 'periods' coortes: {"cohorts": [...], "sizes": [...], "retained": [[...]]}.
+        retained[i][k] = usuários da coorte i ativos k períodos depois do cadastro (k = 0 é o próprio período).
+        """
+        today = today or date.today()
+        current = int(period_index(day_number(today), granularity))
+        first_cohort = current - periods + 1
+        cohort = self._cohorts(granularity, members)
+
+        # Composição das coortes fechadas: se mudar, as colunas guardadas não valem mais
+        closed_users = np.flatnonzero((cohort >= 0) & (cohort < current))
+        digest = hashlib.sha1(closed_users.tobytes() + cohort[closed_users].tobytes()).hexdigest()
+
+        key = (granularity, segment_key)
+        with self._lock:
+            entry = self._columns.get(key)
+            if entry is None or entry["digest"] != digest:
+                entry = {"digest": digest, "closed": {}}
+            self._columns[key] = entry
+            self._columns.move_to_end(key)
+            while len(self._columns) > RETENTION_MAX_SEGMENTS:
+                self._columns.popitem(last=False)
+
+        in_window = cohort[cohort >= first_cohort] - first_cohort
+        sizes = np.bincount(in_window, minlength=periods)[:periods]
+        retained = np.zeros((periods, periods), dtype=np.int64)  # [coorte, idade]
+        rows = np.arange(periods)
+        for period in range(first_cohort, current + 1):
+            column = entry["closed"].get(period)
+            if column is None:
+                column = self._column(period, cohort, granularity)
+                if period < current:
+                    entry["closed"][period] = column
+            ages = period - (first_cohort + rows)
+            ok = ages >= 0
+            retained[rows[ok], ages[ok]] = column[first_cohort + rows[ok]]
+
+        return {
+            "cohorts": [period_bounds(first_cohort + i, granularity)[0] for i in range(periods)],
+            "sizes": sizes,
+            "retained": [retained[i, :periods - i] for i in range(periods)],
+        }
+
+    def day_retention(self, age, today=None):
+        """ Usuários cadastrados há 'age' dias e quantos deles tiveram atividade hoje. """
+        today = today or date.today()
+        cohort = np.flatnonzero(self.signup_day == day_number(today - timedelta(days=age)))
+        bitmap = self.activity.days.get(today)
+        if bitmap is None or cohort.size == 0:
+            return int(cohort.size), 0
+        bits = np.unpackbits(bitmap, bitorder="little")
+        return int(cohort.size), int(bits[cohort[cohort < len(bits)]].sum())
+
+    async def cohort_matrix(self, granularity, periods, segment):
+        await self.activity.ready()
+        await self.refresh_signups()
+        members = await self.segment_members(segment)
+        segment_key = tuple(sorted((k, v) for k, v in segment.items() if v is not None))
+        return await asyncio.to_thread(self.matrix, granularity, periods, segment_key, members)
+
+
+retention_engine = RetentionEngine(activity_bitmaps)
@@ -0,0 +1,390 @@
+# backend/rollups.py
+# Refresh incremental dos rollups diários (schema 'bi', ver rollups.sql).
+#
+# A cada execução, reprocessa apenas os dias a partir do último "watermark"
+# (o próprio dia do watermark é refeito, pois estava incompleto na execução anterior).
+# Sem watermark (primeira execução) ou com full=True, reprocessa todo o histórico.
+#
+# Com o feed de mudanças (cdc.py, migração V007) ligado, as colunas somáveis (check-ins,
+# receita, repasse, pagamentos, reservas e reservas por status) são atualizadas pelo delta
+# de cada INSERT/UPDATE/DELETE, inclusive de dias antigos (ex: pagamento que virou PAID
+# semanas depois). O refresh por watermark passa a recalcular só os usuários distintos
+# (active_users), que não podem ser somados. full=True recalcula tudo e reposiciona o feed.
+#
+# Uso manual (ex: depois de rodar o generate_fake_data.py com datas no passado):
+#   python backend/rollups.py          -> incremental
+#   python backend/rollups.py --full   -> recalcula tudo
+import asyncio
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from sqlalchemy import text
+
+import database
+from cdc import cdc_feed
+
+WATERMARK_NAME = "daily_activity"
+CDC_CONSUMER = "rollups"
+FULL_REFRESH_START = date(1900, 1, 1)
+
+# Endpoints que leem destes rollups (o cache deles é invalidado após cada refresh)
+ENDPOINTS_ROLLUP = ["/bi/dau", "/bi/checkins", "/bi/revenue", "/bi/reservations"]
+
+SQL_DELETE = [
+    "DELETE FROM bi.daily_platform_activity WHERE day >= :start_day",
+    "DELETE FROM bi.daily_partner_activity WHERE day >= :start_day",
+    "DELETE FROM bi.daily_reservation_status WHERE day >= :start_day",
+]
+
+SQL_PLATFORM = """
+    INSERT INTO bi.daily_platform_activity
+        (day, active_users, checkins, revenue_paid, transferred_value, payments_paid, reservations)
+    SELECT
+        day,
+        SUM(active_users), SUM(checkins),
+        SUM(revenue_paid), SUM(transferred_value), SUM(payments_paid),
+        SUM(reservations)
+    FROM (
+        -- Atividade (DAU) e check-ins
+        SELECT
+            DATE(created_at) as day,
+            COUNT(DISTINCT user_id) as active_users,
+            COUNT(*) FILTER (WHERE type = 'CHECKIN') as checkins,
+            0 as revenue_paid, 0 as transferred_value, 0 as payments_paid,
+            0 as reservations
+        FROM consumers.user_time
+        WHERE created_at >= :start_ts
+        GROUP BY day
+
+        UNION ALL
+
+        -- Receita (somente PAID)
+        SELECT
+            DATE(created_at) as day,
+            0, 0,
+            SUM(amount_due), SUM(transferred_value), COUNT(*),
+            0
+        FROM consumers.payment
+        WHERE status = 'PAID'
+          AND created_at >= :start_ts
+        GROUP BY day
+
+        UNION ALL
+
+        -- Reservas
+        SELECT
+            DATE(created_at) as day,
+            0, 0,
+            0, 0, 0,
+            COUNT(*)
+        FROM consumers.user_scheduling
+        WHERE created_at >= :start_ts
+        GROUP BY day
+    ) x
+    GROUP BY day;
+"""
+
+SQL_PARTNER = """
+    INSERT INTO bi.daily_partner_activity
+        (day, partner_id, active_users, checkins, revenue_paid, transferred_value, payments_paid, reservations)
+    SELECT
+        day, partner_id,
+        SUM(active_users), SUM(checkins),
+        SUM(revenue_paid), SUM(transferred_value), SUM(payments_paid),
+        SUM(reservations)
+    FROM (
+        -- Atividade e check-ins no local do parceiro
+        SELECT
+            DATE(created_at) as day,
+            partner_id,
+            COUNT(DISTINCT user_id) as active_users,
+            COUNT(*) FILTER (WHERE type = 'CHECKIN') as checkins,
+            0 as revenue_paid, 0 as transferred_value, 0 as payments_paid,
+            0 as reservations
+        FROM consumers.user_time
+        WHERE created_at >= :start_ts
+          AND partner_id IS NOT NULL
+        GROUP BY day, partner_id
+
+        UNION ALL
+
+        -- Receita: Pagamento -> Agendamento -> Horário do parceiro
+        SELECT
+            DATE(p.created_at) as day,
+            ps.partner_id,
+            0, 0,
+            SUM(p.amount_due), SUM(p.transferred_value), COUNT(*),
+            0
+        FROM consumers.payment p
+        JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
+        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+        WHERE p.status = 'PAID'
+          AND p.created_at >= :start_ts
+        GROUP BY day, ps.partner_id
+
+        UNION ALL
+
+        -- Reservas: Agendamento -> Horário do parceiro
+        SELECT
+            DATE(s.created_at) as day,
+            ps.partner_id,
+            0, 0,
+            0, 0, 0,
+            COUNT(*)
+        FROM consumers.user_scheduling s
+        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+        WHERE s.created_at >= :start_ts
+        GROUP BY day, ps.partner_id
+    ) x
+    GROUP BY day, partner_id;
+"""
+
+SQL_RESERVATION_STATUS = """
+    INSERT INTO bi.daily_reservation_status (day, partner_id, status, total)
+    SELECT
+        DATE(s.created_at) as day,
+        ps.partner_id,
+        COALESCE(s.status, 'UNKNOWN') as status,
+        COUNT(*)
+    FROM consumers.user_scheduling s
+    JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+    WHERE s.created_at >= :start_ts
+    GROUP BY day, ps.partner_id, 3;
+"""
+
+# Só os usuários distintos (modo CDC: as demais colunas vêm do feed de mudanças)
+SQL_ACTIVE_PLATFORM = """
+    INSERT INTO bi.daily_platform_activity AS t (day, active_users, refreshed_at)
+    SELECT DATE(created_at) as day, COUNT(DISTINCT user_id), CURRENT_TIMESTAMP
+    FROM consumers.user_time
+    WHERE created_at >= :start_ts
+    GROUP BY day
+    ON CONFLICT (day) DO UPDATE
+    SET active_users = EXCLUDED.active_users, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_ACTIVE_PARTNER = """
+    INSERT INTO bi.daily_partner_activity AS t (day, partner_id, active_users, refreshed_at)
+    SELECT DATE(created_at) as day, partner_id, COUNT(DISTINCT user_id), CURRENT_TIMESTAMP
+    FROM consumers.user_time
+    WHERE created_at >= :start_ts
+      AND partner_id IS NOT NULL
+    GROUP BY day, partner_id
+    ON CONFLICT (day, partner_id) DO UPDATE
+    SET active_users = EXCLUDED.active_users, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+# Deltas do feed de mudanças: somam nas linhas existentes (ou criam o dia/parceiro)
+SQL_APPLY_PLATFORM = """
+    INSERT INTO bi.daily_platform_activity AS t
+        (day, checkins, revenue_paid, transferred_value, payments_paid, reservations, refreshed_at)
+    VALUES (:day, :checkins, :revenue_paid, :transferred_value, :payments_paid, :reservations, CURRENT_TIMESTAMP)
+    ON CONFLICT (day) DO UPDATE
+    SET checkins = t.checkins + EXCLUDED.checkins,
+        revenue_paid = t.revenue_paid + EXCLUDED.revenue_paid,
+        transferred_value = t.transferred_value + EXCLUDED.transferred_value,
+        payments_paid = t.payments_paid + EXCLUDED.payments_paid,
+        reservations = t.reservations + EXCLUDED.reservations,
+        refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_APPLY_PARTNER = """
+    INSERT INTO bi.daily_partner_activity AS t
+        (day, partner_id, checkins, revenue_paid, transferred_value, payments_paid, reservations, refreshed_at)
+    VALUES (:day, :partner_id, :checkins, :revenue_paid, :transferred_value, :payments_paid, :reservations,
+            CURRENT_TIMESTAMP)
+    ON CONFLICT (day, partner_id) DO UPDATE
+    SET checkins = t.checkins + EXCLUDED.checkins,
+        revenue_paid = t.revenue_paid + EXCLUDED.revenue_paid,
+        transferred_value = t.transferred_value + EXCLUDED.transferred_value,
+        payments_paid = t.payments_paid + EXCLUDED.payments_paid,
+        reservations = t.reservations + EXCLUDED.reservations,
+        refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+SQL_APPLY_RESERVATION_STATUS = """
+    INSERT INTO bi.daily_reservation_status AS t (day, partner_id, status, total)
+    VALUES (:day, :partner_id, :status, :total)
+    ON CONFLICT (day, partner_id, status) DO UPDATE
+    SET total = t.total + EXCLUDED.total;
+"""
+
+SQL_PARTNER_BY_SCHEDULE = "SELECT id, partner_id FROM providers.partner_schedule WHERE id = ANY(:ids)"
+
+SQL_PARTNER_BY_SCHEDULING = """
+    SELECT s.id, ps.partner_id
+    FROM consumers.user_scheduling s
+    JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+    WHERE s.id = ANY(:ids)
+"""
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+
+async def _recompute(conn, start_day):
+    """ Apaga e recalcula os rollups a partir de 'start_day' (todas as colunas). """
+    params = {"start_day": start_day, "start_ts": datetime.combine(start_day, time.min)}
+    for sql in SQL_DELETE:
+        await conn.execute(text(sql), params)
+    await conn.execute(text(SQL_PLATFORM), params)
+    await conn.execute(text(SQL_PARTNER), params)
+    await conn.execute(text(SQL_RESERVATION_STATUS), params)
+
+    # O próximo refresh recomeça em "hoje" (que ainda está em andamento)
+    await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+
+
+async def refresh_rollups(full=False):
+    """
+    Recalcula os rollups diários a partir do watermark (ou tudo, se full=True).
+    Tudo roda em uma transação: os endpoints nunca veem um dia pela metade.
+    Com o feed de mudanças ativo, o incremental recalcula só active_users.
+    Retorna o dia inicial reprocessado.
+    """
+    cdc = await cdc_feed.tracking(CDC_CONSUMER)
+    if cdc and full:
+        await cdc_feed.rebuild(CDC_CONSUMER)
+        return FULL_REFRESH_START
+
+    async with database.engine.begin() as conn:
+        start_day = None
+        if not full:
+            start_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": WATERMARK_NAME})).scalar()
+        if start_day is None:
+            start_day = FULL_REFRESH_START
+
+        if not cdc:
+            await _recompute(conn, start_day)
+            return start_day
+
+        params = {"start_ts": datetime.combine(start_day, time.min)}
+        await conn.execute(text(SQL_ACTIVE_PLATFORM), params)
+        await conn.execute(text(SQL_ACTIVE_PARTNER), params)
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+
+    return start_day
+
+
+# --- Feed de mudanças (cdc.py) ---
+
+CHECKINS, REVENUE, TRANSFERRED, PAYMENTS, RESERVATIONS = range(5)
+DELTA_COLUMNS = ["checkins", "revenue_paid", "transferred_value", "payments_paid", "reservations"]
+
+
+def _versions(change):
+    """ [(sinal, linha)]: INSERT soma a nova, DELETE tira a antiga, UPDATE faz os dois. """
+    versions = []
+    if change["old"] is not None:
+        versions.append((-1, change["old"]))
+    if change["new"] is not None:
+        versions.append((1, change["new"]))
+    return versions
+
+
+def _day(value):
+    """ Timestamp do JSONB ("2025-01-31T10:00:00") -> date. """
+    return date.fromisoformat(value[:10])
+
+
+def _money(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+
+async def _partners(conn, sql, ids):
+    ids = sorted(i for i in ids if i is not None)
+    if not ids:
+        return {}
+    return {r[0]: r[1] for r in (await conn.execute(text(sql), {"ids": ids})).fetchall()}
+
+
+async def apply_changes(conn, changes):
+    """ Soma nos rollups o delta de um lote de mudanças de user_time, payment e user_scheduling. """
+    rows = [(change["source"], sign, row) for change in changes for sign, row in _versions(change)
+            if row.get("created_at")]
+    partner_by_schedule = await _partners(
+        conn, SQL_PARTNER_BY_SCHEDULE,
+        {row.get("partner_schedule_id") for source, _, row in rows if source == "user_scheduling"})
+    partner_by_scheduling = await _partners(
+        conn, SQL_PARTNER_BY_SCHEDULING,
+        {row.get("user_scheduling_id") for source, _, row in rows if source == "payment"})
+
+    platform, partner, status = {}, {}, {}
+
+    def add(totals, key, deltas):
+        current = totals.setdefault(key, [0, Decimal(0), Decimal(0), 0, 0])
+        for column, value in deltas.items():
+            current[column] += value
+
+    for source, sign, row in rows:
+        day = _day(row["created_at"])
+        if source == "user_time":
+            if row.get("type") != "CHECKIN":
+                continue
+            deltas, partner_id = {CHECKINS: sign}, row.get("partner_id")
+        elif source == "payment":
+            if row.get("status") != "PAID":
+                continue
+            deltas = {REVENUE: sign * _money(row.get("amount_due")),
+                      TRANSFERRED: sign * _money(row.get("transferred_value")), PAYMENTS: sign}
+            partner_id = partner_by_scheduling.get(row.get("user_scheduling_id"))
+        else:
+            deltas, partner_id = {RESERVATIONS: sign}, partner_by_schedule.get(row.get("partner_schedule_id"))
+            if partner_id is not None:
+                key = (day, partner_id, row.get("status") or "UNKNOWN")
+                status[key] = status.get(key, 0) + sign
+        add(platform, day, deltas)
+        if partner_id is not None:
+            add(partner, (day, partner_id), deltas)
+
+    def params(values):
+        return dict(zip(DELTA_COLUMNS, values))
+
+    platform = [{"day": day, **params(v)} for day, v in platform.items() if any(v)]
+    partner = [{"day": day, "partner_id": pid, **params(v)} for (day, pid), v in partner.items() if any(v)]
+    status = [{"day": day, "partner_id": pid, "status": st, "total": total}
+              for (day, pid, st), total in status.items() if total]
+    if platform:
+        await conn.execute(text(SQL_APPLY_PLATFORM), platform)
+    if partner:
+        await conn.execute(text(SQL_APPLY_PARTNER), partner)
+    if status:
+        await conn.execute(text(SQL_APPLY_RESERVATION_STATUS), status)
+
+
+async def bootstrap(conn):
+    """ Recalcula todo o histórico (chamado pelo feed, em REPEATABLE READ). """
+    await _recompute(conn, FULL_REFRESH_START)
+
+
+cdc_feed.register(
+    CDC_CONSUMER, ["user_time", "payment", "user_scheduling"], apply_changes, bootstrap, ENDPOINTS_ROLLUP,
+)
+
+
+async def _main(full):
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        start_day = await refresh_rollups(full=full)
+        print(f"Rollups atualizados a partir de {start_day}.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atualiza os rollups diários do schema 'bi'.")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
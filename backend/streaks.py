@@ -0,0 +1,298 @@
+# backend/streaks.py
+# Streaks de check-in por usuário (dias seguidos com pelo menos 1 check-in).
+#
+# Estado por usuário em bi.user_streak (ver rollups.sql): último dia com check-in, tamanho da
+# sequência que termina nele e maior sequência já feita. Um check-in novo só compara o dia
+# com o estado do usuário (mesmo dia: nada; dia seguinte: +1; depois de um buraco: recomeça),
+# sem reler o histórico. A streak "atual" vale enquanto o último check-in é de hoje ou ontem.
+#
+# Entrada dos check-ins:
+#   - Feed de mudanças (cdc.py, migração V007): cada INSERT em user_time entra pelo delta.
+#     Check-ins apagados/alterados ou com dia anterior ao último do usuário (carga atrasada)
+#     recalculam só aquele usuário, a partir dos check-ins dele.
+#   - Sem o feed: refresh por watermark, como os rollups (os dias desde o watermark são
+#     reaplicados; repetir um dia já contado não muda o estado).
+# O recálculo completo (primeira vez ou --full) é um "gaps and islands" em SQL.
+#
+# Variáveis de ambiente:
+#   STREAKS_REFRESH_SECONDS -> intervalo do refresh por watermark (padrão 300, lido no main.py)
+#
+# Uso manual:
+#   python backend/streaks.py          -> incremental
+#   python backend/streaks.py --full   -> recalcula tudo
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+
+import database
+from cdc import cdc_feed
+from database import fetch_all, fetch_one
+
+WATERMARK_NAME = "user_streak"
+CDC_CONSUMER = "streaks"
+FULL_REFRESH_START = date(1900, 1, 1)
+
+# Endpoints que leem dos streaks (o cache deles é invalidado após cada atualização)
+ENDPOINTS_STREAKS = ["/bi/gamification/streaks", "/bi/user/streak"]
+
+# Faixas do histograma (dias seguidos; None = sem limite)
+BUCKETS = [(1, 1), (2, 2), (3, 6), (7, 13), (14, 29), (30, None)]
+
+SQL_STATE_GET = """
+    SELECT user_id, last_day, current_run, longest
+    FROM bi.user_streak
+    WHERE user_id = ANY(:user_ids)
+"""
+
+SQL_STATE_SET = """
+    INSERT INTO bi.user_streak (user_id, last_day, current_run, longest, updated_at)
+    VALUES (:user_id, :last_day, :current_run, :longest, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE
+    SET last_day = EXCLUDED.last_day, current_run = EXCLUDED.current_run,
+        longest = EXCLUDED.longest, updated_at = EXCLUDED.updated_at;
+"""
+
+SQL_CHECKIN_DAYS = """
+    SELECT DISTINCT user_id, DATE(created_at) as day
+    FROM consumers.user_time
+    WHERE type = 'CHECKIN'
+      AND user_id IS NOT NULL
+      AND created_at >= :start_ts
+    ORDER BY user_id, day
+"""
+
+
+def _rebuild_sql(only_some):
+    """ Streaks recalculados do histórico (de todos ou só dos ids em :user_ids): sequências = "ilhas" de dias. """
+    only = "AND user_id = ANY(:user_ids)" if only_some else ""
+    return f"""
+        INSERT INTO bi.user_streak (user_id, last_day, current_run, longest, updated_at)
+        SELECT
+            user_id,
+            MAX(end_day),
+            (array_agg(days ORDER BY end_day DESC))[1],
+            MAX(days),
+            CURRENT_TIMESTAMP
+        FROM (
+            -- Dias seguidos têm o mesmo (dia - posição do dia): cada valor é uma sequência
+            SELECT user_id, MAX(day) as end_day, COUNT(*) as days
+            FROM (
+                SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int as island
+                FROM (
+                    SELECT DISTINCT user_id, DATE(created_at) as day
+                    FROM consumers.user_time
+                    WHERE type = 'CHECKIN' AND user_id IS NOT NULL {only}
+                ) d
+            ) x
+            GROUP BY user_id, island
+        ) islands
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET last_day = EXCLUDED.last_day, current_run = EXCLUDED.current_run,
+            longest = EXCLUDED.longest, updated_at = EXCLUDED.updated_at;
+    """
+
+
+SQL_REBUILD_ALL = _rebuild_sql(only_some=False)
+SQL_REBUILD_SOME = _rebuild_sql(only_some=True)
+
+SQL_HISTOGRAM_CURRENT = """
+    SELECT current_run, COUNT(*)
+    FROM bi.user_streak
+    WHERE last_day >= CURRENT_DATE - 1
+    GROUP BY current_run
+"""
+
+SQL_HISTOGRAM_LONGEST = "SELECT longest, COUNT(*) FROM bi.user_streak GROUP BY longest"
+
+SQL_USER = "SELECT last_day, current_run, longest FROM bi.user_streak WHERE user_id = :user_id"
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+
+def advance(state, day):
+    """
+    Estado (last_day, current_run, longest) depois de um check-in em 'day'.
+    Os dias chegam em ordem: o mesmo dia (ou anterior) não muda nada.
+    """
+    if state is not None and day <= state[0]:
+        return state
+    last_day, current_run, longest = state or (None, 0, 0)
+    current_run = current_run + 1 if last_day is not None and day == last_day + timedelta(days=1) else 1
+    return (day, current_run, max(longest, current_run))
+
+
+async def rebuild_users(conn, user_ids):
+    """ Recalcula do histórico só estes usuários (check-ins apagados, alterados ou atrasados). """
+    user_ids = sorted(user_ids)
+    await conn.execute(text("DELETE FROM bi.user_streak WHERE user_id = ANY(:user_ids)"), {"user_ids": user_ids})
+    await conn.execute(text(SQL_REBUILD_SOME), {"user_ids": user_ids})
+
+
+async def apply_days(conn, days_by_user, rebuild=()):
+    """
+    Aplica {user_id: [dias com check-in]} ao estado de cada usuário, em ordem de data.
+    Usuários com dia anterior ao último já contado vão para o recálculo, junto com 'rebuild'.
+    Retorna quantos usuários mudaram.
+    """
+    rebuild = set(rebuild)
+    users = sorted(set(days_by_user) - rebuild)
+    states = {}
+    if users:
+        rows = (await conn.execute(text(SQL_STATE_GET), {"user_ids": users})).fetchall()
+        states = {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+    changed = []
+    for user_id in users:
+        before = state = states.get(user_id)
+        for day in sorted(set(days_by_user[user_id])):
+            if state is not None and day < state[0]:
+                rebuild.add(user_id)
+                break
+            state = advance(state, day)
+        if user_id not in rebuild and state != before:
+            changed.append({"user_id": user_id, "last_day": state[0], "current_run": state[1], "longest": state[2]})
+
+    if changed:
+        await conn.execute(text(SQL_STATE_SET), changed)
+    if rebuild:
+        await rebuild_users(conn, rebuild)
+    return len(changed) + len(rebuild)
+
+
+def _checkin(row):
+    """ (user_id, dia) de uma linha de user_time em JSONB, ou None se não é check-in. """
+    if row is None or row.get("type") != "CHECKIN" or row.get("user_id") is None or not row.get("created_at"):
+        return None
+    return row["user_id"], date.fromisoformat(row["created_at"][:10])
+
+
+async def apply_changes(conn, changes):
+    """ Lote do feed de mudanças de user_time: INSERT avança o estado; o resto recalcula o usuário. """
+    days_by_user, rebuild = {}, set()
+    for change in changes:
+        old, new = _checkin(change["old"]), _checkin(change["new"])
+        if old == new:
+            continue
+        if old is None:
+            # Check-in novo (ou linha que virou check-in)
+            days_by_user.setdefault(new[0], []).append(new[1])
+        else:
+            # Check-in apagado ou alterado: o dia pode ter deixado de existir
+            rebuild.update(checkin[0] for checkin in (old, new) if checkin is not None)
+    await apply_days(conn, days_by_user, rebuild)
+
+
+async def bootstrap(conn):
+    """ Recalcula os streaks de todos os usuários a partir do histórico. """
+    await conn.execute(text("DELETE FROM bi.user_streak"))
+    await conn.execute(text(SQL_REBUILD_ALL))
+    await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+
+
+async def refresh_streaks(full=False):
+    """
+    Sem o feed de mudanças: aplica os check-ins desde o watermark (ou recalcula tudo, se full=True).
+    Com o feed ativo, o incremental fica com ele; full=True recalcula e reposiciona o feed.
+    Retorna o dia inicial processado (None = mantido pelo feed).
+    """
+    if await cdc_feed.tracking(CDC_CONSUMER):
+        if not full:
+            return None
+        await cdc_feed.rebuild(CDC_CONSUMER)
+        return FULL_REFRESH_START
+
+    async with database.engine.begin() as conn:
+        start_day = None
+        if not full:
+            start_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": WATERMARK_NAME})).scalar()
+        if start_day is None:
+            await bootstrap(conn)
+            return FULL_REFRESH_START
+
+        days_by_user = {}
+        rows = (await conn.execute(text(SQL_CHECKIN_DAYS), {"start_ts": datetime.combine(start_day, time.min)})).fetchall()
+        for user_id, day in rows:
+            days_by_user.setdefault(user_id, []).append(day)
+        await apply_days(conn, days_by_user)
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": WATERMARK_NAME, "last_day": date.today()})
+    return start_day
+
+
+cdc_feed.register(CDC_CONSUMER, ["user_time"], apply_changes, bootstrap, ENDPOINTS_STREAKS)
+
+
+# --- Consultas ---
+
+def _bucket_label(low, high):
+    if high is None:
+        return f"{low}+ dias"
+    if low == high:
+        return f"{low} dia" if low == 1 else f"{low} dias"
+    return f"{low}-{high} dias"
+
+
+def _histogram(rows):
+    """ [(dias, usuários)] -> {"labels", "values"} nas faixas de BUCKETS. """
+    values = [0] * len(BUCKETS)
+    for days, users in rows:
+        for i, (low, high) in enumerate(BUCKETS):
+            if days >= low and (high is None or days <= high):
+                values[i] += int(users)
+                break
+    return {"labels": [_bucket_label(low, high) for low, high in BUCKETS], "values": values}
+
+
+async def histograms():
+    """ Distribuição das streaks atuais (ainda vivas) e das maiores streaks de cada usuário. """
+    current = _histogram(await fetch_all(SQL_HISTOGRAM_CURRENT))
+    longest = _histogram(await fetch_all(SQL_HISTOGRAM_LONGEST))
+    return {**current, "longest": longest, "users_with_streak": sum(current["values"])}
+
+
+async def user_streak(user_id):
+    """ Streak atual e maior streak do usuário (zeros se ele nunca fez check-in). """
+    row = await fetch_one(SQL_USER, {"user_id": user_id})
+    if row is None:
+        return {"user_id": user_id, "current_streak": 0, "longest_streak": 0, "last_checkin_day": None}
+    last_day, current_run, longest = row
+    alive = last_day >= date.today() - timedelta(days=1)
+    return {
+        "user_id": user_id,
+        "current_streak": current_run if alive else 0,
+        "longest_streak": longest,
+        "last_checkin_day": last_day,
+    }
+
+
+async def _main(full):
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        start_day = await refresh_streaks(full=full)
+        if start_day is None:
+            print("Streaks mantidos pelo feed de mudanças (use --full para recalcular).")
+        else:
+            print(f"Streaks atualizados a partir de {start_day}.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atualiza os streaks de check-in por usuário (bi.user_streak).")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
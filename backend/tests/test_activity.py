@@ -0,0 +1,49 @@
+# backend/tests/test_activity.py
+# Stickiness dos bitmaps diários com um dict 'days' montado à mão (sem banco).
+#
+#   python -m pytest -q backend/tests
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from activity import ActivityBitmaps, to_bitmap  # noqa: E402
+
+D0 = date(2024, 1, 1)
+
+
+def bitmaps(active_by_offset):
+    """ {deslocamento em dias a partir de D0: [ids]} -> ActivityBitmaps só com esses dias. """
+    activity = ActivityBitmaps()
+    activity.days = {D0 + timedelta(days=n): to_bitmap(ids) for n, ids in active_by_offset.items()}
+    return activity
+
+
+def test_todos_ativos_todo_dia():
+    activity = bitmaps({n: [1, 2, 3] for n in range(30)})
+    result = activity.stickiness(D0 + timedelta(days=15), D0 + timedelta(days=17), 3)
+    assert [(dau, active) for _, dau, active in result] == [(3, 3), (3, 3), (3, 3)]
+
+
+def test_usuarios_alternados():
+    # usuário 1 nos dias pares, usuário 2 nos ímpares
+    activity = bitmaps({n: [1] if n % 2 == 0 else [2] for n in range(30)})
+    result = activity.stickiness(D0 + timedelta(days=15), D0 + timedelta(days=17), 3)
+    assert [(dau, active) for _, dau, active in result] == [(1, 2), (1, 2), (1, 2)]
+
+
+def test_janela_que_sai_com_bitmap_maior():
+    # o dia que sai da janela tem um id maior que todos os dias dentro dela
+    activity = bitmaps({0: [5000], 1: [1], 2: [1], 3: [2]})
+    result = activity.stickiness(D0 + timedelta(days=2), D0 + timedelta(days=3), 2)
+    assert [(d, dau, active) for d, dau, active in result] == [
+        (D0 + timedelta(days=2), 1, 1),
+        (D0 + timedelta(days=3), 1, 2),
+    ]
+
+
+def test_dias_sem_atividade():
+    activity = bitmaps({0: [1, 2], 3: [3]})
+    result = activity.stickiness(D0, D0 + timedelta(days=4), 2)
+    assert [(dau, active) for _, dau, active in result] == [(2, 2), (0, 2), (0, 0), (1, 1), (0, 1)]
@@ -0,0 +1,42 @@
+# backend/tests/test_admin.py
+# Rotas de admin fechadas sem ADMIN_TOKEN (o /admin/slow_queries devolve SQL e parâmetros).
+#
+#   python -m pytest -q backend/tests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://bi@localhost/bi")  # a engine não conecta no import
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import metrics  # noqa: E402
+
+SLOW_QUERY = {"sql": "SELECT * FROM consumers.payment WHERE user_id = :user_id", "params": {"user_id": 42}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(metrics, "slow_queries", [SLOW_QUERY])
+    return TestClient(main.app)  # sem "with": o lifespan (jobs de refresh) não roda
+
+
+def test_slow_queries_sem_admin_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.get("/admin/slow_queries").status_code == 403
+    assert client.get("/admin/slow_queries", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_slow_queries_token_errado(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/admin/slow_queries").status_code == 403
+    assert client.get("/admin/slow_queries", headers={"X-Admin-Token": "s3cre"}).status_code == 403
+
+
+def test_slow_queries_token_certo(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    res = client.get("/admin/slow_queries", headers={"X-Admin-Token": "s3cret"})
+    assert res.status_code == 200
+    assert res.json()["queries"] == [SLOW_QUERY]
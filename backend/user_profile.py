@@ -0,0 +1,264 @@
+# backend/user_profile.py
+# Perfil de atividade por usuário (bi.user_daily_activity + bi.user_profile, ver rollups.sql).
+#
+# Os endpoints da Visão do Usuário Final liam as tabelas fato a cada chamada (4 subqueries
+# correlacionadas no gamification_stats e outro scan de user_time no activity_history).
+# Agora são uma leitura de bi.user_profile pela chave primária (user_id), mantida em 2 passos:
+#   1. bi.user_daily_activity: check-ins, minutos ativos e calorias por usuário e dia.
+#      Incremental pelo watermark, como os rollups; o dia anterior ao watermark também é refeito
+#      (check-ins que começaram antes da meia-noite e terminaram depois).
+#   2. bi.user_profile: 1 linha por usuário com a janela de 30 dias (somas + check-ins por dia),
+#      conquistas e pontos do rank. Recalculada só para os usuários com atividade, conquistas
+#      ou cadastro alterados desde o último refresh; na virada do dia a janela anda para
+#      todos, então o perfil de todos é recalculado (a partir do passo 1, que é pequeno).
+#      O "cadastro alterado" vem de consumers.user.updated_at: REQUER a migração V011 (trigger
+#      que atualiza o updated_at em todo UPDATE); sem ela a mudança só entra na virada do dia.
+#
+# Variáveis de ambiente:
+#   USER_PROFILE_REFRESH_SECONDS -> intervalo do refresh (padrão 60, lido no main.py)
+#
+# Uso manual:
+#   python backend/user_profile.py          -> incremental
+#   python backend/user_profile.py --full   -> recalcula todo o histórico
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import text
+
+import database
+from database import fetch_all
+
+DAILY_WATERMARK = "user_daily_activity"
+PROFILE_WATERMARK = "user_profile"
+FULL_REFRESH_START = date(1900, 1, 1)
+WINDOW_DAYS = 30
+
+# Endpoints que leem do perfil (o cache deles é invalidado após cada refresh)
+ENDPOINTS_PROFILE = [
+    "/bi/user/activity_history", "/bi/user/gamification_stats", "/bi/user/profile", "/bi/user/profiles",
+]
+
+EMPTY_PROFILE = {
+    "total_conquistas": 0, "total_pontos": 0,
+    "checkins_30d": 0, "total_minutos_ativos_30d": 0, "total_calorias_30d": 0,
+    "checkins_por_dia": {"labels": [], "values": []},
+}
+
+SQL_DAILY_DELETE = "DELETE FROM bi.user_daily_activity WHERE day >= :start_day"
+
+SQL_DAILY = """
+    INSERT INTO bi.user_daily_activity (user_id, day, checkins, active_minutes, calories)
+    SELECT user_id, day, SUM(checkins), SUM(active_minutes), SUM(calories)
+    FROM (
+        -- Check-ins e minutos ativos (check-ins finalizados)
+        SELECT
+            user_id,
+            DATE(created_at) as day,
+            COUNT(*) FILTER (WHERE type = 'CHECKIN') as checkins,
+            COALESCE(SUM(EXTRACT(EPOCH FROM (finished_at - created_at)) / 60)
+                FILTER (WHERE type = 'CHECKIN' AND status = 'FINISHED' AND finished_at IS NOT NULL), 0)
+                as active_minutes,
+            0 as calories
+        FROM consumers.user_time
+        WHERE created_at >= :start_ts
+          AND user_id IS NOT NULL
+        GROUP BY user_id, day
+
+        UNION ALL
+
+        -- Calorias
+        SELECT uhp.user_id, DATE(uhp.recorded_at) as day, 0, 0, SUM(uhp.value)
+        FROM consumers.user_health_point uhp
+        JOIN consumers.health_point hp ON uhp.health_point_id = hp.id
+        WHERE hp.name = 'Calorias Queimadas'
+          AND uhp.recorded_at >= :start_ts
+          AND uhp.user_id IS NOT NULL
+        GROUP BY uhp.user_id, day
+    ) x
+    GROUP BY user_id, day
+    HAVING SUM(checkins) > 0 OR SUM(active_minutes) > 0 OR SUM(calories) > 0;
+"""
+
+# Usuários cujo perfil muda com o que chegou desde :start_day
+SQL_CHANGED_USERS = """
+    SELECT user_id FROM bi.user_daily_activity WHERE day >= :start_day
+    UNION
+    SELECT user_id FROM consumers.user_health_stamp WHERE created_at >= :start_ts
+    UNION
+    SELECT id FROM consumers.user WHERE updated_at >= :start_ts
+"""
+
+
+def _profile_sql(only):
+    """ Upsert do perfil: de todos os usuários, dos alterados desde :start_day ou dos ids em :user_ids. """
+    users = {
+        "all": "",
+        "changed": "AND {column} IN (SELECT user_id FROM changed)",
+        "ids": "AND {column} = ANY(:user_ids)",
+    }[only]
+    changed = f"WITH changed AS ({SQL_CHANGED_USERS})" if only == "changed" else ""
+
+    def filter_by(column):
+        return users.format(column=column)
+
+    return f"""
+        {changed}
+        INSERT INTO bi.user_profile
+            (user_id, stamps, points, checkins_30d, active_minutes_30d, calories_30d,
+             checkin_days, checkin_counts, window_start, refreshed_at)
+        SELECT
+            u.id,
+            COALESCE(st.stamps, 0),
+            COALESCE(r.points, 0),
+            COALESCE(a.checkins, 0),
+            COALESCE(a.active_minutes, 0),
+            COALESCE(a.calories, 0),
+            COALESCE(a.days, '{{}}'), COALESCE(a.counts, '{{}}'),
+            :window_start,
+            CURRENT_TIMESTAMP
+        FROM consumers.user u
+        LEFT JOIN consumers.rank r ON r.id = u.rank_id
+        LEFT JOIN (
+            SELECT user_id, COUNT(id) as stamps
+            FROM consumers.user_health_stamp
+            WHERE TRUE {filter_by("user_id")}
+            GROUP BY user_id
+        ) st ON st.user_id = u.id
+        LEFT JOIN (
+            SELECT
+                user_id,
+                SUM(checkins) as checkins, SUM(active_minutes) as active_minutes, SUM(calories) as calories,
+                array_agg(day ORDER BY day) FILTER (WHERE checkins > 0) as days,
+                array_agg(checkins ORDER BY day) FILTER (WHERE checkins > 0) as counts
+            FROM bi.user_daily_activity
+            WHERE day >= :window_start {filter_by("user_id")}
+            GROUP BY user_id
+        ) a ON a.user_id = u.id
+        WHERE TRUE {filter_by("u.id")}
+        ON CONFLICT (user_id) DO UPDATE
+        SET stamps = EXCLUDED.stamps, points = EXCLUDED.points, checkins_30d = EXCLUDED.checkins_30d,
+            active_minutes_30d = EXCLUDED.active_minutes_30d, calories_30d = EXCLUDED.calories_30d,
+            checkin_days = EXCLUDED.checkin_days, checkin_counts = EXCLUDED.checkin_counts,
+            window_start = EXCLUDED.window_start, refreshed_at = EXCLUDED.refreshed_at;
+    """
+
+
+SQL_PROFILE_ALL = _profile_sql("all")
+SQL_PROFILE_CHANGED = _profile_sql("changed")
+SQL_PROFILE_IDS = _profile_sql("ids")
+
+SQL_GET = """
+    SELECT user_id, stamps, points, checkins_30d, active_minutes_30d, calories_30d,
+           checkin_days, checkin_counts, refreshed_at
+    FROM bi.user_profile
+    WHERE user_id = ANY(:user_ids)
+"""
+
+# Dos ids sem perfil, os usuários cadastrados depois do último refresh (os outros não existem)
+SQL_NEW_USERS = """
+    SELECT id FROM consumers.user
+    WHERE id = ANY(:user_ids)
+      AND created_at >= (SELECT refreshed_at FROM bi.rollup_watermark WHERE name = :name)
+"""
+
+SQL_WATERMARK_GET = "SELECT last_day FROM bi.rollup_watermark WHERE name = :name"
+
+SQL_WATERMARK_SET = """
+    INSERT INTO bi.rollup_watermark (name, last_day, refreshed_at)
+    VALUES (:name, :last_day, CURRENT_TIMESTAMP)
+    ON CONFLICT (name) DO UPDATE
+    SET last_day = EXCLUDED.last_day, refreshed_at = EXCLUDED.refreshed_at;
+"""
+
+
+async def refresh_profiles(full=False):
+    """
+    Atualiza a atividade diária a partir do watermark e recalcula o perfil dos usuários afetados
+    (de todos, na virada do dia ou com full=True). Tudo em uma transação.
+    Retorna quantos perfis foram gravados.
+    """
+    today = date.today()
+    window_start = today - timedelta(days=WINDOW_DAYS)
+    async with database.engine.begin() as conn:
+        daily_day = profile_day = None
+        if not full:
+            daily_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": DAILY_WATERMARK})).scalar()
+            profile_day = (await conn.execute(text(SQL_WATERMARK_GET), {"name": PROFILE_WATERMARK})).scalar()
+        start_day = daily_day - timedelta(days=1) if daily_day else FULL_REFRESH_START
+
+        params = {"start_day": start_day, "start_ts": datetime.combine(start_day, time.min)}
+        await conn.execute(text(SQL_DAILY_DELETE), params)
+        await conn.execute(text(SQL_DAILY), params)
+
+        # Janela de 30 dias andou (ou nunca foi calculada): recalcula todos os perfis
+        if profile_day != today:
+            result = await conn.execute(text(SQL_PROFILE_ALL), {"window_start": window_start})
+        else:
+            result = await conn.execute(text(SQL_PROFILE_CHANGED), {**params, "window_start": window_start})
+
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": DAILY_WATERMARK, "last_day": today})
+        await conn.execute(text(SQL_WATERMARK_SET), {"name": PROFILE_WATERMARK, "last_day": today})
+        return result.rowcount
+
+
+async def refresh_users(user_ids):
+    """ Recalcula o perfil só destes usuários (a partir da atividade diária já gravada). """
+    async with database.engine.begin() as conn:
+        window_start = date.today() - timedelta(days=WINDOW_DAYS)
+        await conn.execute(text(SQL_PROFILE_IDS), {"window_start": window_start, "user_ids": sorted(user_ids)})
+
+
+def _profile(row):
+    return {
+        "user_id": row[0],
+        "total_conquistas": row[1],
+        "total_pontos": row[2],
+        "checkins_30d": row[3],
+        "total_minutos_ativos_30d": round(row[4]),
+        "total_calorias_30d": round(row[5]),
+        "checkins_por_dia": {"labels": list(row[6]), "values": list(row[7])},
+        "refreshed_at": row[8],
+    }
+
+
+async def get_profiles(user_ids):
+    """
+    {user_id: perfil} lidos pela chave primária. Usuários cadastrados depois do último refresh
+    são calculados na hora; ids inexistentes ficam de fora (sem escrita no banco).
+    """
+    user_ids = sorted(set(user_ids))
+    profiles = {r[0]: _profile(r) for r in await fetch_all(SQL_GET, {"user_ids": user_ids})}
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        new_users = [r[0] for r in await fetch_all(SQL_NEW_USERS, {"user_ids": missing, "name": PROFILE_WATERMARK})]
+        if new_users:
+            await refresh_users(new_users)
+            profiles.update({r[0]: _profile(r) for r in await fetch_all(SQL_GET, {"user_ids": new_users})})
+    return profiles
+
+
+async def get_profile(user_id):
+    """ Perfil de um usuário (EMPTY_PROFILE se o usuário não existe). """
+    return (await get_profiles([user_id])).get(user_id, {"user_id": user_id, **EMPTY_PROFILE})
+
+
+async def _main(full):
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database.init_engine(os.getenv("DATABASE_URL"))
+    try:
+        total = await refresh_profiles(full=full)
+        print(f"Perfil de {total} usuários atualizado.")
+    finally:
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Atualiza o perfil de atividade por usuário (bi.user_profile).")
+    parser.add_argument("--full", action="store_true", help="Recalcula todo o histórico (ignora o watermark).")
+    args = parser.parse_args()
+    asyncio.run(_main(args.full))
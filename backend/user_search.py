@@ -0,0 +1,75 @@
+# backend/user_search.py
+# Busca de usuários (typeahead) para o seletor da Visão do Usuário Final.
+#
+# Procura o texto digitado em name e email dos usuários ativos e devolve páginas ordenadas
+# por (name, id) com paginação keyset: a próxima página começa depois do último (name, id)
+# retornado. Não usa OFFSET, então a página 1000 custa o mesmo que a primeira.
+#
+# Índices (migração V005):
+#   - sem texto           -> (name, id) WHERE active: leitura direta da página pelo índice
+#   - 1 a 2 caracteres    -> prefixo em lower(name) / lower(email) (text_pattern_ops)
+#   - 3+ caracteres       -> "contém" com pg_trgm (GIN gin_trgm_ops em name e email)
+#
+# Variáveis de ambiente:
+#   USER_SEARCH_MAX_LIMIT -> máximo de usuários por página (padrão 100)
+import os
+
+from database import fetch_all
+
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", "100"))
+
+# A partir de quantos caracteres a busca vira "contém" (trigramas têm 3 letras)
+TRIGRAM_MIN_CHARS = 3
+
+MATCH = {
+    "browse": "",
+    "prefix": "AND (lower(name) LIKE :pattern OR lower(email) LIKE :pattern)",
+    "contains": "AND (name ILIKE :pattern OR email ILIKE :pattern)",
+}
+
+
+def _search_sql(mode, after):
+    keyset = "AND (name, id) > (:after_name, :after_id)" if after else ""
+    return f"""
+        SELECT id, name, email
+        FROM consumers.user
+        WHERE active = TRUE {MATCH[mode]} {keyset}
+        ORDER BY name, id
+        LIMIT :limit
+    """
+
+
+def _escape_like(text):
+    """ Escapa os curingas do LIKE (\\, % e _) para buscar o texto literal. """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _mode_and_pattern(q):
+    q = q.strip()
+    if not q:
+        return "browse", None
+    if len(q) < TRIGRAM_MIN_CHARS:
+        return "prefix", _escape_like(q.lower()) + "%"
+    return "contains", "%" + _escape_like(q) + "%"
+
+
+async def search_users(q="", limit=20, after_name=None, after_id=None):
+    """
+    Uma página de usuários ativos cujo nome ou email contém 'q', em ordem de (name, id).
+    Para a próxima página, passe o 'next' retornado (after_name/after_id); 'next' = None na última.
+    """
+    limit = max(1, min(limit, USER_SEARCH_MAX_LIMIT))
+    mode, pattern = _mode_and_pattern(q)
+    after = after_name is not None and after_id is not None
+    params = {"limit": limit + 1}  # +1 para saber se existe próxima página
+    if pattern is not None:
+        params["pattern"] = pattern
+    if after:
+        params.update({"after_name": after_name, "after_id": after_id})
+
+    rows = await fetch_all(_search_sql(mode, after), params)
+    items = [{"id": r[0], "name": r[1], "email": r[2]} for r in rows[:limit]]
+    next_page = None
+    if len(rows) > limit:
+        next_page = {"after_name": items[-1]["name"], "after_id": items[-1]["id"]}
+    return {"items": items, "next": next_page}
@@ -0,0 +1,672 @@
+# benchmark.py
+# Benchmark do backend: reproduz o tráfego das 4 páginas do dashboard contra os endpoints /bi
+# e mede latência (p50/p95/p99), vazão e tempo de banco por endpoint.
+#
+# - As rotas são descobertas no próprio app (schema OpenAPI), então endpoints novos entram sozinhos.
+# - Fase "páginas": N usuários virtuais renderizam as páginas do dashboard (mesmas chamadas, na
+#   mesma ordem, que cada página faz ao carregar), escolhidas pelos pesos de PAGINAS.
+# - Fase "varredura": chama uma vez cada rota GET /bi descoberta, por rodada.
+# - Por padrão o app roda no próprio processo (ASGI direto, sem servidor HTTP), o que permite medir
+#   o tempo gasto no banco e o número de queries por requisição (eventos do SQLAlchemy). Com --url,
+#   mede um servidor já rodando; o tempo de banco vem do header Server-Timing (ver backend/metrics.py).
+# - Fase "approx" (--approx-rounds): nas rotas com modo approx=true (sketches HLL), chama cada uma
+#   em sequência no modo exato e no aproximado, com os mesmos parâmetros, e compara as latências.
+#   Use com --no-cache (senão as duas medem o cache).
+# - Fase "scans" (--scan-renders, só em processo): renderiza cada página N vezes com o cache de KPIs
+#   limpo e conta as leituras de tabela de cada renderização (nós de scan do EXPLAIN de cada query
+#   executada; as partições contam como a tabela mãe). Mostra quantas vezes cada tabela é lida.
+# - O resultado sai em JSON (--output) para comparar execuções entre commits (--compare).
+#
+# Uso:
+#   python benchmark.py                                   -> 8 usuários virtuais por 30s, app em processo
+#   python benchmark.py --seed-scale 10 --seed 42         -> antes, popula o banco em SF10 e recalcula rollups, bitmaps e sketches
+#   python benchmark.py --no-cache --output bench_novo.json --compare bench_base.json
+#   python benchmark.py --url http://127.0.0.1:8000
+#   python benchmark.py --no-cache --approx-rounds 20 --duration 0 --sweep-rounds 0
+#   python benchmark.py --scan-renders 3 --duration 0 --sweep-rounds 0 --warmup 0
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+
+# Marca, nos parâmetros das páginas, o ID da entidade escolhida no selectbox
+ENTIDADE = ...
+
+# Chamadas que cada página do dashboard faz ao renderizar (ver dashboard/pages/*.py).
+# "entidade" = lista de onde sai o ID escolhido no selectbox; "peso" = frequência relativa da página.
+PAGINAS = {
+    "1_Visao_Parceiro": {
+        "peso": 40,
+        "entidade": "partners",
+        "chamadas": [
+            ("/bi/partners_list", {}),
+            ("/bi/batch", {
+                "kpis": "revenue,checkins,partner/reservation_status,partner/occupation_by_hour,partner/kpi_overview",
+                "partner_id": ENTIDADE, "days": 30,
+            }),
+        ],
+    },
+    "2_Visao_B2B": {
+        "peso": 25,
+        "entidade": "clients",
+        "chamadas": [
+            ("/bi/b2b/clients_list", {}),
+            ("/bi/batch", {
+                "kpis": "b2b/engagement_stats,b2b/cost_per_collaborator,b2b/campaign_participation,b2b/mev_score_variation",
+                "client_id": ENTIDADE,
+            }),
+        ],
+    },
+    "3_Visao_Usuario_Final": {
+        "peso": 25,
+        "entidade": "users",
+        "chamadas": [
+            ("/bi/user/search", {"q": "", "limit": 20}),
+            ("/bi/user/activity_history", {"user_id": ENTIDADE}),
+            ("/bi/user/gamification_stats", {"user_id": ENTIDADE}),
+            ("/bi/user/streak", {"user_id": ENTIDADE}),
+        ],
+    },
+    "4_Visao_Interna": {
+        "peso": 10,
+        "entidade": None,
+        "chamadas": [
+            ("/bi/batch", {"kpis": "kpi_overview,ltv_cac,conversion_funnel,revenue_by_region,gamification/missions,gamification/streaks"}),
+        ],
+    },
+}
+
+# Listas usadas nos selectbox (e na varredura, para preencher parâmetros obrigatórios)
+ENTIDADES = {
+    "partners": ("/bi/partners_list", "partner_id"),
+    "clients": ("/bi/b2b/clients_list", "client_id"),
+    "users": ("/bi/user/list", "user_id"),
+}
+
+
+# --- Clientes (app em processo ou servidor remoto) ---
+
+SERVER_TIMING_DB = re.compile(r"\bdb;dur=([\d.]+)")
+
+# Acumulador [segundos, queries] do banco da requisição atual (modo em processo)
+_db_timer = contextvars.ContextVar("db_timer", default=None)
+
+# Queries [(sql, parâmetros)] executadas durante uma renderização (fase "scans")
+_sql_log = contextvars.ContextVar("sql_log", default=None)
+
+# Sufixo das partições mensais (ver migrations/V001): contam como a tabela mãe
+PARTITION_SUFFIX = re.compile(r"_(\d{4}_\d{2}|default)$")
+
+
+def scanned_tables(plan):
+    """ Tabelas lidas por um plano do EXPLAIN, uma entrada por leitura (o Append das partições conta uma vez). """
+    if "Relation Name" in plan:
+        return [f"{plan.get('Schema', '')}.{PARTITION_SUFFIX.sub('', plan['Relation Name'])}"]
+    tables = [table for child in plan.get("Plans", []) for table in scanned_tables(child)]
+    if plan["Node Type"] in ("Append", "Merge Append"):
+        return list(dict.fromkeys(tables))
+    return tables
+
+
+class InProcessClient:
+    """ Chama o app FastAPI direto pela interface ASGI, medindo o tempo de banco por requisição. """
+
+    def __init__(self, no_cache=False):
+        sys.path.insert(0, BACKEND_DIR)
+        import main
+        import database
+        from sqlalchemy import event
+
+        self.app = main.app
+        self.database = database
+        self.kpi_cache = main.kpi_cache
+        if no_cache:
+            self.kpi_cache.enabled = False
+
+        @event.listens_for(database.engine.sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+        @event.listens_for(database.engine.sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["bench_started"].pop()
+            timer = _db_timer.get()
+            if timer is not None:
+                timer[0] += elapsed
+                timer[1] += 1
+            log = _sql_log.get()
+            if log is not None:
+                log.append((statement, parameters))
+
+    async def get(self, path, params):
+        """ Retorna (status, corpo, segundos_no_banco, queries). """
+        timer = [0.0, 0]
+        _db_timer.set(timer)
+        status, body = await self._asgi_get(path, params)
+        return status, body, timer[0], timer[1]
+
+    async def _asgi_get(self, path, params):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "root_path": "",
+            "path": path, "raw_path": path.encode(), "query_string": urlencode(params).encode(),
+            "headers": [(b"host", b"benchmark")],
+            "client": ("127.0.0.1", 0), "server": ("benchmark", 80),
+        }
+        response = {"status": 0, "body": []}
+        done = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body"):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        done.set()
+        return response["status"], b"".join(response["body"])
+
+    async def render_statements(self, calls):
+        """ Faz as chamadas de uma renderização e devolve as queries executadas [(sql, parâmetros)]. """
+        log = []
+        token = _sql_log.set(log)
+        try:
+            for path, params in calls:
+                await self.get(path, params)
+        finally:
+            _sql_log.reset(token)
+        return log
+
+    async def count_scans(self, statements):
+        """ {tabela: leituras} somando o EXPLAIN de cada query (só SELECT/WITH). """
+        scans = {}
+        async with self.database.engine.connect() as conn:
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                raw = (await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)).scalar()
+                plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+                for table in scanned_tables(plan):
+                    scans[table] = scans.get(table, 0) + 1
+        return scans
+
+    def openapi(self):
+        return self.app.openapi()
+
+    def cache_stats(self):
+        return self.kpi_cache.stats()
+
+    async def close(self):
+        await self.database.dispose_engine()
+
+
+class RemoteClient:
+    """ Chama um servidor já rodando (requests em threads). O tempo de banco vem do header Server-Timing. """
+
+    def __init__(self, url, concurrency):
+        import requests
+
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def get(self, path, params):
+        loop = asyncio.get_running_loop()
+        res = await loop.run_in_executor(self.executor, lambda: self.session.get(f"{self.url}{path}", params=params))
+        match = SERVER_TIMING_DB.search(res.headers.get("Server-Timing", ""))
+        db_seconds = float(match.group(1)) / 1000 if match else None
+        return res.status_code, res.content, db_seconds, None
+
+    def openapi(self):
+        res = self.session.get(f"{self.url}/openapi.json")
+        res.raise_for_status()
+        return res.json()
+
+    def cache_stats(self):
+        try:
+            res = self.session.get(f"{self.url}/admin/cache/stats", headers={"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")})
+            return res.json() if res.ok else None
+        except Exception:
+            return None
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+# --- Descoberta de rotas e entidades ---
+
+def discover_routes(openapi):
+    """
+    Lista as rotas GET /bi do app: [(caminho, [(parametro, obrigatorio, padrao)])].
+    """
+    routes = []
+    for path, methods in sorted(openapi.get("paths", {}).items()):
+        operation = methods.get("get")
+        if not path.startswith("/bi/") or operation is None:
+            continue
+        params = [
+            (p["name"], p.get("required", False), p.get("schema", {}).get("default"))
+            for p in operation.get("parameters", [])
+            if p.get("in") == "query"
+        ]
+        routes.append((path, params))
+    return routes
+
+
+async def load_entities(client):
+    """ IDs disponíveis para os selectbox: {"partners": [...], "clients": [...], "users": [...]}. """
+    entities = {}
+    for name, (path, _) in ENTIDADES.items():
+        status, body, _, _ = await client.get(path, {})
+        entities[name] = [item["id"] for item in json.loads(body)] if status == 200 else []
+        print(f"-> {len(entities[name])} {name} para os filtros.")
+    return entities
+
+
+def sweep_calls(routes, entities, rng):
+    """ Uma chamada por rota descoberta; rotas com parâmetro obrigatório desconhecido ficam de fora. """
+    by_param = {param: name for name, (_, param) in ENTIDADES.items()}
+    calls = []
+    for path, params in routes:
+        query = {}
+        for name, required, default in params:
+            if not required:
+                continue
+            if name in by_param and entities.get(by_param[name]):
+                query[name] = rng.choice(entities[by_param[name]])
+            elif default is not None:
+                query[name] = default
+            else:
+                query = None
+                break
+        if query is not None:
+            calls.append((path, query))
+    return calls
+
+
+def approx_calls(routes, entities, rng):
+    """ Chamadas da varredura para as rotas que aceitam approx=true. """
+    approx_paths = {path for path, params in routes if any(name == "approx" for name, _, _ in params)}
+    return [(path, query) for path, query in sweep_calls(routes, entities, rng) if path in approx_paths]
+
+
+def page_calls(page, entities, rng):
+    entity = page["entidade"]
+    entity_id = rng.choice(entities[entity]) if entity else None
+    return [
+        (path, {k: (entity_id if v is ENTIDADE else v) for k, v in params.items()})
+        for path, params in page["chamadas"]
+    ]
+
+
+# --- Medição ---
+
+def percentile(values, p):
+    """ Percentil por "nearest rank" (values já ordenado). """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(p / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.endpoints = {}  # caminho -> {"lat": [], "db": [], "queries": [], "errors": 0}
+        self.pages = {}      # página -> [latência da renderização]
+
+    def add(self, path, seconds, status, db_seconds, queries):
+        item = self.endpoints.setdefault(path, {"lat": [], "db": [], "queries": [], "errors": 0})
+        item["lat"].append(seconds * 1000)
+        if status >= 400:
+            item["errors"] += 1
+        if db_seconds is not None:
+            item["db"].append(db_seconds * 1000)
+        if queries is not None:
+            item["queries"].append(queries)
+
+    def add_page(self, page, seconds):
+        self.pages.setdefault(page, []).append(seconds * 1000)
+
+    @staticmethod
+    def summarize(latencies, duration):
+        ordered = sorted(latencies)
+        return {
+            "count": len(ordered),
+            "throughput_rps": round(len(ordered) / duration, 2) if duration else None,
+            "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else None,
+            "p50_ms": _round(percentile(ordered, 50)),
+            "p95_ms": _round(percentile(ordered, 95)),
+            "p99_ms": _round(percentile(ordered, 99)),
+            "max_ms": _round(ordered[-1] if ordered else None),
+        }
+
+    def report(self, duration):
+        endpoints = {}
+        for path, item in sorted(self.endpoints.items()):
+            summary = self.summarize(item["lat"], duration)
+            summary["errors"] = item["errors"]
+            db = sorted(item["db"])
+            summary["db_mean_ms"] = round(sum(db) / len(db), 3) if db else None
+            summary["db_p95_ms"] = _round(percentile(db, 95))
+            queries = item["queries"]
+            summary["db_queries_mean"] = round(sum(queries) / len(queries), 2) if queries else None
+            endpoints[path] = summary
+        pages = {page: self.summarize(lat, duration) for page, lat in sorted(self.pages.items())}
+        all_latencies = [lat for item in self.endpoints.values() for lat in item["lat"]]
+        total = self.summarize(all_latencies, duration)
+        total["errors"] = sum(item["errors"] for item in self.endpoints.values())
+        return {"total": total, "pages": pages, "endpoints": endpoints}
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+async def timed_get(client, stats, path, params):
+    started = time.perf_counter()
+    try:
+        status, _, db_seconds, queries = await client.get(path, params)
+    except Exception as e:
+        print(f"ERRO em {path}: {e}")
+        status, db_seconds, queries = 599, None, None
+    if stats is not None:
+        stats.add(path, time.perf_counter() - started, status, db_seconds, queries)
+
+
+async def virtual_user(client, entities, deadline, rng, stats):
+    """ Renderiza páginas em sequência (as chamadas de uma página são feitas em ordem, como no Streamlit). """
+    pages = [name for name, page in PAGINAS.items() if not page["entidade"] or entities.get(page["entidade"])]
+    weights = [PAGINAS[name]["peso"] for name in pages]
+    while time.monotonic() < deadline:
+        name = rng.choices(pages, weights)[0]
+        started = time.perf_counter()
+        for path, params in page_calls(PAGINAS[name], entities, rng):
+            await timed_get(client, stats, path, params)
+        if stats is not None:
+            stats.add_page(name, time.perf_counter() - started)
+
+
+async def run_pages(client, entities, concurrency, seconds, seed, stats):
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        virtual_user(client, entities, deadline, random.Random(f"{seed}:{vu}"), stats)
+        for vu in range(concurrency)
+    ])
+    return time.perf_counter() - started
+
+
+async def run_sweep(client, routes, entities, rounds, concurrency, seed, stats):
+    rng = random.Random(f"{seed}:sweep")
+    calls = [call for _ in range(rounds) for call in sweep_calls(routes, entities, rng)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path, params):
+        async with semaphore:
+            await timed_get(client, stats, path, params)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(path, params) for path, params in calls])
+    return time.perf_counter() - started
+
+
+async def run_approx(client, routes, entities, rounds, seed):
+    """ Exato x aproximado, rota a rota, em sequência (uma requisição por vez). """
+    rng = random.Random(f"{seed}:approx")
+    exact, approx = Stats(), Stats()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for path, query in approx_calls(routes, entities, rng):
+            await timed_get(client, exact, path, dict(query, approx="false"))
+            await timed_get(client, approx, path, dict(query, approx="true"))
+    duration = time.perf_counter() - started
+    exact, approx = exact.report(duration)["endpoints"], approx.report(duration)["endpoints"]
+    result = {}
+    for path in exact:
+        e, a = exact[path], approx.get(path, {})
+        result[path] = {
+            "exact": e,
+            "approx": a,
+            "speedup_p50": round(e["p50_ms"] / a["p50_ms"], 2) if a.get("p50_ms") else None,
+        }
+    return result
+
+
+async def run_scans(client, entities, renders, seed):
+    """
+    Leituras de tabela por renderização de cada página, com o cache de KPIs limpo antes de cada uma.
+    A 1ª renderização mostra o custo "frio"; as seguintes, o que é reaproveitado entre endpoints
+    (ex: totais da plataforma) dentro da mesma janela.
+    """
+    rng = random.Random(f"{seed}:scans")
+    result = {}
+    for name, page in PAGINAS.items():
+        if page["entidade"] and not entities.get(page["entidade"]):
+            continue
+        per_render = []
+        for _ in range(renders):
+            client.kpi_cache.invalidate()
+            statements = await client.render_statements(page_calls(page, entities, rng))
+            per_render.append(await client.count_scans(statements))
+        totals = [sum(scans.values()) for scans in per_render]
+        result[name] = {
+            "renders": renders,
+            "first_render_scans": totals[0],
+            "mean_scans": round(sum(totals) / len(totals), 2),
+            "first_render_by_table": dict(sorted(per_render[0].items())),
+        }
+    return result
+
+
+# --- Preparação do banco ---
+
+def seed_database(scale, seed, workers):
+    """ Popula o banco com generate_fake_data.py (modo bulk) e recalcula rollups, bitmaps, sketches, funis e snapshots. """
+    command = [sys.executable, os.path.join(ROOT, "generate_fake_data.py"), "--bulk", "--scale", str(scale)]
+    if seed is not None:
+        command += ["--seed", str(seed)]
+    if workers:
+        command += ["--workers", str(workers)]
+    print(f"Populando o banco: {' '.join(command[1:])}")
+    subprocess.run(command, cwd=ROOT, check=True)
+    for script in ("rollups.py", "activity.py", "hll.py", "funnel.py", "user_profile.py", "streaks.py"):
+        subprocess.run([sys.executable, os.path.join(BACKEND_DIR, script), "--full"], cwd=ROOT, check=True)
+    subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "partner_snapshot.py")], cwd=ROOT, check=True)
+    # Posiciona o feed de mudanças depois da carga (e limpa o change_log gerado por ela)
+    subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "cdc.py")], cwd=ROOT, check=True)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return None
+
+
+# --- Relatório ---
+
+def print_report(result):
+    print(f"\n{'endpoint':<40}{'n':>7}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'db':>9}")
+    for path, s in result["endpoints"].items():
+        db = f"{s['db_mean_ms']:.1f}" if s["db_mean_ms"] is not None else "-"
+        print(f"{path:<40}{s['count']:>7}{s['errors']:>5}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['throughput_rps']:>9.1f}{db:>9}")
+    print(f"\n{'página':<40}{'n':>7}{'p50':>14}{'p95':>9}{'p99':>9}")
+    for page, s in result["pages"].items():
+        print(f"{page:<40}{s['count']:>7}{s['p50_ms']:>14.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+    total = result["total"]
+    print(f"\nTotal: {total['count']} requisições, {total['errors']} erros, "
+          f"{total['throughput_rps']} req/s, p95 {total['p95_ms']} ms (latências em ms)")
+
+
+def print_approx(result):
+    print(f"\n{'endpoint (exato x approx=true)':<40}{'p50 exato':>12}{'p50 approx':>12}{'p95 exato':>12}"
+          f"{'p95 approx':>12}{'speedup':>10}")
+    for path, s in result.items():
+        e, a = s["exact"], s["approx"]
+        speedup = f"{s['speedup_p50']:.2f}x" if s["speedup_p50"] else "-"
+        print(f"{path:<40}{e['p50_ms']:>12.1f}{a.get('p50_ms') or 0:>12.1f}{e['p95_ms']:>12.1f}"
+              f"{a.get('p95_ms') or 0:>12.1f}{speedup:>10}")
+
+
+def print_scans(result):
+    print(f"\n{'página (leituras de tabela)':<40}{'1ª render':>11}{'média':>9}  por tabela (1ª render)")
+    for page, s in result.items():
+        tables = ", ".join(f"{table} x{count}" for table, count in s["first_render_by_table"].items())
+        print(f"{page:<40}{s['first_render_scans']:>11}{s['mean_scans']:>9.2f}  {tables}")
+
+
+def print_comparison(result, baseline):
+    """ Compara o p95 de cada endpoint (e as leituras de tabela por página) com um JSON de uma execução anterior. """
+    print(f"\nComparação com {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')}):")
+    print(f"{'endpoint':<40}{'p95 antes':>12}{'p95 agora':>12}{'variação':>11}")
+    for path, s in result["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(path, {}).get("p95_ms")
+        if before is None or s["p95_ms"] is None:
+            continue
+        change = (s["p95_ms"] - before) / before * 100 if before else 0.0
+        print(f"{path:<40}{before:>12.1f}{s['p95_ms']:>12.1f}{change:>+10.1f}%")
+    if result.get("scans") and baseline.get("scans"):
+        print(f"\n{'página':<40}{'leituras antes':>16}{'agora':>9}")
+        for page, s in result["scans"].items():
+            before = baseline["scans"].get(page, {}).get("first_render_scans")
+            if before is not None:
+                print(f"{page:<40}{before:>16}{s['first_render_scans']:>9}")
+
+
+async def run(args):
+    if args.url:
+        client = RemoteClient(args.url, args.concurrency)
+    else:
+        client = InProcessClient(no_cache=args.no_cache)
+    try:
+        routes = discover_routes(client.openapi())
+        print(f"-> {len(routes)} rotas GET /bi descobertas.")
+        missing = sorted({path for page in PAGINAS.values() for path, _ in page["chamadas"]} - {p for p, _ in routes})
+        if missing:
+            print(f"AVISO: rotas usadas pelas páginas e não encontradas no app: {', '.join(missing)}")
+        entities = await load_entities(client)
+
+        if args.warmup > 0:
+            print(f"Aquecimento ({args.warmup}s)...")
+            await run_pages(client, entities, args.concurrency, args.warmup, f"{args.seed}:warmup", None)
+
+        stats = Stats()
+        started_at = datetime.now().isoformat(timespec="seconds")
+        print(f"Páginas: {args.concurrency} usuários virtuais por {args.duration}s...")
+        duration = await run_pages(client, entities, args.concurrency, args.duration, args.seed, stats)
+        if args.sweep_rounds > 0:
+            print(f"Varredura: {args.sweep_rounds} rodada(s) em todas as rotas...")
+            duration += await run_sweep(client, routes, entities, args.sweep_rounds, args.concurrency,
+                                        args.seed, stats)
+
+        result = stats.report(duration)
+        if args.approx_rounds > 0:
+            if args.url or not args.no_cache:
+                print("AVISO: com o cache de KPIs ligado, exato e approx medem o cache (use --no-cache).")
+            print(f"Exato x approx: {args.approx_rounds} rodada(s)...")
+            result["approx"] = await run_approx(client, routes, entities, args.approx_rounds, args.seed)
+        if args.scan_renders > 0:
+            if args.url:
+                print("AVISO: a contagem de leituras de tabela só funciona com o app em processo (sem --url).")
+            else:
+                print(f"Leituras de tabela: {args.scan_renders} renderização(ões) por página...")
+                result["scans"] = await run_scans(client, entities, args.scan_renders, args.seed)
+        result["meta"] = {
+            "commit": git_commit(),
+            "started_at": started_at,
+            "mode": "remote" if args.url else "in_process",
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration_s": round(duration, 3),
+            "warmup_s": args.warmup,
+            "sweep_rounds": args.sweep_rounds,
+            "approx_rounds": args.approx_rounds,
+            "scan_renders": args.scan_renders,
+            "seed": args.seed,
+            "seed_scale": args.seed_scale,
+            "cache_enabled": not args.no_cache if not args.url else None,
+            "routes": [path for path, _ in routes],
+            "cache": client.cache_stats(),
+        }
+        return result
+    finally:
+        await client.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints /bi com o tráfego das páginas do dashboard.")
+    parser.add_argument("--url", default=None, help="Servidor já rodando (ex: http://127.0.0.1:8000). "
+                                                    "Sem isso, o app roda no próprio processo.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Usuários virtuais simultâneos.")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos de carga das páginas.")
+    parser.add_argument("--warmup", type=float, default=5, help="Segundos de aquecimento (não entram no resultado).")
+    parser.add_argument("--sweep-rounds", type=int, default=3, help="Rodadas da varredura em todas as rotas /bi.")
+    parser.add_argument("--approx-rounds", type=int, default=0,
+                        help="Rodadas da comparação exato x approx=true (rotas com sketches HLL).")
+    parser.add_argument("--scan-renders", type=int, default=0,
+                        help="Renderizações por página na contagem de leituras de tabela (EXPLAIN das queries).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed da escolha de páginas/entidades (e da carga de dados).")
+    parser.add_argument("--seed-scale", type=float, default=None,
+                        help="Popula o banco antes (generate_fake_data.py --bulk --scale N) e recalcula rollups, bitmaps e sketches.")
+    parser.add_argument("--seed-workers", type=int, default=0, help="Workers da carga de dados (--workers).")
+    parser.add_argument("--no-cache", action="store_true", help="Desliga o cache de KPIs (modo em processo).")
+    parser.add_argument("--output", default=None, help="Arquivo JSON com o resultado.")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para comparar o p95.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.seed_scale:
+        seed_database(args.seed_scale, args.seed, args.seed_workers)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if result.get("approx"):
+        print_approx(result["approx"])
+    if result.get("scans"):
+        print_scans(result["scans"])
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+# bulk_loader.py
+# Modo "bulk" do generate_fake_data.py (python generate_fake_data.py --bulk).
+#
+# Em vez de um INSERT (e um commit) por linha, as linhas são geradas em buffers
+# na memória e enviadas com COPY ... FROM STDIN em lotes grandes.
+# Os IDs são reservados antes nas sequences (IdAllocator), então as FKs
+# (user_scheduling -> user_time -> payment) são ligadas sem RETURNING.
+#
+# Premissa: durante a carga ninguém mais insere nessas tabelas
+# (a reserva de IDs ajusta a sequence com setval).
+#
+# Todas as funções aceitam:
+#   rng -> instância de random.Random (o modo paralelo passa uma com seed por shard)
+#   ids -> {tabela: IdRange} com faixas de IDs já reservadas (modo paralelo);
+#          sem isso, cada função reserva seus IDs com IdAllocator
+#   now -> "agora" da carga (datas relativas são calculadas a partir dele)
+import io
+import random
+from datetime import datetime, timedelta
+
+DEFAULT_BATCH_SIZE = 50000
+
+# Janela de tempo das reservas (igual ao modo linha a linha: últimos 90 dias)
+FACTS_WINDOW_DAYS = 90
+
+
+# --- Infraestrutura de COPY ---
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_text(value):
+    """ Converte um valor Python para o formato texto do COPY (NULL = \\N). """
+    if value is None:
+        return "\\N"
+    kind = type(value)
+    if kind is str:
+        return value.translate(_COPY_ESCAPES)
+    if kind is bool:
+        return "t" if value else "f"
+    return str(value)
+
+
+class CopyBuffer:
+    """ Acumula linhas de uma tabela e envia via COPY quando o lote enche. """
+
+    def __init__(self, cursor, table, columns, batch_size=DEFAULT_BATCH_SIZE):
+        self.cursor = cursor
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        self.lines = []
+        self.total = 0
+
+    def add(self, *values):
+        self.lines.append("\t".join([_copy_text(v) for v in values]))
+
+    def add_trusted(self, *values):
+        """
+        Como add(), mas sem escapar textos: só para valores gerados aqui
+        (números, datas, códigos fixos, "t"/"f"), que nunca têm TAB, quebra de linha ou barra.
+        """
+        self.lines.append("\t".join(["\\N" if v is None else str(v) for v in values]))
+
+    def full(self):
+        return len(self.lines) >= self.batch_size
+
+    def flush(self):
+        if not self.lines:
+            return
+        data = io.StringIO("\n".join(self.lines) + "\n")
+        self.cursor.copy_expert(self.sql, data)
+        self.total += len(self.lines)
+        self.lines = []
+
+
+class IdAllocator:
+    """
+    Reserva blocos de IDs na sequence da tabela (ex: consumers.user_scheduling.id),
+    para que as linhas já saiam com o ID definitivo.
+    """
+
+    def __init__(self, cursor, table, block_size=DEFAULT_BATCH_SIZE):
+        self.cursor = cursor
+        self.block_size = block_size
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        self.sequence = cursor.fetchone()[0]
+        self._next = 0
+        self._end = 0
+
+    def reserve(self, n):
+        """ Reserva n IDs consecutivos e retorna o primeiro. """
+        # O advisory lock serializa reservas de loaders concorrentes na mesma sequence
+        self.cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (self.sequence,))
+        try:
+            self.cursor.execute("SELECT nextval(%s)", (self.sequence,))
+            start = self.cursor.fetchone()[0]
+            self.cursor.execute("SELECT setval(%s, %s)", (self.sequence, start + n - 1))
+        finally:
+            self.cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (self.sequence,))
+        return start
+
+    def next(self):
+        if self._next >= self._end:
+            self._next = self.reserve(self.block_size)
+            self._end = self._next + self.block_size
+        value = self._next
+        self._next += 1
+        return value
+
+
+class IdRange:
+    """
+    Faixa fixa de IDs [start, start + size), reservada antes pelo processo pai
+    (modo paralelo). Mesma interface do IdAllocator.
+    """
+
+    def __init__(self, start, size):
+        self.start = start
+        self.size = size
+        self._next = start
+
+    def reserve(self, n):
+        if self._next + n > self.start + self.size:
+            raise ValueError(f"Faixa de IDs esgotada ({self.start}..{self.start + self.size - 1}).")
+        first = self._next
+        self._next += n
+        return first
+
+    def next(self):
+        return self.reserve(1)
+
+
+def _id_source(cursor, ids, table):
+    """ Usa a faixa pré-reservada da tabela (se houver) ou reserva na sequence. """
+    if ids and table in ids:
+        return ids[table]
+    return IdAllocator(cursor, table)
+
+
+def _flush_all(conn, buffers):
+    """ Envia os buffers na ordem dada (pais antes dos filhos, por causa das FKs) e commita. """
+    for buffer in buffers:
+        buffer.flush()
+    conn.commit()
+
+
+# --- Tabelas ---
+
+def bulk_users(conn, n, rank_ids_list, fake, rng=random, batch_size=DEFAULT_BATCH_SIZE, ids=None, now=None):
+    """
+    Versão bulk de populate_users: n usuários, 40% inativos (já gerados com active = FALSE).
+    Retorna (todos_os_ids, ids_ativos).
+    """
+    if not rank_ids_list:
+        print("Erro: Lista de IDs de Rank está vazia. Abortando bulk_users.")
+        return [], []
+
+    print(f"[BULK] Populando {n} registros em consumers.user...")
+    cursor = conn.cursor()
+    names = [fake.name() for _ in range(min(n, 5000))]
+    zip_codes = [fake.postcode() for _ in range(min(n, 2000))]
+    now = now or datetime.now()
+
+    users = CopyBuffer(cursor, "consumers.user",
+                       ["id", "name", "email", "password", "created_at", "active", "zip_code", "rank_id"], batch_size)
+    first_id = _id_source(cursor, ids, "consumers.user").reserve(n) if n > 0 else 0
+
+    user_ids, active_ids = [], []
+    for user_id in range(first_id, first_id + n):
+        active = rng.random() >= 0.4
+        created_at = now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+        users.add(
+            user_id,
+            rng.choice(names),
+            f"user{user_id}@example.com",  # único por construção
+            "hash_de_senha_segura",
+            created_at,
+            active,
+            rng.choice(zip_codes),
+            rng.choice(rank_ids_list),
+        )
+        user_ids.append(user_id)
+        if active:
+            active_ids.append(user_id)
+        if users.full():
+            _flush_all(conn, [users])
+    _flush_all(conn, [users])
+
+    print(f"-> {len(user_ids)} usuários criados no total ({len(active_ids)} ativos, {len(user_ids) - len(active_ids)} inativos).")
+    return user_ids, active_ids
+
+
+def bulk_partners_and_schedules(conn, n, fake, rng=random, batch_size=DEFAULT_BATCH_SIZE, ids=None):
+    """
+    Versão bulk de populate_partners_and_schedules (3 a 6 horários por parceiro).
+    Retorna (partner_ids, {schedule_id: partner_id}).
+    """
+    print(f"[BULK] Populando {n} parceiros (providers.partner) e seus horários...")
+    cursor = conn.cursor()
+    companies = [fake.company() for _ in range(min(n, 2000))]
+
+    partners = CopyBuffer(cursor, "providers.partner",
+                          ["id", "name", "email", "registry_code", "active", "verified"], batch_size)
+    activities = CopyBuffer(cursor, "providers.partner_activity", ["id", "name", "partner_id", "active"], batch_size)
+    schedules = CopyBuffer(cursor, "providers.partner_schedule",
+                           ["id", "partner_id", "partner_activity_id", "active", "recurrent", "value", "hour"], batch_size)
+    partner_first = _id_source(cursor, ids, "providers.partner").reserve(n) if n > 0 else 0
+    activity_first = _id_source(cursor, ids, "providers.partner_activity").reserve(n) if n > 0 else 0
+    schedule_ids = _id_source(cursor, ids, "providers.partner_schedule")
+
+    partner_ids, schedule_to_partner = [], {}
+    for i in range(n):
+        partner_id = partner_first + i
+        activity_id = activity_first + i
+        partners.add(partner_id, rng.choice(companies), f"partner{partner_id}@example.com",
+                     f"{partner_id:014d}", True, True)
+        activities.add(activity_id, "Aula de Teste", partner_id, True)
+        for _ in range(rng.randint(3, 6)):
+            schedule_id = schedule_ids.next()
+            schedules.add(schedule_id, partner_id, activity_id, True, True,
+                          round(rng.uniform(20.0, 50.0), 2), rng.randint(8, 20))
+            schedule_to_partner[schedule_id] = partner_id
+        partner_ids.append(partner_id)
+        if schedules.full():
+            _flush_all(conn, [partners, activities, schedules])
+    _flush_all(conn, [partners, activities, schedules])
+
+    print(f"-> {len(partner_ids)} parceiros e {len(schedule_to_partner)} horários criados.")
+    return partner_ids, schedule_to_partner
+
+
+def bulk_b2b_collaborators(conn, client_ids, user_ids, rng=random, batch_size=DEFAULT_BATCH_SIZE, ids=None,
+                           offset=0):
+    """
+    Versão bulk de populate_b2b_collaborators (round-robin usuários -> clientes).
+    'offset' é a posição do primeiro usuário na lista global (mantém o round-robin entre shards).
+    """
+    if not client_ids:
+        print("-> [ERRO] Nenhum client_id encontrado para ligar colaboradores. Abortando.")
+        return
+    print(f"[BULK] Populando {len(user_ids)} colaboradores B2B...")
+    cursor = conn.cursor()
+    collaborators = CopyBuffer(cursor, "companies.companies_client_collaborator",
+                               ["id", "client_id", "user_id", "role"], batch_size)
+    collaborator_ids = _id_source(cursor, ids, "companies.companies_client_collaborator")
+    for i, user_id in enumerate(user_ids, start=offset):
+        collaborators.add_trusted(collaborator_ids.next(), client_ids[i % len(client_ids)], user_id,
+                                  rng.choice(["Analista", "Operacional", "Gestor"]))
+        if collaborators.full():
+            _flush_all(conn, [collaborators])
+    _flush_all(conn, [collaborators])
+    print(f"-> {collaborators.total} colaboradores B2B ligados aos clientes.")
+
+
+def bulk_facts(conn, n, user_ids, schedule_to_partner_map, calories_id=None, rng=random,
+               batch_size=DEFAULT_BATCH_SIZE, window_days=FACTS_WINDOW_DAYS, ids=None, now=None):
+    """
+    Versão bulk de populate_facts, com as mesmas probabilidades:
+    reserva -> pagamento (70%) / check-in (50%) -> NPS (30%), calorias, stamp (10%).
+
+    Cada usuário recebe minutos distintos dentro da janela, então a UNIQUE
+    (user_id, scheduled_at, hour, minute) de user_scheduling nunca conflita
+    (os fatos devem ir para usuários criados nesta mesma carga).
+    """
+    print(f"[BULK] Populando {n} fatos (reservas, pagamentos, check-ins, NPS, calorias)...")
+    if not user_ids or not schedule_to_partner_map:
+        print("Faltando IDs de usuários ou horários. Pulando fatos.")
+        return
+
+    cursor = conn.cursor()
+    schedule_list = sorted(schedule_to_partner_map.keys())
+    window_minutes = window_days * 24 * 60
+    window_start = (now or datetime.now()).replace(second=0, microsecond=0) - timedelta(minutes=window_minutes)
+
+    # Quantas reservas cada usuário terá (limitado a 1 por minuto da janela)
+    per_user = [0] * len(user_ids)
+    for index in rng.choices(range(len(user_ids)), k=n):
+        per_user[index] += 1
+
+    schedulings = CopyBuffer(cursor, "consumers.user_scheduling",
+                             ["id", "user_id", "partner_schedule_id", "scheduled_at", "status", "active",
+                              "hour", "minute", "full_time", "created_at"], batch_size)
+    user_times = CopyBuffer(cursor, "consumers.user_time",
+                            ["id", "user_id", "partner_id", "type", "status", "active", "created_at", "finished_at"],
+                            batch_size)
+    payments = CopyBuffer(cursor, "consumers.payment",
+                          ["id", "user_scheduling_id", "user_time_id", "status", "amount_due", "payment_type",
+                           "active", "created_at", "value_obtained", "transferred_value"], batch_size)
+    feedbacks = CopyBuffer(cursor, "consumers.user_health_feedback",
+                           ["id", "user_id", "rating", "feedback_type", "related_entity_id", "submitted_at"],
+                           batch_size)
+    health_points = CopyBuffer(cursor, "consumers.user_health_point",
+                               ["id", "user_id", "health_point_id", "value", "recorded_at"], batch_size)
+    stamps = CopyBuffer(cursor, "consumers.user_health_stamp", ["id", "user_id", "stamp_id", "achieved_at"],
+                        batch_size)
+    # Ordem do flush = ordem das FKs
+    buffers = [schedulings, user_times, payments, feedbacks, health_points, stamps]
+
+    scheduling_ids = _id_source(cursor, ids, "consumers.user_scheduling")
+    user_time_ids = _id_source(cursor, ids, "consumers.user_time")
+    payment_ids = _id_source(cursor, ids, "consumers.payment")
+    feedback_ids = _id_source(cursor, ids, "consumers.user_health_feedback")
+    health_point_ids = _id_source(cursor, ids, "consumers.user_health_point")
+    stamp_ids = _id_source(cursor, ids, "consumers.user_health_stamp")
+    statuses = ["CONFIRMED", "CONFIRMED", "CONFIRMED", "CANCELED", "NO-SHOW"]
+
+    for user_id, k in zip(user_ids, per_user):
+        if k == 0:
+            continue
+        user_stamps = set()
+        for minute in sorted(rng.sample(range(window_minutes), min(k, window_minutes))):
+            created_at = window_start + timedelta(minutes=minute, seconds=rng.randint(0, 59))
+            created_text = str(created_at)  # "YYYY-MM-DD HH:MM:SS"
+            schedule_id = rng.choice(schedule_list)
+            scheduling_id = scheduling_ids.next()
+            schedulings.add_trusted(
+                scheduling_id, user_id, schedule_id, created_text[:10], rng.choice(statuses), "t",
+                created_text[11:13], created_text[14:16], created_text[11:16], created_text,
+            )
+
+            has_payment = rng.random() < 0.7
+            user_time_id = None
+            if rng.random() < 0.5:
+                partner_id = schedule_to_partner_map[schedule_id]
+                checkin_start = created_at + timedelta(minutes=rng.randint(-5, 5))
+                checkin_end = checkin_start + timedelta(minutes=rng.randint(30, 90))
+                user_time_id = user_time_ids.next()
+                user_times.add_trusted(user_time_id, user_id, partner_id, "CHECKIN", "FINISHED", "t",
+                                       checkin_start, checkin_end)
+
+                if rng.random() < 0.3:
+                    feedbacks.add_trusted(feedback_ids.next(), user_id, rng.randint(0, 10), "NPS_PARTNER", partner_id,
+                                          checkin_end + timedelta(minutes=rng.randint(5, 60)))
+                if calories_id:
+                    health_points.add_trusted(health_point_ids.next(), user_id, calories_id,
+                                              rng.randint(150, 500), checkin_end)
+                if rng.random() < 0.1:
+                    stamp_id = rng.randint(1, 5)
+                    if stamp_id not in user_stamps:  # UNIQUE (user_id, stamp_id)
+                        user_stamps.add(stamp_id)
+                        stamps.add_trusted(stamp_ids.next(), user_id, stamp_id, checkin_end + timedelta(minutes=1))
+
+            if has_payment:
+                amount_due = round(rng.uniform(20.0, 50.0), 2)
+                value_obtained = round(amount_due * 0.8, 2)
+                transferred_value = round(amount_due - value_obtained, 2)
+                payments.add_trusted(payment_ids.next(), scheduling_id, user_time_id, "PAID", amount_due,
+                                     "CREDIT_CARD", "t", created_text, value_obtained, transferred_value)
+
+        if schedulings.full():
+            _flush_all(conn, buffers)
+    _flush_all(conn, buffers)
+
+    print(f"-> Fatos criados: {schedulings.total} reservas, {payments.total} pagamentos, {user_times.total} check-ins.")
+    print(f"-> Easy Wins: {feedbacks.total} feedbacks (NPS), {health_points.total} registros (Calorias), {stamps.total} conquistas (Stamps).")
+
+
+def bulk_web_events(conn, n_sessions, user_ids, rng=random, batch_size=DEFAULT_BATCH_SIZE, window_days=30,
+                    ids=None, now=None):
+    """ Versão bulk do funil de populate_web_events_and_costs (sem os custos de marketing). """
+    print(f"[BULK] Populando {n_sessions} sessões do funil (analytics.web_events)...")
+    cursor = conn.cursor()
+    window_seconds = window_days * 24 * 3600
+    now = now or datetime.now()
+    events = CopyBuffer(cursor, "analytics.web_events",
+                        ["id", "session_id", "event_name", "user_id", "created_at"], batch_size)
+    event_ids = _id_source(cursor, ids, "analytics.web_events")
+
+    def random_moment():
+        return now - timedelta(seconds=rng.randint(0, window_seconds))
+
+    def session_id():
+        return "%032x" % rng.getrandbits(128)
+
+    # As etapas de uma sessão acontecem em ordem (o funil materializado depende disso): parte das
+    # sessões que iniciaram o cadastro termina com o 'completou_cadastro' de um dos usuários sorteados
+    completing = rng.sample(user_ids, k=int(len(user_ids) * 0.3))
+    complete_rate = min(1.0, len(completing) / max(1, n_sessions * 0.6))
+    for _ in range(n_sessions):
+        sid = session_id()
+        visited_at = random_moment()
+        events.add_trusted(event_ids.next(), sid, "visitou_site", None, visited_at)
+        if rng.random() < 0.6:
+            started_at = min(now, visited_at + timedelta(seconds=rng.randint(10, 1800)))
+            events.add_trusted(event_ids.next(), sid, "iniciou_cadastro", None, started_at)
+            if completing and rng.random() < complete_rate:
+                completed_at = min(now, started_at + timedelta(seconds=rng.randint(30, 3600)))
+                events.add_trusted(event_ids.next(), sid, "completou_cadastro", completing.pop(), completed_at)
+        if events.full():
+            _flush_all(conn, [events])
+
+    for user_id in completing:
+        events.add_trusted(event_ids.next(), session_id(), "completou_cadastro", user_id, random_moment())
+        if events.full():
+            _flush_all(conn, [events])
+    _flush_all(conn, [events])
+    print(f"-> {events.total} eventos de funil criados.")
+
+
+def bulk_mev_scores(conn, user_ids, rng=random, batch_size=DEFAULT_BATCH_SIZE, ids=None, now=None):
+    """ Versão bulk de populate_mev_scores (um score de 30 dias atrás e um de hoje). """
+    print("[BULK] Populando 'Hard Wins' (MEV Scores)...")
+    cursor = conn.cursor()
+    today = (now or datetime.now()).date()
+    day_30 = today - timedelta(days=30)
+    scores = CopyBuffer(cursor, "consumers.user_mev_score",
+                        ["id", "user_id", "score", "risk_level", "calculated_at"], batch_size)
+    score_ids = _id_source(cursor, ids, "consumers.user_mev_score")
+    for user_id in user_ids:
+        score_30d = rng.randint(20, 80)
+        score_hoje = score_30d + rng.randint(-10, 10)
+        scores.add_trusted(score_ids.next(), user_id, score_30d, "Médio", day_30)
+        scores.add_trusted(score_ids.next(), user_id, score_hoje, "Baixo" if score_hoje < 50 else "Médio", today)
+        if scores.full():
+            _flush_all(conn, [scores])
+    _flush_all(conn, [scores])
+    print(f"-> {scores.total} registros de MEV Score criados.")
@@ -0,0 +1,174 @@
+# dashboard/api_client.py
+# Cliente HTTP da API de BI, compartilhado pelas páginas do dashboard.
+#
+# - UMA requests.Session por processo do Streamlit: as conexões keep-alive são reaproveitadas
+#   entre páginas, reruns e usuários.
+# - Mesmos timeouts e retries para todas as chamadas (retry só em falha de conexão e 502/503/504).
+# - fetch_many(): dispara as chamadas independentes de uma página em paralelo (thread pool).
+# - fetch_kpis(): vários KPIs em UMA chamada ao /bi/batch.
+# - fetch(..., as_frame=True): séries temporais (ex: /bi/dau) em Arrow IPC, direto para um
+#   pd.DataFrame com colunas tipadas ("labels" datetime64, "values" numérico).
+# - Cache único, com chave "endpoint + parâmetros" e TTL por endpoint (substitui os st.cache_data).
+#
+# Variáveis de ambiente:
+#   API_URL              -> padrão http://127.0.0.1:8000
+#   API_CONNECT_TIMEOUT  -> segundos para conectar (padrão 3)
+#   API_READ_TIMEOUT     -> segundos esperando a resposta (padrão 30)
+#   API_RETRIES          -> tentativas extras (padrão 2)
+#   API_MAX_WORKERS      -> chamadas simultâneas por processo (padrão 8)
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000").rstrip("/")
+TIMEOUT = (float(os.getenv("API_CONNECT_TIMEOUT", "3")), float(os.getenv("API_READ_TIMEOUT", "30")))
+RETRIES = int(os.getenv("API_RETRIES", "2"))
+MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "8"))
+
+# TTL (segundos) do cache por endpoint. Listas dos filtros mudam pouco; KPIs, a cada minuto.
+TTL_PADRAO = 60
+TTL_POR_ENDPOINT = {
+    "/bi/partners_list": 600,
+    "/bi/b2b/clients_list": 600,
+    "/bi/user/list": 600,
+    "/bi/user/search": 60,
+}
+
+_session = None
+_executor = None
+_lock = threading.Lock()
+_cache = {}        # chave -> (expira_em, valor)
+_last_errors = {}  # endpoint -> mensagem do último erro
+
+
+def session():
+    """ Session compartilhada (criada na primeira chamada), com pool de conexões e retries. """
+    global _session, _executor
+    with _lock:
+        if _session is None:
+            retry = Retry(total=RETRIES, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                          allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="api_client")
+        return _session
+
+
+def _key(path, params):
+    items = sorted((k, v) for k, v in (params or {}).items() if v is not None)
+    return f"{path}?{urlencode(items)}" if items else path
+
+
+def _cache_get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _cache[key]
+            return None
+        return entry
+
+
+def _cache_set(key, path, value):
+    with _lock:
+        _cache[key] = (time.monotonic() + TTL_POR_ENDPOINT.get(path, TTL_PADRAO), value)
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def last_error(path):
+    """ Mensagem do último erro ao chamar 'path' (ou None). """
+    return _last_errors.get(path)
+
+
+MEDIA_ARROW = "application/vnd.apache.arrow.stream"
+
+
+def _read_arrow(content):
+    """ Arrow IPC -> DataFrame (datas viram datetime64, sem passar por string). """
+    table = pa.ipc.open_stream(content).read_all()
+    return table.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+
+
+def _get(path, params, as_frame=False):
+    """ GET sem cache: retorna (ok, dados). O erro fica em last_error(path). """
+    try:
+        headers = {"Accept": MEDIA_ARROW} if as_frame else None
+        res = session().get(f"{API_URL}{path}", params=params, headers=headers, timeout=TIMEOUT)
+        res.raise_for_status()
+        data = _read_arrow(res.content) if as_frame else res.json()
+    except (requests.exceptions.RequestException, pa.ArrowException, ValueError) as e:
+        print(f"ERRO na API {path}: {e}")
+        _last_errors[path] = str(e)
+        return False, None
+    _last_errors.pop(path, None)
+    return True, data
+
+
+def fetch(path, params=None, default=None, as_frame=False):
+    """
+    GET na API com cache. Em caso de erro retorna 'default' (e o erro não vai para o cache).
+    as_frame=True pede a série em Arrow e retorna um pd.DataFrame.
+    """
+    key = _key(path, params) + ("#arrow" if as_frame else "")
+    entry = _cache_get(key)
+    if entry is not None:
+        return entry[1]
+    ok, data = _get(path, params, as_frame)
+    if not ok:
+        return default
+    _cache_set(key, path, data)
+    return data
+
+
+def fetch_many(calls):
+    """
+    Executa várias chamadas em paralelo.
+    calls: {nome: (path, params, default[, as_frame])} -> retorna {nome: dados}.
+    """
+    session()
+    futures = {name: _executor.submit(fetch, *call) for name, call in calls.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def fetch_kpis(names, params=None):
+    """
+    Vários KPIs em UMA requisição ao /bi/batch (nome = caminho do endpoint sem o "/bi/").
+    Cada KPI fica no cache com a chave do próprio endpoint; só os que faltam vão para o batch.
+    Retorna {nome: dados} (KPIs com erro ficam como None).
+    """
+    params = params or {}
+    results, missing = {}, []
+    for name in names:
+        entry = _cache_get(_key(f"/bi/{name}", params))
+        if entry is not None:
+            results[name] = entry[1]
+        else:
+            missing.append(name)
+    if not missing:
+        return results
+
+    _, batch = _get("/bi/batch", dict(params, kpis=",".join(missing)))
+    batch = batch if isinstance(batch, dict) else {}
+    for name in missing:
+        value = batch.get("results", {}).get(name)
+        if value is not None:
+            _cache_set(_key(f"/bi/{name}", params), f"/bi/{name}", value)
+        else:
+            _last_errors[f"/bi/{name}"] = str(batch.get("errors", {}).get(name, "sem resposta do /bi/batch"))
+        results[name] = value
+    return results
+
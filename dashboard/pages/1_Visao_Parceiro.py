@@ -4,77 +4,24 @@
 # Se não quiser usar a pasta 'pages', apenas renomeie para "1_Visao_Parceiro.py"
 
 import streamlit as st
-import requests
 import plotly.express as px
 import pandas as pd
 
-# URL base da sua API
-API_URL = "http://127.0.0.1:8000"
+import api_client # Cliente compartilhado da API (sessão, cache, paralelismo)
 
 st.set_page_config(page_title="Visão do Parceiro", page_icon="🏢", layout="wide")
 st.title("🏢 Dashboard de Visão do Parceiro")
 
-# --- Funções de API ---
-@st.cache_data(ttl=600) # Cache de 10 minutos
-def get_partners_list():
-    try:
-        res = requests.get(f"{API_URL}/bi/partners_list")
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro ao buscar lista de parceiros: {e}")
-        return []
-
-@st.cache_data(ttl=60) # Cache de 1 minuto
-def get_partner_revenue(partner_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/revenue", params={"partner_id": partner_id, "days": 30})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return None
-
-@st.cache_data(ttl=60)
-def get_partner_checkins(partner_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/checkins", params={"partner_id": partner_id, "days": 30})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return None
-
-@st.cache_data(ttl=60)
-def get_reservation_status(partner_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/partner/reservation_status", params={"partner_id": partner_id})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return None
-
-@st.cache_data(ttl=60)
-def get_occupation_by_hour(partner_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/partner/occupation_by_hour", params={"partner_id": partner_id})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return None
-
-@st.cache_data(ttl=60)
-def get_partner_kpi_overview(partner_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/partner/kpi_overview", params={"partner_id": partner_id})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return {} # Retorna dict vazio em caso de erro
+# KPIs do parceiro, buscados juntos no /bi/batch (nome = caminho do endpoint sem o "/bi/")
+PARTNER_KPIS = ["revenue", "checkins", "partner/reservation_status", "partner/occupation_by_hour", "partner/kpi_overview"]
 
 # --- Interface do Dashboard ---
 
-partners = get_partners_list()
+partners = api_client.fetch("/bi/partners_list", default=[])
 
 if not partners:
+    if api_client.last_error("/bi/partners_list"):
+        st.error(f"Erro ao buscar lista de parceiros: {api_client.last_error('/bi/partners_list')}")
     st.error("Não foi possível carregar os parceiros. Verifique se a API está rodando.")
     st.stop()
 
@@ -86,13 +33,14 @@ selected_id = partner_names[selected_name]
 st.markdown(f"### Métricas para: **{selected_name}** (ID: {selected_id})")
 
 # --- Carregar dados do parceiro selecionado ---
-revenue_data = get_partner_revenue(selected_id)
-checkin_data = get_partner_checkins(selected_id)
-status_data = get_reservation_status(selected_id)
-occupation_data = get_occupation_by_hour(selected_id)
+partner_kpis = api_client.fetch_kpis(PARTNER_KPIS, {"partner_id": selected_id, "days": 30})
+revenue_data = partner_kpis.get("revenue")
+checkin_data = partner_kpis.get("checkins")
+status_data = partner_kpis.get("partner/reservation_status")
+occupation_data = partner_kpis.get("partner/occupation_by_hour")
 
 # Carregar dados dos KPIs extras (NPS, Repasses)
-kpi_data = get_partner_kpi_overview(selected_id)
+kpi_data = partner_kpis.get("partner/kpi_overview") or {} # dict vazio em caso de erro
 
 # --- KPIs em colunas ---
 col1, col2, col3, col4 = st.columns(4)
@@ -2,104 +2,25 @@
 # [VERSÃO TOTALMENTE CORRIGIDA E BLINDADA]
 
 import streamlit as st
-import requests
 import plotly.express as px
 import pandas as pd
 
-# URL base da sua API
-API_URL = "http://127.0.0.1:8000"
+import api_client # Cliente compartilhado da API (sessão, cache, paralelismo)
 
 st.set_page_config(page_title="Visão Cliente B2B", page_icon="💼", layout="wide")
 st.title("💼 Dashboard de Visão do Cliente B2B")
 
-# --- Funções de API (BLINDADAS) ---
-
-@st.cache_data(ttl=600)
-def get_b2b_clients_list():
-    """
-    Busca a lista de clientes B2B.
-    GARANTIA: Sempre retorna uma lista (list).
-    """
-    try:
-        res = requests.get(f"{API_URL}/bi/b2b/clients_list")
-        res.raise_for_status()
-        data = res.json()
-        # GARANTIA: Se a API não retornar uma lista, retorna uma lista vazia.
-        if not isinstance(data, list):
-            return []
-        return data
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro ao buscar lista de clientes: {e}")
-        return []
-
-@st.cache_data(ttl=60)
-def get_b2b_engagement_stats(client_id):
-    """
-    Busca dados de engajamento para um cliente.
-    GARANTIA: Sempre retorna um dicionário (dict).
-    """
-    try:
-        res = requests.get(f"{API_URL}/bi/b2b/engagement_stats", params={"client_id": client_id})
-        res.raise_for_status()
-        data = res.json()
-        # [CORREÇÃO DEFINITIVA DO BUG]
-        # GARANTIA: Se a API retornar uma lista (ex: []), força um dict vazio.
-        if not isinstance(data, dict):
-            return {} 
-        return data
-    except requests.exceptions.RequestException as e:
-        # GARANTIA: Em caso de erro de API, retorna um dict vazio.
-        st.error(f"API Error (engagement): {e}")
-        return {}
-
-@st.cache_data(ttl=60)
-def get_b2b_cost_per_collaborator(client_id):
-    """
-    Busca dados de custo por colaborador.
-    GARANTIA: Sempre retorna um dicionário (dict).
-    """
-    try:
-        res = requests.get(f"{API_URL}/bi/b2b/cost_per_collaborator", params={"client_id": client_id})
-        res.raise_for_status()
-        data = res.json()
-        # [CORREÇÃO DEFINITIVA DO BUG]
-        # GARANTIA: Se a API retornar uma lista (ex: []), força um dict vazio.
-        if not isinstance(data, dict):
-            return {}
-        return data
-    except requests.exceptions.RequestException as e:
-        # GARANTIA: Em caso de erro de API, retorna um dict vazio.
-        st.error(f"API Error (cost): {e}")
-        return {}
-# [ADIÇÃO - Linha 91]
-
-@st.cache_data(ttl=60)
-def get_b2b_campaign_participation(client_id):
-    """ Busca dados de participação em campanhas (Hard Win) """
-    try:
-        res = requests.get(f"{API_URL}/bi/b2b/campaign_participation", params={"client_id": client_id})
-        res.raise_for_status()
-        data = res.json()
-        if not isinstance(data, dict): return {}
-        return data
-    except requests.exceptions.RequestException:
-        return {}
-
-@st.cache_data(ttl=60)
-def get_b2b_mev_score_variation(client_id):
-    """ Busca dados de variação do MEV Score (Hard Win) """
-    try:
-        res = requests.get(f"{API_URL}/bi/b2b/mev_score_variation", params={"client_id": client_id})
-        res.raise_for_status()
-        data = res.json()
-        if not isinstance(data, dict): return {}
-        return data
-    except requests.exceptions.RequestException:
-        return {}
+# KPIs do cliente, buscados juntos no /bi/batch (nome = caminho do endpoint sem o "/bi/")
+B2B_KPIS = ["b2b/engagement_stats", "b2b/cost_per_collaborator", "b2b/campaign_participation", "b2b/mev_score_variation"]
 
 # --- Interface do Dashboard ---
 
-clients = get_b2b_clients_list()
+clients = api_client.fetch("/bi/b2b/clients_list", default=[])
+# GARANTIA: Se a API não retornar uma lista, usa uma lista vazia.
+if not isinstance(clients, list):
+    clients = []
+if api_client.last_error("/bi/b2b/clients_list"):
+    st.error(f"Erro ao buscar lista de clientes: {api_client.last_error('/bi/b2b/clients_list')}")
 
 if not clients:
     st.error("Não foi possível carregar os clientes B2B. Verifique se a API está rodando.")
@@ -117,11 +38,12 @@ st.markdown(f"### Métricas para: **{selected_name}** (ID: {selected_id})")
 # --- Carregar dados do cliente selecionado ---
 # [BLOCO DE BLINDAGEM NUCLEAR]
 # Vamos chamar as funções, que podem estar retornando lixo (listas)
-engagement_data_raw = get_b2b_engagement_stats(selected_id)
-cost_data_raw = get_b2b_cost_per_collaborator(selected_id)
+b2b_kpis = api_client.fetch_kpis(B2B_KPIS, {"client_id": selected_id})
+engagement_data_raw = b2b_kpis.get("b2b/engagement_stats")
+cost_data_raw = b2b_kpis.get("b2b/cost_per_collaborator")
 # Carrega dados dos Hard Wins
-campaign_data_raw = get_b2b_campaign_participation(selected_id)
-mev_score_data_raw = get_b2b_mev_score_variation(selected_id)
+campaign_data_raw = b2b_kpis.get("b2b/campaign_participation")
+mev_score_data_raw = b2b_kpis.get("b2b/mev_score_variation")
 
 # Agora, vamos FORÇAR essas variáveis a serem dicionários
 # não importa o que a função "fantasma" retornou.
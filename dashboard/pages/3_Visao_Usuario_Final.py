@@ -1,69 +1,79 @@
 # pages/3_Visao_Usuario_Final.py
 
 import streamlit as st
-import requests
 import plotly.express as px
 import pandas as pd
 
-# URL base da sua API
-API_URL = "http://127.0.0.1:8000"
+import api_client # Cliente compartilhado da API (sessão, cache, paralelismo)
 
 st.set_page_config(page_title="Visão Usuário Final", page_icon="🏃", layout="wide")
 st.title("🏃 Dashboard de Visão do Usuário Final")
 
-# --- Funções de API ---
-@st.cache_data(ttl=600)
-def get_user_list():
-    try:
-        res = requests.get(f"{API_URL}/bi/user/list")
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Erro ao buscar lista de usuários: {e}")
-        return []
-
-@st.cache_data(ttl=60)
-def get_user_activity(user_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/user/activity_history", params={"user_id": user_id})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return None
-
-@st.cache_data(ttl=60)
-def get_user_gamification(user_id):
-    try:
-        res = requests.get(f"{API_URL}/bi/user/gamification_stats", params={"user_id": user_id})
-        res.raise_for_status()
-        return res.json()
-    except requests.exceptions.RequestException:
-        return {}
-
 # --- Interface do Dashboard ---
 
-users = get_user_list()
+# Busca de usuários (nome ou email) com páginas keyset de SEARCH_PAGE_SIZE.
+# A lista acumulada fica no session_state e recomeça quando o texto da busca muda.
+SEARCH_PAGE_SIZE = 20
+
+def search_page(q, next_page=None):
+    params = {"q": q, "limit": SEARCH_PAGE_SIZE, **(next_page or {})}
+    return api_client.fetch("/bi/user/search", params, default=None)
+
+query = st.text_input("Buscar usuário (nome ou email):", placeholder="Digite parte do nome ou do email")
 
+if st.session_state.get("user_search_q") != query:
+    page = search_page(query)
+    if page is None:
+        if api_client.last_error("/bi/user/search"):
+            st.error(f"Erro ao buscar usuários: {api_client.last_error('/bi/user/search')}")
+        st.error("Não foi possível carregar os usuários. Verifique se a API está rodando.")
+        st.stop()
+    st.session_state["user_search_q"] = query
+    st.session_state["user_search_items"] = page["items"]
+    st.session_state["user_search_next"] = page["next"]
+
+users = st.session_state["user_search_items"]
 if not users:
-    st.error("Não foi possível carregar os usuários. Verifique se a API está rodando.")
+    st.warning("Nenhum usuário ativo encontrado para essa busca.")
     st.stop()
 
-# Dropdown para selecionar o usuário
-user_names = {u['name']: u['id'] for u in users}
-selected_name = st.selectbox("Selecione um Usuário:", list(user_names.keys()))
-selected_id = user_names[selected_name]
+col_select, col_more = st.columns([4, 1])
+with col_more:
+    st.write("")
+    if st.button("Carregar mais", disabled=st.session_state["user_search_next"] is None):
+        page = search_page(query, st.session_state["user_search_next"])
+        if page is not None:
+            st.session_state["user_search_items"] = users = users + page["items"]
+            st.session_state["user_search_next"] = page["next"]
+
+# Dropdown para selecionar o usuário (entre os encontrados)
+with col_select:
+    selected = st.selectbox(
+        f"Selecione um Usuário ({len(users)} encontrados{'+' if st.session_state['user_search_next'] else ''}):",
+        users,
+        format_func=lambda u: f"{u['name']} ({u['email']})",
+    )
+selected_name = selected["name"]
+selected_id = selected["id"]
 
 st.markdown(f"### Métricas para: **{selected_name}** (ID: {selected_id})")
 
 # --- Carregar dados do usuário selecionado ---
-activity_data = get_user_activity(selected_id)
-gamification_data = get_user_gamification(selected_id)
+# As chamadas saem em paralelo
+user_data = api_client.fetch_many({
+    "activity": ("/bi/user/activity_history", {"user_id": selected_id}, None, True), # DataFrame (Arrow)
+    "gamification": ("/bi/user/gamification_stats", {"user_id": selected_id}, {}),
+    "streak": ("/bi/user/streak", {"user_id": selected_id}, {}),
+})
+activity_data = user_data["activity"]
+gamification_data = user_data["gamification"]
+streak_data = user_data["streak"]
 
 # --- KPIs em colunas ---
 col1, col2, col3 = st.columns(3)
 
-if activity_data and 'values' in activity_data:
-    total_checkins = sum(activity_data['values'])
+if activity_data is not None and not activity_data.empty:
+    total_checkins = int(activity_data['values'].sum())
     media_semanal = (total_checkins / 4.28) # 30 dias / 7 dias
 else:
     total_checkins = 0
@@ -88,7 +98,7 @@ with col3:
     st.subheader("Métricas de Gamificação") # Título para a seção antiga
 
 st.divider()
-col4, col5 = st.columns(2)
+col4, col5, col6 = st.columns(3)
 
 with col4:
     val = gamification_data.get("total_pontos", 0)
@@ -98,19 +108,22 @@ with col5:
     val = gamification_data.get("total_conquistas", 0)
     st.metric(label="Total de Conquistas (Stamps)", value=f"{val}")
 
+with col6:
+    st.metric(label="Streak Atual (Dias Seguidos)", value=f"{streak_data.get('current_streak', 0)}",
+              delta=f"Recorde: {streak_data.get('longest_streak', 0)}", delta_color="off")
+
 
 # --- Gráficos ---
 st.subheader("Histórico de Atividade (Check-ins nos últimos 30 dias)")
 
-if activity_data and total_checkins > 0:
-    df_activity = pd.DataFrame(activity_data)
+if activity_data is not None and total_checkins > 0:
     # Criar um range de datas completo para os últimos 30 dias
-    all_dates = pd.date_range(start=pd.to_datetime('today') - pd.Timedelta(days=29), end=pd.to_datetime('today'))
-    df_dates = pd.DataFrame(all_dates, columns=['date'])
-    df_dates['labels'] = df_dates['date'].dt.strftime('%Y-%m-%d')
+    # ("labels" já chega como datetime64 do Arrow, sem conversão de texto)
+    all_dates = pd.date_range(end=pd.Timestamp('today').normalize(), periods=30)
+    df_dates = pd.DataFrame({'labels': all_dates})
     
     # Juntar com os dados reais
-    df_activity = pd.merge(df_dates, df_activity, on="labels", how="left").fillna(0)
+    df_activity = pd.merge(df_dates, activity_data, on="labels", how="left").fillna(0)
     
     fig = px.bar(df_activity, x="labels", y="values", 
                  title="Check-ins por Dia", 
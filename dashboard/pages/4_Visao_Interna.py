@@ -1,64 +1,35 @@
 # pages/4_Visao_Interna.py
 import streamlit as st
-import requests
 import plotly.express as px
 import pandas as pd
 
-# URL base da sua API
-API_URL = "http://127.0.0.1:8000" # Cuidado com o typo, se o seu for 127.0.0.1
+import api_client # Cliente compartilhado da API (sessão, cache, paralelismo)
 
 st.set_page_config(page_title="Visão Interna (Admin)", page_icon="🔑", layout="wide")
 st.title("🔑 Dashboard de Visão Interna (Admin)")
 st.markdown("KPIs estratégicos para a gestão da plataforma.")
 
-# --- Funções de API (Chamando todos os Hard Wins) ---
-
-@st.cache_data(ttl=60)
-def get_ltv_cac():
-    try:
-        res = requests.get(f"{API_URL}/bi/ltv_cac")
-        res.raise_for_status()
-        return res.json()
-    except: return {}
-
-@st.cache_data(ttl=60)
-def get_conversion_funnel():
-    try:
-        res = requests.get(f"{API_URL}/bi/conversion_funnel")
-        res.raise_for_status()
-        return res.json()
-    except: return {}
-
-@st.cache_data(ttl=60)
-def get_revenue_by_region():
-    try:
-        res = requests.get(f"{API_URL}/bi/revenue_by_region")
-        res.raise_for_status()
-        return res.json()
-    except: return {}
-
-@st.cache_data(ttl=60) 
-def get_gamification_missions():
-    try:
-        res = requests.get(f"{API_URL}/bi/gamification/missions")
-        res.raise_for_status()
-        return res.json()
-    except: return {}
-
-@st.cache_data(ttl=60)
-def get_gamification_streaks():
-    try:
-        res = requests.get(f"{API_URL}/bi/gamification/streaks")
-        res.raise_for_status()
-        return res.json()
-    except: return {}
+# KPIs da página, buscados juntos no /bi/batch (nome = caminho do endpoint sem o "/bi/")
+INTERNAL_KPIS = ["kpi_overview", "ltv_cac", "conversion_funnel", "revenue_by_region", "gamification/missions", "gamification/streaks"]
 
 # --- Carregar Todos os Dados ---
-ltv_data = get_ltv_cac()
-funnel_data = get_conversion_funnel()
-region_data = get_revenue_by_region()
-mission_data = get_gamification_missions()
-streaks_data = get_gamification_streaks()
+internal_kpis = api_client.fetch_kpis(INTERNAL_KPIS)
+overview_data = internal_kpis.get("kpi_overview") or {}
+ltv_data = internal_kpis.get("ltv_cac") or {}
+funnel_data = internal_kpis.get("conversion_funnel") or {}
+region_data = internal_kpis.get("revenue_by_region") or {}
+mission_data = internal_kpis.get("gamification/missions") or {}
+streaks_data = internal_kpis.get("gamification/streaks") or {}
+
+# --- Totais da Plataforma ---
+st.subheader("Totais da Plataforma")
+col_users, col_revenue, col_partners = st.columns(3)
+with col_users:
+    st.metric(label="Usuários", value=f"{overview_data.get('total_users', 0):,}")
+with col_revenue:
+    st.metric(label="Receita Total", value=f"R$ {overview_data.get('total_revenue', 0):,.2f}")
+with col_partners:
+    st.metric(label="Parceiros", value=f"{overview_data.get('total_partners', 0):,}")
 
 # --- KPIs Principais (LTV/CAC) ---
 st.subheader("Métricas de Vendas e Aquisição")
@@ -106,11 +77,11 @@ with col5:
         st.warning("Sem dados de missões.")
         
 with col6:
-    st.subheader("Engajamento (Streaks) 7d")
+    st.subheader("Engajamento (Streaks)")
     if streaks_data and 'values' in streaks_data:
-        df_streaks = pd.DataFrame(streaks_data)
-        fig_streaks = px.bar(df_streaks, x='labels', y='values', title="Nº de Usuários por Dias Ativos (Últimos 7d)")
-        fig_streaks.update_xaxes(categoryorder='array', categoryarray=sorted(df_streaks['labels'], reverse=True))
+        df_streaks = pd.DataFrame({'labels': streaks_data['labels'], 'values': streaks_data['values']})
+        fig_streaks = px.bar(df_streaks, x='labels', y='values', title="Nº de Usuários por Streak Atual (Dias Seguidos)")
+        fig_streaks.update_xaxes(categoryorder='array', categoryarray=streaks_data['labels'])
         st.plotly_chart(fig_streaks, use_container_width=True)
     else:
         st.warning("Sem dados de streaks.")
\ No newline at end of file
@@ -1,5 +1,6 @@
 # [SUBSTITUA TODO O ARQUIVO generate_fake_data.py]
 
+import argparse
 import psycopg2
 from faker import Faker
 import random
@@ -7,22 +8,30 @@ from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 
+import bulk_loader
+import parallel_loader
+
 # --- 1. Configuração do Banco de Dados ---
 load_dotenv() 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-if not DATABASE_URL:
-    raise SystemExit("ERROR: DATABASE_URL is not set. Coloque no .env ou exporte.")
-
-try:
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-except Exception as e:
-    print(f"Erro ao conectar ao banco de dados: {e}")
-    raise SystemExit
+# A conexão é aberta em connect() (chamado no main), para o módulo poder ser importado
+conn = None
+cursor = None
 
 fake = Faker("pt_BR")
-print("Conectado ao banco de dados. Iniciando a população...")
+
+def connect():
+    global conn, cursor
+    if not DATABASE_URL:
+        raise SystemExit("ERROR: DATABASE_URL is not set. Coloque no .env ou exporte.")
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+    except Exception as e:
+        print(f"Erro ao conectar ao banco de dados: {e}")
+        raise SystemExit
+    print("Conectado ao banco de dados. Iniciando a população...")
 
 # --- 2. Funções de População (em ordem de dependência) ---
 
@@ -501,28 +510,40 @@ def populate_master_data():
     
     return {}
 
-def populate_web_events_and_costs(user_ids=[]):
+def populate_web_events_and_costs(user_ids=[], n_sessions=500, with_costs=True):
     """Popula o funil de conversão e os custos de marketing."""
     print("Populando 'Hard Wins' (Funil e CAC)...")
     
     # --- 1. Funil de Conversão ---
-    # Vamos criar 500 sessões anônimas
+    # Vamos criar n_sessions sessões anônimas
+    # As etapas acontecem em ordem dentro da sessão; parte das sessões que iniciaram o cadastro
+    # termina com o 'completou_cadastro' de um dos usuários sorteados
+    completing = random.sample(user_ids, k=int(len(user_ids) * 0.3))
+    complete_rate = min(1.0, len(completing) / max(1, n_sessions * 0.6))
     funnel_count = 0
-    for _ in range(500):
+    for _ in range(n_sessions):
         try:
             session_id = fake.uuid4()
+            visited_at = fake.date_time_between(start_date="-30d", end_date="now")
             # 100% visitaram o site
             cursor.execute(
                 "INSERT INTO analytics.web_events (session_id, event_name, created_at) VALUES (%s, %s, %s)",
-                (session_id, 'visitou_site', fake.date_time_between(start_date="-30d", end_date="now"))
+                (session_id, 'visitou_site', visited_at)
             )
             
-            # 60% iniciaram o cadastro
+            # 60% iniciaram o cadastro (alguns minutos depois da visita)
             if random.random() < 0.6:
+                started_at = min(datetime.now(), visited_at + timedelta(seconds=random.randint(10, 1800)))
                 cursor.execute(
                     "INSERT INTO analytics.web_events (session_id, event_name, created_at) VALUES (%s, %s, %s)",
-                    (session_id, 'iniciou_cadastro', fake.date_time_between(start_date="-30d", end_date="now"))
+                    (session_id, 'iniciou_cadastro', started_at)
                 )
+                if completing and random.random() < complete_rate:
+                    completed_at = min(datetime.now(), started_at + timedelta(seconds=random.randint(30, 3600)))
+                    cursor.execute(
+                        "INSERT INTO analytics.web_events (session_id, event_name, user_id, created_at) VALUES (%s, %s, %s, %s)",
+                        (session_id, 'completou_cadastro', completing.pop(), completed_at)
+                    )
                 
             funnel_count += 1
         except Exception as e:
@@ -530,8 +551,8 @@ def populate_web_events_and_costs(user_ids=[]):
         else:
             conn.commit()
             
-    # Vincula 30% dos usuários cadastrados a uma sessão de funil
-    for user_id in random.sample(user_ids, k=int(len(user_ids) * 0.3)):
+    # Usuários sorteados que sobraram ganham uma sessão só com a conclusão
+    for user_id in completing:
         try:
             cursor.execute(
                 "INSERT INTO analytics.web_events (session_id, event_name, user_id, created_at) VALUES (%s, %s, %s, %s)",
@@ -544,10 +565,16 @@ def populate_web_events_and_costs(user_ids=[]):
     print(f"-> {funnel_count} eventos de funil criados.")
 
     # --- 2. Custos de Marketing (CAC) ---
+    if with_costs:
+        populate_marketing_costs()
+
+def populate_marketing_costs(today=None):
+    """Popula 30 dias de custos de marketing (CAC)."""
     cost_count = 0
+    today = today or datetime.now().date()
     for i in range(30): # 30 dias de custos
         try:
-            cost_date = datetime.now().date() - timedelta(days=i)
+            cost_date = today - timedelta(days=i)
             cursor.execute(
                 "INSERT INTO analytics.marketing_costs (source, cost, clicks, date) VALUES (%s, %s, %s, %s) ON CONFLICT (date) DO NOTHING",
                 ('Google Ads', random.uniform(50.0, 200.0), random.randint(100, 500), cost_date)
@@ -622,7 +649,8 @@ def populate_missions_and_campaigns(user_ids=[], active_user_ids=[], client_ids=
             SELECT ccc.user_id, ccc.client_id
             FROM companies.companies_client_collaborator ccc
             JOIN consumers.user u ON ccc.user_id = u.id
-            WHERE u.active = TRUE; 
+            WHERE u.active = TRUE
+            ORDER BY ccc.user_id, ccc.client_id; 
         """
         cursor.execute(sql_get_collaborators)
         all_active_collaborators = cursor.fetchall() # Lista de tuplas (user_id, client_id)
@@ -708,34 +736,167 @@ def populate_mev_scores(user_ids=[]):
             conn.rollback()
     print(f"-> {count} registros de MEV Score criados.")
 
+# --- Volumes (scale factor) ---
+# SF1 = volumes originais deste script. "--scale 10" (SF10), "--scale 100" (SF100)...
+# multiplicam todas as tabelas pelo mesmo fator, mantendo as proporções
+# (20 reservas e 5 sessões de funil por usuário, 5 usuários por parceiro...).
+# As janelas de tempo não mudam (fatos nos últimos 90 dias, funil nos últimos 30,
+# usuários criados nos últimos 2 anos): escalar aumenta a densidade por dia.
+VOLUMES_SF1 = {
+    "users": 100,
+    "partners": 20,
+    "b2b_clients": 30,
+    "facts": 2000,
+    "web_sessions": 500,
+}
+
+# Grupos de tabelas que podem ser escolhidos com --tables (na ordem de carga)
+TABLES = ["users", "partners", "b2b", "facts", "web_events", "marketing_costs", "missions", "mev_scores"]
+
+def scaled_volumes(scale):
+    """ Volumes de cada tabela para o scale factor (mínimo de 1 linha). """
+    return {name: max(1, int(round(n * scale))) for name, n in VOLUMES_SF1.items()}
+
+def parse_tables(value):
+    tables = [t.strip() for t in value.split(",") if t.strip()]
+    invalid = [t for t in tables if t not in TABLES]
+    if invalid:
+        raise argparse.ArgumentTypeError(f"Tabelas inválidas: {', '.join(invalid)}. Opções: {', '.join(TABLES)}")
+    return set(tables)
+
+# Quando um grupo não é gerado nesta execução, os dependentes usam o que já está no banco
+def load_user_ids():
+    """ (todos_os_ids, ids_ativos) dos usuários existentes. """
+    cursor.execute("SELECT id, active FROM consumers.user ORDER BY id")
+    rows = cursor.fetchall()
+    return [row[0] for row in rows], [row[0] for row in rows if row[1]]
+
+def load_schedule_to_partner_map():
+    """ Mapa {schedule_id: partner_id} dos horários com hora preenchida (usado pelos fatos). """
+    cursor.execute("SELECT id, partner_id FROM providers.partner_schedule WHERE hour IS NOT NULL ORDER BY id")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+def load_client_ids():
+    cursor.execute("SELECT id FROM companies.companies_client ORDER BY id")
+    return [row[0] for row in cursor.fetchall()]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Popula o banco com dados sintéticos.")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Scale factor: 1 = SF1 (volumes originais), 10 = SF10, 100 = SF100...")
+    parser.add_argument("--tables", type=parse_tables, default=set(TABLES),
+                        help=f"Grupos a gerar, separados por vírgula (padrão: todos). Opções: {','.join(TABLES)}")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Usa COPY em lotes (bulk_loader.py) em vez de INSERT linha a linha.")
+    parser.add_argument("--batch-size", type=int, default=bulk_loader.DEFAULT_BATCH_SIZE,
+                        help="Linhas por lote de COPY no modo --bulk.")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Gera as tabelas grandes em N processos (parallel_loader.py). Implica --bulk.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed dos geradores aleatórios (mesma seed + mesmos workers = mesmos dados).")
+    parser.add_argument("--anchor-date", type=lambda s: datetime.strptime(s, "%Y-%m-%d"), default=None,
+                        help="Data 'de hoje' da carga (YYYY-MM-DD); as datas geradas são relativas a ela.")
+    return parser.parse_args()
+
 # [SUBSTITUIÇÃO - Bloco 'try...finally' no final do arquivo]
 # --- 3. Execução em ordem lógica ---
-try:
-    # 0. Popula dados mestres (Easy Wins)
-    master_data = populate_master_data()
-    
-    # 1. Criar usuários (retorna DUAS listas)
-    all_user_ids, active_user_ids = populate_users(100, rank_ids_list=master_data['rank_ids'])
-    partner_ids, schedule_ids = populate_partners_and_schedules(20)
-    
-    # 2. Criar o mundo B2B (usa TODOS os usuários)
-    plan_ids = populate_plans()
-    client_ids = populate_b2b_clients(30, plan_ids)
-    populate_b2b_collaborators(client_ids, all_user_ids)
-    
-    # 3. Gerar fatos (usa APENAS usuários ATIVOS)
-    populate_facts(2000, active_user_ids, schedule_ids, master_data)
-    
-    # 4. Popula "Hard Wins" (usa TODAS as listas)
-    populate_web_events_and_costs(all_user_ids)
-    # [LINHA 577 - A CORREÇÃO]
-    populate_missions_and_campaigns(user_ids=all_user_ids, active_user_ids=active_user_ids, client_ids=client_ids)
-    populate_mev_scores(all_user_ids)
-    
-except Exception as e:
-    print(f"Um erro crítico ocorreu durante a população: {e}")
-    conn.rollback()
-finally:
-    cursor.close()
-    conn.close()
-    print("\nBanco populado com sucesso (COM DADOS VARIADOS) e conexão fechada!")
\ No newline at end of file
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+        fake.seed_instance(args.seed)
+    tables = args.tables
+    volumes = scaled_volumes(args.scale)
+    mode = f"paralelo ({args.workers} workers)" if args.workers else ("bulk" if args.bulk else "linha a linha")
+    print(f"Escala SF{args.scale:g}, modo {mode}: {volumes}")
+    print(f"Tabelas: {', '.join(t for t in TABLES if t in tables)}")
+    connect()
+    try:
+        # 0. Popula dados mestres (Easy Wins)
+        master_data = populate_master_data()
+        now = args.anchor_date
+
+        if args.workers:
+            def create_clients():
+                if "b2b" not in tables:
+                    return load_client_ids()
+                plan_ids = populate_plans()
+                return populate_b2b_clients(volumes["b2b_clients"], plan_ids)
+
+            all_user_ids, active_user_ids, client_ids = parallel_loader.load_parallel(
+                conn, DATABASE_URL, args.workers, args.seed if args.seed is not None else 0, master_data,
+                create_clients, volumes, tables,
+                existing_users=None if "users" in tables else load_user_ids(),
+                existing_schedule_map=None if "partners" in tables else load_schedule_to_partner_map(),
+                batch_size=args.batch_size, now=now)
+            if "marketing_costs" in tables:
+                populate_marketing_costs(now.date() if now else None)
+            if "missions" in tables:
+                populate_missions_and_campaigns(user_ids=all_user_ids, active_user_ids=active_user_ids,
+                                                client_ids=client_ids)
+            return
+
+        batch = args.batch_size
+
+        # 1. Criar usuários (retorna DUAS listas) e parceiros
+        if "users" not in tables:
+            all_user_ids, active_user_ids = load_user_ids()
+        elif args.bulk:
+            all_user_ids, active_user_ids = bulk_loader.bulk_users(conn, volumes["users"], master_data['rank_ids'],
+                                                                   fake, batch_size=batch, now=now)
+        else:
+            all_user_ids, active_user_ids = populate_users(volumes["users"], rank_ids_list=master_data['rank_ids'])
+
+        if "partners" not in tables:
+            schedule_to_partner_map = load_schedule_to_partner_map()
+        elif args.bulk:
+            partner_ids, schedule_to_partner_map = bulk_loader.bulk_partners_and_schedules(
+                conn, volumes["partners"], fake, batch_size=batch)
+        else:
+            partner_ids, schedule_ids = populate_partners_and_schedules(volumes["partners"])
+            schedule_to_partner_map = dict.fromkeys(schedule_ids)
+
+        # 2. Criar o mundo B2B (usa TODOS os usuários)
+        if "b2b" in tables:
+            plan_ids = populate_plans()
+            client_ids = populate_b2b_clients(volumes["b2b_clients"], plan_ids)
+            if args.bulk:
+                bulk_loader.bulk_b2b_collaborators(conn, client_ids, all_user_ids, batch_size=batch)
+            else:
+                populate_b2b_collaborators(client_ids, all_user_ids)
+        else:
+            client_ids = load_client_ids()
+
+        # 3. Gerar fatos (usa APENAS usuários ATIVOS)
+        if "facts" in tables:
+            if args.bulk:
+                bulk_loader.bulk_facts(conn, volumes["facts"], active_user_ids, schedule_to_partner_map,
+                                       master_data.get("calories_id"), batch_size=batch, now=now)
+            else:
+                populate_facts(volumes["facts"], active_user_ids, list(schedule_to_partner_map), master_data)
+
+        # 4. Popula "Hard Wins" (usa TODAS as listas)
+        if "web_events" in tables:
+            if args.bulk:
+                bulk_loader.bulk_web_events(conn, volumes["web_sessions"], all_user_ids, batch_size=batch, now=now)
+            else:
+                populate_web_events_and_costs(all_user_ids, volumes["web_sessions"], with_costs=False)
+        if "marketing_costs" in tables:
+            populate_marketing_costs(now.date() if now else None)
+        if "missions" in tables:
+            populate_missions_and_campaigns(user_ids=all_user_ids, active_user_ids=active_user_ids, client_ids=client_ids)
+        if "mev_scores" in tables:
+            if args.bulk:
+                bulk_loader.bulk_mev_scores(conn, all_user_ids, batch_size=batch, now=now)
+            else:
+                populate_mev_scores(all_user_ids)
+        
+    except Exception as e:
+        print(f"Um erro crítico ocorreu durante a população: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
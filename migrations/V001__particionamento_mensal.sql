@@ -0,0 +1,144 @@
+--
+-- V001: PARTICIONAMENTO MENSAL DAS TABELAS FATO
+-- consumers.user_time, consumers.payment e analytics.web_events passam a ser
+-- particionadas por RANGE (created_at), uma partição por mês.
+--
+-- Observações:
+--   * Em tabelas particionadas a PRIMARY KEY precisa conter a chave de partição,
+--     então a PK vira (id, created_at). O "id" continua vindo da mesma sequence.
+--   * Por isso as FKs que APONTAM para essas tabelas são removidas
+--     (consumers.payment.user_time_id e consumers.refunds.payment_id).
+--     As FKs que SAEM delas (user_id, partner_id, ...) são recriadas.
+--   * Linhas com created_at NULL recebem o valor de updated_at (ou agora).
+--
+
+CREATE SCHEMA IF NOT EXISTS bi;
+
+--------------------------------------------------------------------------------
+-- FUNÇÃO: bi.ensure_monthly_partitions
+-- Cria (se não existirem) as partições mensais de 'parent' entre dois meses,
+-- mais uma partição DEFAULT. Rodar periodicamente para criar os meses futuros:
+--   SELECT bi.ensure_monthly_partitions('consumers.user_time', CURRENT_DATE, CURRENT_DATE + 90);
+-- (a V009 substitui a função: meses com linhas já na DEFAULT passaram a funcionar)
+--------------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION bi.ensure_monthly_partitions(parent TEXT, from_day DATE, to_day DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    schema_name TEXT := split_part(parent, '.', 1);
+    table_name TEXT := split_part(parent, '.', 2);
+    month_start DATE := date_trunc('month', from_day)::DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= to_day LOOP
+        partition_name := format('%s_%s', table_name, to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(format('%I.%I', schema_name, partition_name)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+                schema_name, partition_name, schema_name, table_name,
+                month_start, (month_start + INTERVAL '1 month')::DATE
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+
+    IF to_regclass(format('%I.%I', schema_name, table_name || '_default')) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I.%I PARTITION OF %I.%I DEFAULT',
+            schema_name, table_name || '_default', schema_name, table_name
+        );
+    END IF;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+--------------------------------------------------------------------------------
+-- FKs que apontam para as tabelas que serão particionadas
+--------------------------------------------------------------------------------
+ALTER TABLE consumers.payment DROP CONSTRAINT IF EXISTS payment_user_time_id_fkey;
+ALTER TABLE consumers.refunds DROP CONSTRAINT IF EXISTS refunds_payment_id_fkey;
+
+--------------------------------------------------------------------------------
+-- consumers.user_time
+--------------------------------------------------------------------------------
+ALTER TABLE consumers.user_time RENAME TO user_time_old;
+ALTER TABLE consumers.user_time_old RENAME CONSTRAINT user_time_pkey TO user_time_old_pkey;
+
+CREATE TABLE consumers.user_time (
+    LIKE consumers.user_time_old INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (user_id) REFERENCES consumers.user(id) ON DELETE CASCADE,
+    FOREIGN KEY (card_id) REFERENCES consumers.user_card(id) ON DELETE SET NULL,
+    FOREIGN KEY (partner_id) REFERENCES providers.partner(id) ON DELETE RESTRICT
+) PARTITION BY RANGE (created_at);
+
+SELECT bi.ensure_monthly_partitions(
+    'consumers.user_time',
+    COALESCE((SELECT MIN(created_at)::DATE FROM consumers.user_time_old), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 month')::DATE
+);
+
+INSERT INTO consumers.user_time
+SELECT id, active, user_id, card_id, partner_id, type, status, canceled_at, finished_at,
+       partner_schedule_id, COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), updated_at
+FROM consumers.user_time_old;
+
+ALTER SEQUENCE consumers.user_time_id_seq OWNED BY consumers.user_time.id;
+DROP TABLE consumers.user_time_old;
+
+--------------------------------------------------------------------------------
+-- consumers.payment
+--------------------------------------------------------------------------------
+ALTER TABLE consumers.payment RENAME TO payment_old;
+ALTER TABLE consumers.payment_old RENAME CONSTRAINT payment_pkey TO payment_old_pkey;
+
+CREATE TABLE consumers.payment (
+    LIKE consumers.payment_old INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (card_id) REFERENCES consumers.user_card(id) ON DELETE SET NULL,
+    FOREIGN KEY (partner_id) REFERENCES consumers.user(id) ON DELETE RESTRICT,
+    FOREIGN KEY (user_scheduling_id) REFERENCES consumers.user_scheduling(id) ON DELETE SET NULL
+) PARTITION BY RANGE (created_at);
+
+SELECT bi.ensure_monthly_partitions(
+    'consumers.payment',
+    COALESCE((SELECT MIN(created_at)::DATE FROM consumers.payment_old), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 month')::DATE
+);
+
+INSERT INTO consumers.payment
+SELECT id, active, status, message, card_mask, amount_due, amount_hour, hours, card_id, partner_id,
+       user_time_id, COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), updated_at, reference,
+       user_scheduling_id, external_id, billing_type, user_name, transferred_value, value_obtained,
+       payment_type
+FROM consumers.payment_old;
+
+ALTER SEQUENCE consumers.payment_id_seq OWNED BY consumers.payment.id;
+DROP TABLE consumers.payment_old;
+
+--------------------------------------------------------------------------------
+-- analytics.web_events
+--------------------------------------------------------------------------------
+ALTER TABLE analytics.web_events RENAME TO web_events_old;
+ALTER TABLE analytics.web_events_old RENAME CONSTRAINT web_events_pkey TO web_events_old_pkey;
+
+CREATE TABLE analytics.web_events (
+    LIKE analytics.web_events_old INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (user_id) REFERENCES consumers.user(id) ON DELETE SET NULL
+) PARTITION BY RANGE (created_at);
+
+SELECT bi.ensure_monthly_partitions(
+    'analytics.web_events',
+    COALESCE((SELECT MIN(created_at)::DATE FROM analytics.web_events_old), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 month')::DATE
+);
+
+INSERT INTO analytics.web_events
+SELECT id, session_id, event_name, user_id, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM analytics.web_events_old;
+
+ALTER SEQUENCE analytics.web_events_id_seq OWNED BY analytics.web_events.id;
+DROP TABLE analytics.web_events_old;
@@ -0,0 +1,105 @@
+--
+-- V002: ÍNDICES B-TREE PARA OS FILTROS DOS ENDPOINTS /bi/*
+-- Cada índice indica (no comentário) quais consultas ele atende.
+-- Índices criados na tabela particionada (V001) são propagados para todas as partições.
+--
+
+--------------------------------------------------------------------------------
+-- consumers.user_time (check-ins / atividade)
+--------------------------------------------------------------------------------
+-- /bi/user/activity_history, /bi/user/gamification_stats, /bi/active_users, /bi/b2b/* (JOIN por user_id)
+CREATE INDEX IF NOT EXISTS idx_user_time_user_created
+    ON consumers.user_time (user_id, created_at);
+
+-- Rollups por parceiro (bi.daily_partner_activity)
+CREATE INDEX IF NOT EXISTS idx_user_time_partner_created
+    ON consumers.user_time (partner_id, created_at);
+
+-- /bi/gamification/streaks (type = 'CHECKIN' nos últimos 7 dias)
+CREATE INDEX IF NOT EXISTS idx_user_time_checkin_created
+    ON consumers.user_time (created_at, user_id)
+    WHERE type = 'CHECKIN';
+
+--------------------------------------------------------------------------------
+-- consumers.payment
+--------------------------------------------------------------------------------
+-- /bi/kpi_overview, /bi/ltv_cac, /bi/partner/kpi_overview (status = 'PAID' + período)
+CREATE INDEX IF NOT EXISTS idx_payment_status_created
+    ON consumers.payment (status, created_at);
+
+-- JOIN Pagamento -> Agendamento (/bi/revenue_by_region, /bi/b2b/cost_per_collaborator, rollups)
+CREATE INDEX IF NOT EXISTS idx_payment_user_scheduling
+    ON consumers.payment (user_scheduling_id);
+
+--------------------------------------------------------------------------------
+-- consumers.user_scheduling (reservas)
+--------------------------------------------------------------------------------
+-- /bi/partner/reservation_status, /bi/partner/occupation_by_hour (JOIN com partner_schedule)
+CREATE INDEX IF NOT EXISTS idx_user_scheduling_partner_schedule
+    ON consumers.user_scheduling (partner_schedule_id, status);
+
+-- JOIN Agendamento -> Usuário (/bi/revenue_by_region, /bi/b2b/cost_per_collaborator)
+CREATE INDEX IF NOT EXISTS idx_user_scheduling_user
+    ON consumers.user_scheduling (user_id);
+
+--------------------------------------------------------------------------------
+-- providers.partner_schedule
+--------------------------------------------------------------------------------
+-- Todos os KPIs de parceiro filtram ps.partner_id
+CREATE INDEX IF NOT EXISTS idx_partner_schedule_partner
+    ON providers.partner_schedule (partner_id, hour);
+
+--------------------------------------------------------------------------------
+-- consumers.user
+--------------------------------------------------------------------------------
+-- /bi/new_users_over_time, /bi/ltv_cac (novos usuários 30d), /bi/retention_d1_d7_d30
+CREATE INDEX IF NOT EXISTS idx_user_created
+    ON consumers.user (created_at);
+
+-- /bi/user/list (active = TRUE ORDER BY name)
+CREATE INDEX IF NOT EXISTS idx_user_active_name
+    ON consumers.user (name)
+    WHERE active = TRUE;
+
+--------------------------------------------------------------------------------
+-- analytics.web_events
+--------------------------------------------------------------------------------
+-- /bi/conversion_funnel (COUNT DISTINCT session_id / user_id por event_name)
+CREATE INDEX IF NOT EXISTS idx_web_events_event_session
+    ON analytics.web_events (event_name, session_id);
+
+CREATE INDEX IF NOT EXISTS idx_web_events_event_user
+    ON analytics.web_events (event_name, user_id);
+
+--------------------------------------------------------------------------------
+-- companies (B2B)
+--------------------------------------------------------------------------------
+-- JOIN colaborador -> cliente a partir do usuário (UNIQUE (client_id, user_id) já cobre client_id)
+CREATE INDEX IF NOT EXISTS idx_client_collaborator_user
+    ON companies.companies_client_collaborator (user_id);
+
+-- /bi/b2b/campaign_participation
+CREATE INDEX IF NOT EXISTS idx_campaigns_client
+    ON companies.campaigns (client_id);
+
+CREATE INDEX IF NOT EXISTS idx_campaign_participation_campaign
+    ON companies.user_campaign_participation (campaign_id);
+
+--------------------------------------------------------------------------------
+-- Outras tabelas dos KPIs
+--------------------------------------------------------------------------------
+-- /bi/partner/kpi_overview (NPS do parceiro)
+CREATE INDEX IF NOT EXISTS idx_health_feedback_entity_type
+    ON consumers.user_health_feedback (related_entity_id, feedback_type);
+
+-- /bi/user/gamification_stats (calorias 30d)
+CREATE INDEX IF NOT EXISTS idx_health_point_user_recorded
+    ON consumers.user_health_point (user_id, health_point_id, recorded_at);
+
+-- /bi/gamification/missions (LEFT JOIN por mission_id)
+CREATE INDEX IF NOT EXISTS idx_user_missions_mission
+    ON consumers.user_missions (mission_id);
+
+-- /bi/b2b/mev_score_variation (UNIQUE (user_id, calculated_at) já cobre o filtro por usuário)
+CREATE INDEX IF NOT EXISTS idx_mev_score_calculated
+    ON consumers.user_mev_score (calculated_at);
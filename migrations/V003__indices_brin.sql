@@ -0,0 +1,21 @@
+--
+-- V003: ÍNDICES BRIN NAS COLUNAS DE TEMPO
+-- As tabelas fato recebem dados quase sempre em ordem de created_at, então um
+-- BRIN (poucos KB) descarta blocos inteiros em filtros de período
+-- ("created_at >= CURRENT_DATE - INTERVAL 'N day'") sem o custo de um B-tree.
+--
+
+CREATE INDEX IF NOT EXISTS brin_user_time_created
+    ON consumers.user_time USING BRIN (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS brin_payment_created
+    ON consumers.payment USING BRIN (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS brin_web_events_created
+    ON analytics.web_events USING BRIN (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS brin_user_scheduling_created
+    ON consumers.user_scheduling USING BRIN (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS brin_user_health_point_recorded
+    ON consumers.user_health_point USING BRIN (recorded_at) WITH (pages_per_range = 32);
@@ -0,0 +1,62 @@
+--
+-- V004: NOTIFICAÇÃO DE MUDANÇAS NOS KPIs DO PARCEIRO
+-- Triggers que fazem pg_notify('bi_partner_kpi', partner_id) quando reservas, pagamentos,
+-- horários ou avaliações NPS de um parceiro mudam. O backend (partner_snapshot.py) escuta
+-- o canal e recalcula só o snapshot desses parceiros.
+-- O Postgres junta notificações iguais da mesma transação: uma carga em lote gera uma
+-- notificação por parceiro, não por linha.
+--
+
+CREATE OR REPLACE FUNCTION bi.notify_partner_kpi() RETURNS trigger AS $$
+DECLARE
+    r RECORD;
+    pid INTEGER;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        r := OLD;
+    ELSE
+        r := NEW;
+    END IF;
+
+    -- TG_ARGV[0] = tabela de origem (nas tabelas particionadas, TG_TABLE_NAME é a partição)
+    IF TG_ARGV[0] = 'partner_schedule' THEN
+        pid := r.partner_id;
+    ELSIF TG_ARGV[0] = 'user_scheduling' THEN
+        SELECT ps.partner_id INTO pid
+        FROM providers.partner_schedule ps
+        WHERE ps.id = r.partner_schedule_id;
+    ELSIF TG_ARGV[0] = 'payment' THEN
+        SELECT ps.partner_id INTO pid
+        FROM consumers.user_scheduling s
+        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+        WHERE s.id = r.user_scheduling_id;
+    ELSIF TG_ARGV[0] = 'user_health_feedback' AND r.feedback_type = 'NPS_PARTNER' THEN
+        pid := r.related_entity_id;
+    END IF;
+
+    IF pid IS NOT NULL THEN
+        PERFORM pg_notify('bi_partner_kpi', pid::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_partner_kpi ON providers.partner_schedule;
+CREATE TRIGGER trg_notify_partner_kpi
+    AFTER INSERT OR UPDATE OR DELETE ON providers.partner_schedule
+    FOR EACH ROW EXECUTE FUNCTION bi.notify_partner_kpi('partner_schedule');
+
+DROP TRIGGER IF EXISTS trg_notify_partner_kpi ON consumers.user_scheduling;
+CREATE TRIGGER trg_notify_partner_kpi
+    AFTER INSERT OR UPDATE OR DELETE ON consumers.user_scheduling
+    FOR EACH ROW EXECUTE FUNCTION bi.notify_partner_kpi('user_scheduling');
+
+DROP TRIGGER IF EXISTS trg_notify_partner_kpi ON consumers.payment;
+CREATE TRIGGER trg_notify_partner_kpi
+    AFTER INSERT OR UPDATE OR DELETE ON consumers.payment
+    FOR EACH ROW EXECUTE FUNCTION bi.notify_partner_kpi('payment');
+
+DROP TRIGGER IF EXISTS trg_notify_partner_kpi ON consumers.user_health_feedback;
+CREATE TRIGGER trg_notify_partner_kpi
+    AFTER INSERT OR UPDATE OR DELETE ON consumers.user_health_feedback
+    FOR EACH ROW EXECUTE FUNCTION bi.notify_partner_kpi('user_health_feedback');
@@ -0,0 +1,32 @@
+--
+-- V005: ÍNDICES DA BUSCA DE USUÁRIOS (/bi/user/search, ver backend/user_search.py)
+-- Todos parciais em active = TRUE (a busca só mostra usuários ativos).
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Paginação keyset "ORDER BY name, id" e "(name, id) > (:after_name, :after_id)".
+-- Substitui idx_user_active_name (V002), que não tinha o id para desempatar nomes iguais.
+CREATE INDEX IF NOT EXISTS idx_user_active_name_id
+    ON consumers.user (name, id)
+    WHERE active = TRUE;
+
+DROP INDEX IF EXISTS consumers.idx_user_active_name;
+
+-- Busca por prefixo (1 a 2 caracteres): lower(name) LIKE 'ab%' / lower(email) LIKE 'ab%'
+CREATE INDEX IF NOT EXISTS idx_user_active_name_prefix
+    ON consumers.user (lower(name) text_pattern_ops)
+    WHERE active = TRUE;
+
+CREATE INDEX IF NOT EXISTS idx_user_active_email_prefix
+    ON consumers.user (lower(email) text_pattern_ops)
+    WHERE active = TRUE;
+
+-- Busca "contém" (3+ caracteres): name ILIKE '%abc%' / email ILIKE '%abc%'
+CREATE INDEX IF NOT EXISTS trgm_user_active_name
+    ON consumers.user USING GIN (name gin_trgm_ops)
+    WHERE active = TRUE;
+
+CREATE INDEX IF NOT EXISTS trgm_user_active_email
+    ON consumers.user USING GIN (email gin_trgm_ops)
+    WHERE active = TRUE;
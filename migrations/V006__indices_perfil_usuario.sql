@@ -0,0 +1,12 @@
+--
+-- V006: ÍNDICES DO REFRESH INCREMENTAL DO PERFIL POR USUÁRIO (backend/user_profile.py)
+-- A cada refresh o job procura os usuários alterados desde o watermark.
+--
+
+-- Cadastro alterado (ex: troca de rank): consumers.user.updated_at >= watermark
+CREATE INDEX IF NOT EXISTS idx_user_updated
+    ON consumers.user (updated_at);
+
+-- Conquistas novas: consumers.user_health_stamp.created_at >= watermark
+CREATE INDEX IF NOT EXISTS idx_user_health_stamp_created
+    ON consumers.user_health_stamp (created_at);
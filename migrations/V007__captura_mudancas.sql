@@ -0,0 +1,89 @@
+--
+-- V007: CAPTURA DE MUDANÇAS (CDC) NAS TABELAS FATO
+-- Triggers gravam cada INSERT/UPDATE/DELETE de user_time, payment, user_scheduling e web_events
+-- em bi.change_log (linha antiga e nova em JSONB) e avisam o backend com
+-- pg_notify('bi_changes', tabela), uma vez por comando. O backend (backend/cdc.py) lê as
+-- mudanças em lotes e entrega para os agregados registrados, que se atualizam pelo delta.
+--
+-- Cada consumidor guarda em bi.cdc_offset o snapshot (pg_snapshot) até onde já leu: uma
+-- mudança é nova se a transação dela (txid) não era visível nesse snapshot. Ao contrário
+-- de "id > último id", isso não pula transações longas que gravaram um id menor e
+-- confirmaram depois. Requer PostgreSQL 13+ (xid8 / pg_snapshot).
+--
+-- Cargas em lote (bulk_loader.py) também passam pelos triggers. Para cargas históricas
+-- grandes, desligue-os (ALTER TABLE ... DISABLE TRIGGER trg_cdc_capture) e rode os refresh
+-- com --full depois.
+--
+
+CREATE TABLE IF NOT EXISTS bi.change_log (
+    id BIGSERIAL PRIMARY KEY,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    source VARCHAR(50) NOT NULL,        -- user_time, payment, user_scheduling, web_events
+    op CHAR(1) NOT NULL,                -- I, U, D
+    row_id BIGINT NOT NULL,
+    old_row JSONB,                      -- UPDATE / DELETE
+    new_row JSONB,                      -- INSERT / UPDATE
+    changed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_txid ON bi.change_log (txid);
+CREATE INDEX IF NOT EXISTS idx_change_log_source_id ON bi.change_log (source, id);
+
+-- Posição de cada consumidor (agregado) no feed
+CREATE TABLE IF NOT EXISTS bi.cdc_offset (
+    consumer VARCHAR(100) PRIMARY KEY,
+    sources VARCHAR(50)[] NOT NULL,
+    done_snapshot PG_SNAPSHOT NOT NULL,  -- mudanças visíveis aqui já foram aplicadas
+    target_snapshot PG_SNAPSHOT,         -- janela em andamento (lida em lotes por id)
+    last_id BIGINT NOT NULL DEFAULT 0,   -- último id aplicado dentro da janela em andamento
+    last_changed_at TIMESTAMP WITHOUT TIME ZONE,
+    applied_rows BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bi.capture_change() RETURNS trigger AS $$
+BEGIN
+    -- TG_ARGV[0] = tabela de origem (nas tabelas particionadas, TG_TABLE_NAME é a partição)
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO bi.change_log (source, op, row_id, new_row)
+        VALUES (TG_ARGV[0], 'I', NEW.id, to_jsonb(NEW));
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO bi.change_log (source, op, row_id, old_row, new_row)
+        VALUES (TG_ARGV[0], 'U', NEW.id, to_jsonb(OLD), to_jsonb(NEW));
+    ELSE
+        INSERT INTO bi.change_log (source, op, row_id, old_row)
+        VALUES (TG_ARGV[0], 'D', OLD.id, to_jsonb(OLD));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bi.notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('bi_changes', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('consumers.user_time', 'user_time'),
+        ('consumers.payment', 'payment'),
+        ('consumers.user_scheduling', 'user_scheduling'),
+        ('analytics.web_events', 'web_events')
+    ) AS x(tbl, source)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_cdc_capture ON %s', t.tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_cdc_capture AFTER INSERT OR UPDATE OR DELETE ON %s '
+            'FOR EACH ROW EXECUTE FUNCTION bi.capture_change(%L)', t.tbl, t.source);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_cdc_notify ON %s', t.tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_cdc_notify AFTER INSERT OR UPDATE OR DELETE ON %s '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bi.notify_change(%L)', t.tbl, t.source);
+    END LOOP;
+END;
+$$;
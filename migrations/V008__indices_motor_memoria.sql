@@ -0,0 +1,13 @@
+--
+-- V008: ÍNDICES DO REFRESH INCREMENTAL DO MOTOR EM MEMÓRIA (backend/fact_engine.py)
+-- Com FACT_ENGINE_ENABLED=true, a cada refresh o motor lê só as linhas alteradas desde o último.
+-- (consumers.user.updated_at já tem índice: idx_user_updated, V006)
+--
+
+-- Agendamentos novos/alterados (ex: mudança de status): updated_at >= último lido
+CREATE INDEX IF NOT EXISTS idx_user_scheduling_updated
+    ON consumers.user_scheduling (updated_at);
+
+-- Pagamentos novos/alterados (ex: PENDING -> PAID); tabela particionada: o índice vale para todas as partições
+CREATE INDEX IF NOT EXISTS idx_payment_updated
+    ON consumers.payment (updated_at);
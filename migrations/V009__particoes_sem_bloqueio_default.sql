@@ -0,0 +1,69 @@
+--
+-- V009: bi.ensure_monthly_partitions COM LINHAS NA PARTIÇÃO DEFAULT
+-- O Postgres não cria "PARTITION OF ... FOR VALUES FROM/TO" enquanto a partição DEFAULT tem
+-- linhas nesse intervalo (ex: o job mensal atrasou, ou uma carga gravou datas futuras).
+-- A função da V001 falhava nesses casos; esta versão, antes de criar o mês:
+--   1. tira da tabela (pela tabela mãe) as linhas do mês que estão na DEFAULT, guardando numa temp;
+--   2. cria a partição do mês;
+--   3. devolve as linhas pela tabela mãe (agora caem na partição nova).
+-- Tudo na transação de quem chamou. Com a captura de mudanças (V007) ativa, o change_log recebe
+-- um DELETE e um INSERT da mesma linha: para os agregados o efeito líquido é zero.
+--
+
+CREATE OR REPLACE FUNCTION bi.ensure_monthly_partitions(parent TEXT, from_day DATE, to_day DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    schema_name TEXT := split_part(parent, '.', 1);
+    table_name TEXT := split_part(parent, '.', 2);
+    month_start DATE := date_trunc('month', from_day)::DATE;
+    month_end DATE;
+    partition_name TEXT;
+    has_default BOOLEAN := to_regclass(format('%I.%I', schema_name, table_name || '_default')) IS NOT NULL;
+    moving BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= to_day LOOP
+        month_end := (month_start + INTERVAL '1 month')::DATE;
+        partition_name := format('%s_%s', table_name, to_char(month_start, 'YYYY_MM'));
+        IF to_regclass(format('%I.%I', schema_name, partition_name)) IS NULL THEN
+            moving := FALSE;
+            IF has_default THEN
+                EXECUTE format(
+                    'SELECT EXISTS (SELECT 1 FROM %I.%I WHERE created_at >= %L AND created_at < %L)',
+                    schema_name, table_name || '_default', month_start, month_end
+                ) INTO moving;
+            END IF;
+
+            IF moving THEN
+                EXECUTE format('CREATE TEMP TABLE partition_move (LIKE %I.%I)', schema_name, table_name);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %I.%I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                    'INSERT INTO partition_move SELECT * FROM moved',
+                    schema_name, table_name, month_start, month_end
+                );
+            END IF;
+
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %I.%I FOR VALUES FROM (%L) TO (%L)',
+                schema_name, partition_name, schema_name, table_name, month_start, month_end
+            );
+            created := created + 1;
+
+            IF moving THEN
+                EXECUTE format('INSERT INTO %I.%I SELECT * FROM partition_move', schema_name, table_name);
+                DROP TABLE partition_move;
+            END IF;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+
+    IF NOT has_default THEN
+        EXECUTE format(
+            'CREATE TABLE %I.%I PARTITION OF %I.%I DEFAULT',
+            schema_name, table_name || '_default', schema_name, table_name
+        );
+    END IF;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
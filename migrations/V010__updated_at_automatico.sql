@@ -0,0 +1,35 @@
+--
+-- V010: updated_at AUTOMÁTICO NAS TABELAS LIDAS PELO updated_at
+-- O store B2B (backend/b2b_store.py) e o motor em memória (backend/fact_engine.py) só relêem
+-- pagamentos e agendamentos cujo updated_at andou. O schema só tem DEFAULT CURRENT_TIMESTAMP
+-- (vale no INSERT): um UPDATE de status (PENDING -> PAID, estorno, cancelamento) que não mexe
+-- no updated_at passava despercebido até a próxima releitura completa.
+--
+-- Um trigger BEFORE UPDATE grava o horário da mudança em updated_at quando a linha muda de fato
+-- (UPDATE que não altera nada não mexe no updated_at). Em consumers.payment, particionada, o
+-- trigger criado na tabela pai vale para todas as partições (PostgreSQL 13+).
+--
+-- Obrigatória para o incremental da receita do store B2B.
+--
+
+CREATE OR REPLACE FUNCTION bi.touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl TEXT;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['consumers.payment', 'consumers.user_scheduling']
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_touch_updated_at ON %s', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER trg_touch_updated_at BEFORE UPDATE ON %s '
+            'FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) '
+            'EXECUTE FUNCTION bi.touch_updated_at()', tbl);
+    END LOOP;
+END;
+$$;
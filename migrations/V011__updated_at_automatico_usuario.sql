@@ -0,0 +1,17 @@
+--
+-- V011: updated_at AUTOMÁTICO EM consumers.user
+-- O refresh do perfil (backend/user_profile.py) recalcula os usuários com updated_at >= último
+-- refresh (ex: mudança de rank), e o motor em memória (backend/fact_engine.py) relê os usuários
+-- pelo mesmo critério. Sem trigger, um UPDATE que não mexe no updated_at só aparecia no
+-- recálculo diário do perfil e na releitura completa do motor.
+--
+-- Usa a função da V010 (bi.touch_updated_at); só dispara quando a linha muda de fato.
+--
+-- Obrigatória para o incremental do perfil do usuário.
+--
+
+DROP TRIGGER IF EXISTS trg_touch_updated_at ON consumers.user;
+
+CREATE TRIGGER trg_touch_updated_at BEFORE UPDATE ON consumers.user
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION bi.touch_updated_at();
@@ -0,0 +1,120 @@
+# migrations/apply_migrations.py
+# Aplica, em ordem, os arquivos VNNN__descricao.sql desta pasta que ainda não
+# foram aplicados. O controle fica na tabela public.schema_migrations.
+#
+# Uso:
+#   python migrations/apply_migrations.py            -> aplica as pendentes
+#   python migrations/apply_migrations.py --status   -> só lista o que já foi aplicado
+#   python migrations/apply_migrations.py --ensure-partitions
+#       -> cria as partições mensais dos próximos 3 meses (rodar 1x por mês, ex: cron)
+import argparse
+import os
+import re
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+FILE_PATTERN = re.compile(r"^V(\d{3})__(.+)\.sql$")
+
+PARTITIONED_TABLES = ["consumers.user_time", "consumers.payment", "analytics.web_events"]
+
+
+def list_migrations():
+    """ Retorna [(versão, nome, caminho)] ordenado pela versão. """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = FILE_PATTERN.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def ensure_control_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS public.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM public.schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_pending(conn):
+    cursor = conn.cursor()
+    ensure_control_table(cursor)
+    conn.commit()
+
+    done = applied_versions(cursor)
+    pending = [m for m in list_migrations() if m[0] not in done]
+    if not pending:
+        print("Nenhuma migração pendente.")
+        return
+
+    for version, name, path in pending:
+        print(f"Aplicando V{version:03d}__{name}...")
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        try:
+            # Cada arquivo roda em UMA transação: ou aplica tudo, ou nada.
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO public.schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            conn.commit()
+            print(f"-> V{version:03d} aplicada.")
+        except Exception as e:
+            conn.rollback()
+            print(f"ERRO ao aplicar V{version:03d}__{name}: {e}")
+            sys.exit(1)
+
+
+def print_status(conn):
+    cursor = conn.cursor()
+    ensure_control_table(cursor)
+    conn.commit()
+    done = applied_versions(cursor)
+    for version, name, _ in list_migrations():
+        status = "aplicada" if version in done else "PENDENTE"
+        print(f"V{version:03d}__{name}: {status}")
+
+
+def ensure_partitions(conn):
+    cursor = conn.cursor()
+    for table in PARTITIONED_TABLES:
+        cursor.execute(
+            "SELECT bi.ensure_monthly_partitions(%s, CURRENT_DATE, (CURRENT_DATE + INTERVAL '3 month')::DATE)",
+            (table,),
+        )
+        print(f"-> {table}: {cursor.fetchone()[0]} partições novas.")
+    conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aplica as migrações versionadas (migrations/VNNN__*.sql).")
+    parser.add_argument("--status", action="store_true", help="Lista as migrações e se já foram aplicadas.")
+    parser.add_argument("--ensure-partitions", action="store_true", help="Cria as partições mensais dos próximos meses.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    if not DATABASE_URL:
+        raise SystemExit("ERROR: DATABASE_URL is not set. Coloque no .env ou exporte.")
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        if args.status:
+            print_status(conn)
+        elif args.ensure_partitions:
+            ensure_partitions(conn)
+        else:
+            apply_pending(conn)
+    finally:
+        conn.close()
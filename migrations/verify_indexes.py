@@ -0,0 +1,256 @@
+# migrations/verify_indexes.py
+# Roda EXPLAIN (FORMAT JSON) nas consultas dos endpoints /bi/* e confere se as
+# tabelas fato são lidas por índice (B-tree/BRIN) e com poda de partições,
+# em vez de "Seq Scan".
+#
+# Uso:
+#   python migrations/verify_indexes.py
+#   python migrations/verify_indexes.py --force-index   (SET enable_seqscan = off)
+#
+# Em bancos pequenos (poucos milhares de linhas) o planner prefere Seq Scan
+# mesmo com índice; use --force-index para verificar se o índice PODE ser usado.
+import argparse
+import json
+import os
+import re
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Tabelas que não podem ser lidas por Seq Scan nas consultas seletivas
+# (as partições "consumers.user_time_2025_01" etc. contam como a tabela mãe)
+WATCHED_TABLES = [
+    "consumers.user_time",
+    "consumers.payment",
+    "consumers.user_scheduling",
+    "analytics.web_events",
+    "consumers.user",
+    "consumers.user_health_feedback",
+    "consumers.user_health_point",
+    "consumers.user_mev_score",
+    "consumers.user_health_stamp",
+    "companies.companies_client_collaborator",
+]
+
+# (endpoint, sql, seletiva)
+# "seletiva=False" = agregação sobre a tabela inteira: o Seq Scan é esperado e só é reportado.
+QUERIES = [
+    ("/bi/active_users", """
+        SELECT COUNT(DISTINCT user_id) FROM consumers.user_time
+        WHERE created_at >= (CURRENT_DATE - INTERVAL '7 day')
+    """, True),
+    # /bi/gamification/streaks e /bi/user/streak leem bi.user_streak (streaks.py);
+    # abaixo, a leitura do refresh por watermark (sem o feed de mudanças)
+    ("streaks (check-ins incremental)", """
+        SELECT DISTINCT user_id, DATE(created_at) FROM consumers.user_time
+        WHERE type = 'CHECKIN' AND user_id IS NOT NULL AND created_at >= CURRENT_DATE - INTERVAL '1 day'
+    """, True),
+    ("/bi/kpi_overview + /bi/ltv_cac (platform_totals)", """
+        SELECT
+            (SELECT COUNT(id) FILTER (WHERE created_at >= (CURRENT_DATE - INTERVAL '30 day'))
+             FROM consumers.user),
+            (SELECT SUM(amount_due) FROM consumers.payment WHERE status = 'PAID')
+    """, False),
+    ("/bi/new_users_over_time", """
+        SELECT DATE(created_at), COUNT(id) FROM consumers.user GROUP BY 1
+    """, False),
+    # /bi/conversion_funnel lê bi.funnel_daily (funnel.py); abaixo, a leitura do refresh incremental
+    ("funnel (eventos desde o watermark)", """
+        SELECT session_id, event_name, created_at FROM analytics.web_events
+        WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'
+          AND event_name = ANY(ARRAY['visitou_site', 'completou_cadastro'])
+        ORDER BY session_id, created_at, id
+    """, True),
+    ("/bi/partner/reservation_status", """
+        SELECT s.status, COUNT(s.id)
+        FROM consumers.user_scheduling s
+        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+        WHERE ps.partner_id = %(partner_id)s
+        GROUP BY s.status
+    """, True),
+    ("/bi/partner/occupation_by_hour", """
+        SELECT ps.hour, COUNT(s.id)
+        FROM consumers.user_scheduling s
+        JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+        WHERE ps.partner_id = %(partner_id)s AND ps.hour IS NOT NULL
+        GROUP BY ps.hour
+    """, True),
+    ("partner_snapshot (refresh de um parceiro)", """
+        SELECT
+            (SELECT AVG(rating) FROM consumers.user_health_feedback
+             WHERE related_entity_id = %(partner_id)s AND feedback_type = 'NPS_PARTNER'),
+            (SELECT SUM(p.transferred_value)
+             FROM consumers.payment p
+             JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
+             JOIN providers.partner_schedule ps ON s.partner_schedule_id = ps.id
+             WHERE ps.partner_id = %(partner_id)s AND p.status = 'PAID'
+               AND p.created_at >= (CURRENT_DATE - INTERVAL '30 day'))
+    """, True),
+    ("/bi/b2b/engagement_stats", """
+        SELECT COUNT(DISTINCT c.user_id)
+        FROM companies.companies_client_collaborator c
+        JOIN consumers.user_time ut ON c.user_id = ut.user_id
+        WHERE c.client_id = %(client_id)s
+          AND ut.created_at >= (CURRENT_DATE - INTERVAL '30 day')
+    """, True),
+    ("/bi/b2b/cost_per_collaborator", """
+        SELECT SUM(p.amount_due)
+        FROM consumers.payment p
+        JOIN consumers.user_scheduling s ON p.user_scheduling_id = s.id
+        JOIN companies.companies_client_collaborator c ON s.user_id = c.user_id
+        WHERE c.client_id = %(client_id)s AND p.status = 'PAID'
+    """, True),
+    ("/bi/b2b/mev_score_variation", """
+        SELECT user_id, score FROM consumers.user_mev_score
+        WHERE user_id IN (SELECT user_id FROM companies.companies_client_collaborator
+                          WHERE client_id = %(client_id)s)
+          AND calculated_at >= (CURRENT_DATE - INTERVAL '35 day')
+    """, True),
+    ("/bi/user/list", """
+        SELECT id, name FROM consumers.user WHERE active = TRUE ORDER BY name, id LIMIT 100
+    """, True),
+    # /bi/user/search (user_search.py): "%%" = "%" literal no psycopg2
+    ("/bi/user/search (página seguinte)", """
+        SELECT id, name, email FROM consumers.user
+        WHERE active = TRUE AND (name, id) > ('M', 0)
+        ORDER BY name, id LIMIT 21
+    """, True),
+    ("/bi/user/search (prefixo)", """
+        SELECT id, name, email FROM consumers.user
+        WHERE active = TRUE AND (lower(name) LIKE 'ma%%' OR lower(email) LIKE 'ma%%')
+        ORDER BY name, id LIMIT 21
+    """, True),
+    ("/bi/user/search (contém)", """
+        SELECT id, name, email FROM consumers.user
+        WHERE active = TRUE AND (name ILIKE '%%silva%%' OR email ILIKE '%%silva%%')
+        ORDER BY name, id LIMIT 21
+    """, True),
+    # /bi/user/activity_history e /bi/user/gamification_stats leem bi.user_profile (user_profile.py);
+    # abaixo, as leituras do refresh incremental do perfil
+    ("user_profile (atividade diária incremental)", """
+        SELECT user_id, DATE(created_at), COUNT(*) FILTER (WHERE type = 'CHECKIN')
+        FROM consumers.user_time
+        WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'
+        GROUP BY 1, 2
+    """, True),
+    ("user_profile (calorias incremental)", """
+        SELECT uhp.user_id, DATE(uhp.recorded_at), SUM(uhp.value)
+        FROM consumers.user_health_point uhp
+        JOIN consumers.health_point hp ON uhp.health_point_id = hp.id
+        WHERE hp.name = 'Calorias Queimadas'
+          AND uhp.recorded_at >= CURRENT_DATE - INTERVAL '1 day'
+        GROUP BY 1, 2
+    """, True),
+    ("user_profile (usuários alterados)", """
+        SELECT id FROM consumers.user WHERE updated_at >= CURRENT_DATE - INTERVAL '1 day'
+        UNION
+        SELECT user_id FROM consumers.user_health_stamp WHERE created_at >= CURRENT_DATE - INTERVAL '1 day'
+    """, True),
+    # Com FACT_ENGINE_ENABLED=true, os group-bys vêm do motor em memória (fact_engine.py);
+    # abaixo, as leituras do refresh incremental dele
+    ("fact_engine (agendamentos alterados)", """
+        SELECT id, user_id, partner_schedule_id, status FROM consumers.user_scheduling
+        WHERE updated_at >= CURRENT_DATE - INTERVAL '1 day'
+    """, True),
+    ("fact_engine (pagamentos alterados)", """
+        SELECT id, user_scheduling_id, status, amount_due FROM consumers.payment
+        WHERE updated_at >= CURRENT_DATE - INTERVAL '1 day'
+    """, True),
+    ("rollups (refresh incremental)", """
+        SELECT DATE(created_at), COUNT(DISTINCT user_id) FROM consumers.user_time
+        WHERE created_at >= CURRENT_DATE
+        GROUP BY 1
+    """, True),
+]
+
+
+# Sufixo das partições criadas por bi.ensure_monthly_partitions (V001)
+PARTITION_SUFFIX = re.compile(r"_(\d{4}_\d{2}|default)$")
+
+
+def watched_table(schema, relation):
+    """ Retorna a tabela monitorada correspondente (considerando partições) ou None. """
+    table = f"{schema}.{PARTITION_SUFFIX.sub('', relation)}"
+    return table if table in WATCHED_TABLES else None
+
+
+def collect_scans(plan, scans):
+    """ Percorre a árvore do EXPLAIN e junta (tabela, tipo de nó, índice). """
+    if "Relation Name" in plan:
+        scans.append((plan.get("Schema", ""), plan["Relation Name"], plan["Node Type"], plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        collect_scans(child, scans)
+    return scans
+
+
+def sample_params(cursor):
+    """ Pega IDs reais do banco para preencher os parâmetros das consultas. """
+    params = {}
+    for name, sql in [
+        ("partner_id", "SELECT partner_id FROM providers.partner_schedule LIMIT 1"),
+        ("client_id", "SELECT client_id FROM companies.companies_client_collaborator LIMIT 1"),
+        ("user_id", "SELECT user_id FROM consumers.user_time LIMIT 1"),
+    ]:
+        cursor.execute(sql)
+        row = cursor.fetchone()
+        params[name] = row[0] if row else 1
+    return params
+
+
+def verify(conn, force_index=False):
+    cursor = conn.cursor()
+    if force_index:
+        cursor.execute("SET enable_seqscan = off")
+    params = sample_params(cursor)
+
+    failures = 0
+    for endpoint, sql, selective in QUERIES:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        raw = cursor.fetchone()[0]
+        plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+
+        per_table = {}
+        for schema, relation, node_type, index_name in collect_scans(plan, []):
+            table = watched_table(schema, relation)
+            if table:
+                per_table.setdefault(table, []).append((relation, node_type, index_name))
+
+        seq_scans = [
+            (table, relation) for table, nodes in per_table.items()
+            for relation, node_type, _ in nodes if node_type == "Seq Scan"
+        ]
+        if seq_scans and selective:
+            status = "FALHA"
+            failures += 1
+        elif seq_scans:
+            status = "ok (agregação total, Seq Scan esperado)"
+        else:
+            status = "ok"
+
+        print(f"[{status}] {endpoint}")
+        for table, nodes in per_table.items():
+            partitions = {relation for relation, _, _ in nodes}
+            kinds = sorted({f"{node_type}{' ' + index_name if index_name else ''}" for _, node_type, index_name in nodes})
+            print(f"    {table}: {len(partitions)} partição(ões)/tabela(s) lidas -> {', '.join(kinds)}")
+
+    print(f"\n{len(QUERIES) - failures}/{len(QUERIES)} consultas sem Seq Scan indevido.")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere via EXPLAIN se os endpoints /bi/* usam os índices.")
+    parser.add_argument("--force-index", action="store_true", help="Desliga o Seq Scan (SET enable_seqscan = off).")
+    args = parser.parse_args()
+
+    load_dotenv()
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    if not DATABASE_URL:
+        raise SystemExit("ERROR: DATABASE_URL is not set. Coloque no .env ou exporte.")
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        failures = verify(conn, force_index=args.force_index)
+    finally:
+        conn.close()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,201 @@
+# parallel_loader.py
+# Geração paralela (em shards) das tabelas de alto volume, usando as funções do bulk_loader.py.
+#
+# Como funciona:
+#   1. O processo pai reserva de uma vez, em cada sequence, uma faixa de IDs para a carga
+#      inteira e divide essa faixa entre os shards (sem lock entre workers durante a carga).
+#   2. Cada worker abre a sua conexão e roda o COPY do seu shard com um random.Random e um
+#      Faker com seed própria (f"{seed}:{shard}:{fase}").
+#   3. Fase 1 (paralela): usuários e parceiros/horários.
+#      Entre as fases o pai cria planos e clientes B2B (poucas linhas).
+#      Fase 2 (paralela): colaboradores, fatos, funil e MEV scores.
+#   Só os grupos de 'tables' (ver TABLES no generate_fake_data.py) são gerados; sem
+#   "users"/"partners", os shards usam os usuários/horários que já estão no banco.
+#
+# Com a mesma seed, o mesmo número de workers, a mesma --anchor-date e partindo do mesmo
+# estado do banco (ex: banco vazio), o resultado é idêntico, linha a linha e ID a ID.
+# As faixas são reservadas pelo limite superior de linhas: sobram "buracos" nos IDs.
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import psycopg2
+from faker import Faker
+
+import bulk_loader
+
+FATOS_POR_RESERVA = [
+    "consumers.user_scheduling", "consumers.user_time", "consumers.payment",
+    "consumers.user_health_feedback", "consumers.user_health_point", "consumers.user_health_stamp",
+]
+
+
+def split(total, workers):
+    """ Divide 'total' em 'workers' partes (as primeiras recebem o resto). """
+    base, rest = divmod(total, workers)
+    return [base + (1 if i < rest else 0) for i in range(workers)]
+
+
+def _rng(seed, shard, phase):
+    return random.Random(f"{seed}:{shard}:{phase}")
+
+
+def _faker(seed, shard, phase):
+    fake = Faker("pt_BR")
+    fake.seed_instance(f"{seed}:{shard}:{phase}")
+    return fake
+
+
+def _reserve_ranges(cursor, sizes_by_table):
+    """
+    Reserva, na sequence de cada tabela, a soma das faixas dos shards.
+    sizes_by_table: {tabela: [tamanho_shard_0, tamanho_shard_1, ...]}
+    Retorna uma lista (um item por shard) de {tabela: IdRange}.
+    """
+    workers = len(next(iter(sizes_by_table.values())))
+    shard_ids = [{} for _ in range(workers)]
+    for table, sizes in sizes_by_table.items():
+        total = sum(sizes)
+        if total == 0:
+            continue
+        start = bulk_loader.IdAllocator(cursor, table).reserve(total)
+        for shard, size in enumerate(sizes):
+            shard_ids[shard][table] = bulk_loader.IdRange(start, size)
+            start += size
+    return shard_ids
+
+
+# --- Workers (rodam em processos separados) ---
+
+def _phase_1(task):
+    conn = psycopg2.connect(task["database_url"])
+    try:
+        rng = _rng(task["seed"], task["shard"], 1)
+        fake = _faker(task["seed"], task["shard"], 1)
+        user_ids, active_ids, schedule_map = [], [], {}
+        if task["users"]:
+            user_ids, active_ids = bulk_loader.bulk_users(
+                conn, task["users"], task["rank_ids"], fake, rng=rng, batch_size=task["batch_size"],
+                ids=task["ids"], now=task["now"])
+        if task["partners"]:
+            _, schedule_map = bulk_loader.bulk_partners_and_schedules(
+                conn, task["partners"], fake, rng=rng, batch_size=task["batch_size"], ids=task["ids"])
+        return user_ids, active_ids, schedule_map
+    finally:
+        conn.close()
+
+
+def _phase_2(task):
+    conn = psycopg2.connect(task["database_url"])
+    try:
+        rng = _rng(task["seed"], task["shard"], 2)
+        batch_size, ids, now, tables = task["batch_size"], task["ids"], task["now"], task["tables"]
+        if "b2b" in tables:
+            bulk_loader.bulk_b2b_collaborators(conn, task["client_ids"], task["user_ids"], rng=rng,
+                                               batch_size=batch_size, ids=ids, offset=task["offset"])
+        if "facts" in tables:
+            bulk_loader.bulk_facts(conn, task["facts"], task["active_ids"], task["schedule_map"],
+                                   task["calories_id"], rng=rng, batch_size=batch_size, ids=ids, now=now)
+        if "web_events" in tables:
+            bulk_loader.bulk_web_events(conn, task["sessions"], task["user_ids"], rng=rng, batch_size=batch_size,
+                                        ids=ids, now=now)
+        if "mev_scores" in tables:
+            bulk_loader.bulk_mev_scores(conn, task["user_ids"], rng=rng, batch_size=batch_size, ids=ids, now=now)
+    finally:
+        conn.close()
+
+
+def _run(func, tasks, workers):
+    """ Executa as tarefas no pool de processos (ou no próprio processo com 1 worker), na ordem dos shards. """
+    if workers == 1:
+        return [func(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, tasks))
+
+
+# --- Orquestração (processo pai) ---
+
+def _chunks(items, sizes):
+    """ Fatia 'items' em pedaços contíguos com os tamanhos dados. """
+    chunks, start = [], 0
+    for size in sizes:
+        chunks.append(items[start:start + size])
+        start += size
+    return chunks
+
+
+def load_parallel(conn, database_url, workers, seed, master_data, create_clients, volumes, tables,
+                  existing_users=None, existing_schedule_map=None,
+                  batch_size=bulk_loader.DEFAULT_BATCH_SIZE, now=None):
+    """
+    Gera as tabelas de alto volume em 'workers' processos.
+    'volumes' vem de scaled_volumes() e 'tables' é o conjunto de grupos a gerar.
+    'create_clients()' roda no pai entre as fases e deve retornar os client_ids.
+    existing_users / existing_schedule_map: dados já no banco, usados quando
+    "users" / "partners" não estão em 'tables'.
+    Retorna (all_user_ids, active_user_ids, client_ids).
+    """
+    workers = max(1, workers)
+    now = now or datetime.now()
+    cursor = conn.cursor()
+
+    def shard_sizes(group, volume):
+        return split(volumes[volume] if group in tables else 0, workers)
+
+    users, partners = shard_sizes("users", "users"), shard_sizes("partners", "partners")
+    facts, sessions = shard_sizes("facts", "facts"), shard_sizes("web_events", "web_sessions")
+    print(f"[PARALELO] {workers} workers, seed={seed}, âncora={now:%Y-%m-%d %H:%M}.")
+
+    # Usuários de cada shard na fase 2 (gerados agora ou os que já existem no banco)
+    if existing_users is not None:
+        shard_users = split(len(existing_users[0]), workers)
+        existing_active = set(existing_users[1])
+    else:
+        shard_users = users
+
+    # Limites superiores de linhas por shard (ver bulk_loader)
+    sizes = {
+        "consumers.user": users,
+        "providers.partner": partners,
+        "providers.partner_activity": partners,
+        "providers.partner_schedule": [6 * p for p in partners],
+        "companies.companies_client_collaborator": shard_users if "b2b" in tables else [0] * workers,
+        "analytics.web_events": [2 * s + u if "web_events" in tables else 0 for s, u in zip(sessions, shard_users)],
+        "consumers.user_mev_score": [2 * u for u in shard_users] if "mev_scores" in tables else [0] * workers,
+    }
+    for table in FATOS_POR_RESERVA:
+        sizes[table] = facts
+    shard_ids = _reserve_ranges(cursor, sizes)
+    conn.commit()
+
+    common = {"database_url": database_url, "seed": seed, "batch_size": batch_size, "now": now, "tables": tables}
+    phase_1 = _run(_phase_1, [
+        dict(common, shard=i, ids=shard_ids[i], users=users[i], partners=partners[i],
+             rank_ids=master_data["rank_ids"])
+        for i in range(workers)
+    ], workers)
+
+    schedule_map = dict(existing_schedule_map or {})
+    shards = []  # (user_ids, active_ids) de cada shard
+    if existing_users is not None:
+        for chunk in _chunks(existing_users[0], shard_users):
+            shards.append((chunk, [u for u in chunk if u in existing_active]))
+    for user_ids, active_ids, shard_schedule_map in phase_1:
+        if existing_users is None:
+            shards.append((user_ids, active_ids))
+        schedule_map.update(shard_schedule_map)
+
+    client_ids = create_clients()
+
+    tasks, offset = [], 0
+    for i, (user_ids, active_ids) in enumerate(shards):
+        tasks.append(dict(common, shard=i, ids=shard_ids[i], user_ids=user_ids, active_ids=active_ids,
+                          offset=offset, client_ids=client_ids, schedule_map=schedule_map,
+                          calories_id=master_data.get("calories_id"), facts=facts[i], sessions=sessions[i]))
+        offset += len(user_ids)
+    _run(_phase_2, tasks, workers)
+
+    all_user_ids = [u for user_ids, _ in shards for u in user_ids]
+    active_user_ids = [u for _, active_ids in shards for u in active_ids]
+    print(f"[PARALELO] Concluído: {len(all_user_ids)} usuários, {len(schedule_map)} horários.")
+    return all_user_ids, active_user_ids, client_ids
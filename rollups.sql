@@ -0,0 +1,173 @@
+--
+-- SCRIPT SQL DO SCHEMA 'BI' (ROLLUPS DIÁRIOS)
+-- Agregados por dia (e por parceiro) lidos pelos endpoints /bi/dau, /bi/checkins,
+-- /bi/revenue e /bi/reservations. Populado pelo job backend/rollups.py.
+-- Bitmaps diários de usuários ativos (/bi/active_users, /bi/stickiness): backend/activity.py.
+-- Sketches HyperLogLog diários (modo approx=true): backend/hll.py.
+-- Perfil de atividade por usuário (/bi/user/*): backend/user_profile.py.
+-- Streaks de check-in (/bi/gamification/streaks, /bi/user/streak): backend/streaks.py.
+--
+
+CREATE SCHEMA IF NOT EXISTS bi;
+
+--------------------------------------------------------------------------------
+-- AGREGADOS DA PLATAFORMA (1 linha por dia)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.daily_platform_activity
+CREATE TABLE IF NOT EXISTS bi.daily_platform_activity (
+    day DATE PRIMARY KEY,
+    active_users INTEGER NOT NULL DEFAULT 0,             -- DAU: usuários distintos em consumers.user_time
+    checkins INTEGER NOT NULL DEFAULT 0,                 -- user_time com type = 'CHECKIN'
+    revenue_paid NUMERIC(14, 2) NOT NULL DEFAULT 0,      -- SUM(amount_due) de pagamentos PAID
+    transferred_value NUMERIC(14, 2) NOT NULL DEFAULT 0, -- SUM(transferred_value) de pagamentos PAID
+    payments_paid INTEGER NOT NULL DEFAULT 0,            -- Quantidade de pagamentos PAID
+    reservations INTEGER NOT NULL DEFAULT 0,             -- Reservas criadas (consumers.user_scheduling)
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+--------------------------------------------------------------------------------
+-- AGREGADOS POR PARCEIRO (1 linha por dia e parceiro)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.daily_partner_activity
+CREATE TABLE IF NOT EXISTS bi.daily_partner_activity (
+    day DATE NOT NULL,
+    partner_id INTEGER NOT NULL,
+    active_users INTEGER NOT NULL DEFAULT 0,
+    checkins INTEGER NOT NULL DEFAULT 0,
+    revenue_paid NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    transferred_value NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    payments_paid INTEGER NOT NULL DEFAULT 0,
+    reservations INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, partner_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_partner_activity_partner_day
+    ON bi.daily_partner_activity (partner_id, day);
+
+-- Tabela: bi.daily_reservation_status (Reservas por status, por dia e parceiro)
+CREATE TABLE IF NOT EXISTS bi.daily_reservation_status (
+    day DATE NOT NULL,
+    partner_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, partner_id, status)
+);
+
+--------------------------------------------------------------------------------
+-- BITMAPS DE USUÁRIOS ATIVOS (1 linha por dia, ver backend/activity.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.daily_active_bitmap (bit N = usuário de id N ativo no dia; np.packbits, bitorder little)
+CREATE TABLE IF NOT EXISTS bi.daily_active_bitmap (
+    day DATE PRIMARY KEY,
+    bitmap BYTEA NOT NULL,
+    active_users INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+--------------------------------------------------------------------------------
+-- SKETCHES HYPERLOGLOG (contagens distintas aproximadas, ver backend/hll.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.daily_hll (1 sketch por métrica, dimensão e dia; dimension_id 0 = plataforma)
+CREATE TABLE IF NOT EXISTS bi.daily_hll (
+    metric VARCHAR(50) NOT NULL,        -- users, partner_users, client_users, funnel_*
+    dimension_id INTEGER NOT NULL,      -- partner_id / client_id (0 = plataforma)
+    day DATE NOT NULL,
+    sketch BYTEA NOT NULL,
+    PRIMARY KEY (metric, dimension_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_hll_day ON bi.daily_hll (day);
+
+--------------------------------------------------------------------------------
+-- FUNIS MATERIALIZADOS (ver backend/funnel.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.funnel_daily (sessões por funil, dia de entrada e etapa; tempo desde a etapa anterior)
+CREATE TABLE IF NOT EXISTS bi.funnel_daily (
+    funnel VARCHAR(50) NOT NULL,
+    day DATE NOT NULL,                  -- dia em que a sessão entrou no funil (etapa 1)
+    step SMALLINT NOT NULL,             -- 0 = primeira etapa
+    event_name VARCHAR(50) NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    seconds_sum DOUBLE PRECISION NOT NULL DEFAULT 0,  -- soma do tempo desde a etapa anterior
+    seconds_histogram INTEGER[] NOT NULL,             -- sessões por faixa de tempo (funnel.TIME_BUCKETS)
+    PRIMARY KEY (funnel, day, step)
+);
+
+CREATE INDEX IF NOT EXISTS idx_funnel_daily_day ON bi.funnel_daily (day);
+
+--------------------------------------------------------------------------------
+-- SNAPSHOT DOS KPIs POR PARCEIRO (ver backend/partner_snapshot.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.partner_kpi_snapshot (1 linha por parceiro, lida pela chave primária)
+CREATE TABLE IF NOT EXISTS bi.partner_kpi_snapshot (
+    partner_id INTEGER PRIMARY KEY,
+    nps_avg NUMERIC(5, 2),                        -- NULL = sem avaliações
+    repasse_30d NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    revenue_30d NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    status_labels VARCHAR(50)[] NOT NULL,         -- status das reservas...
+    status_totals BIGINT[] NOT NULL,              -- ...e a contagem de cada um
+    hours INTEGER[] NOT NULL,                     -- horas com reservas...
+    hour_totals BIGINT[] NOT NULL,                -- ...e a contagem de cada uma
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+--------------------------------------------------------------------------------
+-- PERFIL DE ATIVIDADE POR USUÁRIO (ver backend/user_profile.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.user_daily_activity (1 linha por usuário e dia com atividade)
+CREATE TABLE IF NOT EXISTS bi.user_daily_activity (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    checkins INTEGER NOT NULL DEFAULT 0,                    -- user_time com type = 'CHECKIN'
+    active_minutes DOUBLE PRECISION NOT NULL DEFAULT 0,     -- check-ins FINISHED (finished_at - created_at)
+    calories NUMERIC(14, 2) NOT NULL DEFAULT 0,             -- health_point 'Calorias Queimadas'
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_daily_activity_day ON bi.user_daily_activity (day);
+
+-- Tabela: bi.user_profile (1 linha por usuário, lida pela chave primária; janela de 30 dias)
+CREATE TABLE IF NOT EXISTS bi.user_profile (
+    user_id INTEGER PRIMARY KEY,
+    stamps INTEGER NOT NULL DEFAULT 0,                      -- conquistas (user_health_stamp)
+    points INTEGER NOT NULL DEFAULT 0,                      -- pontos do rank atual
+    checkins_30d INTEGER NOT NULL DEFAULT 0,
+    active_minutes_30d DOUBLE PRECISION NOT NULL DEFAULT 0,
+    calories_30d NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    checkin_days DATE[] NOT NULL,                           -- dias com check-in...
+    checkin_counts INTEGER[] NOT NULL,                      -- ...e quantos em cada um
+    window_start DATE NOT NULL,
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+--------------------------------------------------------------------------------
+-- STREAKS DE CHECK-IN (ver backend/streaks.py)
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.user_streak (1 linha por usuário com check-in)
+CREATE TABLE IF NOT EXISTS bi.user_streak (
+    user_id INTEGER PRIMARY KEY,
+    last_day DATE NOT NULL,                 -- último dia com check-in
+    current_run INTEGER NOT NULL,           -- dias seguidos terminando em last_day
+    longest INTEGER NOT NULL,               -- maior sequência do usuário
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+--------------------------------------------------------------------------------
+-- CONTROLE DO REFRESH INCREMENTAL
+--------------------------------------------------------------------------------
+
+-- Tabela: bi.rollup_watermark (Último dia processado por cada rollup)
+CREATE TABLE IF NOT EXISTS bi.rollup_watermark (
+    name VARCHAR(100) PRIMARY KEY,
+    last_day DATE NOT NULL,
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);